@@ -1,19 +1,98 @@
 # backend_server.py
 # MODULE 5: Backend Server (FastAPI)
 # Receives handwriting data and images, saves with clean folder structure.
+#
+# Single process:  python backend_server.py
+# Multi-worker:    python backend_server.py --workers 4     (or WEB_CONCURRENCY=4)
+#                  uvicorn backend_server:app --host 0.0.0.0 --port 8000 --workers 4
+# Workers share handwriting_data safely: sample ids are unique per device (or worker) and ms,
+# files are written via per-process temp files + rename, the metadata store is SQLite (WAL)
+# and the shard store locks its files. Each worker runs its own ingest pipeline.
+# GET /metrics serves Prometheus metrics (Module 21) for the worker that answers the scrape.
 
 from fastapi import FastAPI, UploadFile, File, Form, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, FileResponse, Response, StreamingResponse
+from contextlib import asynccontextmanager
 import uvicorn
 import os
 import json
-from datetime import datetime
+import asyncio
+import time
+import socket
+import secrets
+import hashlib
+import io
+import tarfile
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from shard_store import ShardWriter
+from ingest_pipeline import IngestPipeline, QueueFull, ShuttingDown
+from stroke_codec import CONTENT_TYPE as HWS_CONTENT_TYPE, PayloadError, LineDecoder, decode_body, decode_sample, count_points
+from metadata_tracker import get_store
+from stroke_processing import normalize_time
+from fingerprint import FingerprintIndex, fingerprint_sample, fingerprint_decoded, backfill
+from metrics import REGISTRY, stage_timer, profile, LATENCY_BUCKETS, BYTES_BUCKETS, POINTS_BUCKETS
 
 DATA_ROOT = 'handwriting_data'
-META_FILE = os.path.join(DATA_ROOT, 'metadata.json')
+META_FILE = os.path.join(DATA_ROOT, 'metadata.sqlite')
+# Optional binary shard store (Module 14); set SHARD_ROOT to enable
+SHARD_ROOT = os.environ.get('SHARD_ROOT')
+SHARD_WRITER = ShardWriter(SHARD_ROOT) if SHARD_ROOT else None
+# Duplicate detection at ingest (Module 19); set DEDUPE=0 to disable. The index is opened in
+# lifespan and backfilled from DATA_ROOT in the background (FINGERPRINT_BACKFILL=0 to skip)
+DEDUPE = os.environ.get('DEDUPE', '1') != '0'
+FINGERPRINT_DB = os.path.join(DATA_ROOT, 'fingerprints.sqlite')
+FINGERPRINTS = None
+# Background post-processing (Modules 6 and 9); set to '' to disable
+RENDER_ROOT = os.environ.get('RENDER_ROOT', 'handwriting_renders')
+PROCESSED_ROOT = os.environ.get('PROCESSED_ROOT', 'handwriting_processed')
+# Legacy 2048px render by default; RENDER_SUPERSAMPLE=K opts into direct rendering (cairo_renderer)
+RENDER_SUPERSAMPLE = int(os.environ['RENDER_SUPERSAMPLE']) if os.environ.get('RENDER_SUPERSAMPLE') else None
 
-app = FastAPI()
+log = logging.getLogger('server')
+
+PIPELINE = IngestPipeline(
+    META_FILE,
+    shard_writer=SHARD_WRITER,
+    render_root=RENDER_ROOT or None,
+    processed_root=PROCESSED_ROOT or None,
+    render_kwargs={'supersample': RENDER_SUPERSAMPLE},
+    queue_size=int(os.environ.get('INGEST_QUEUE_SIZE', 256)),
+    workers=int(os.environ.get('INGEST_WORKERS', 4)),
+    # Jobs that still fail after retries are kept here for replay (outside DATA_ROOT, so exports skip them)
+    dead_letter_root=os.environ.get('INGEST_DEAD_LETTER', 'ingest_failed') or None,
+)
+
+
+def _backfill_fingerprints(index, stop):
+    with stage_timer('ingest.backfill'):
+        added = backfill(index, DATA_ROOT, stop=stop)
+    if added:
+        log.info('Fingerprint index: backfilled %d existing samples', added)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global FINGERPRINTS
+    loop = asyncio.get_running_loop()
+    stop, backfilling = threading.Event(), None
+    if DEDUPE:
+        FINGERPRINTS = FingerprintIndex(FINGERPRINT_DB)
+        if os.environ.get('FINGERPRINT_BACKFILL', '1') != '0':
+            backfilling = loop.run_in_executor(None, _backfill_fingerprints, FINGERPRINTS, stop)
+    await PIPELINE.start()
+    yield
+    # Graceful shutdown: finish every queued write before the process exits
+    await PIPELINE.drain()
+    if backfilling is not None:
+        stop.set()
+        await backfilling
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Enable CORS for all origins (for local tablet access)
 app.add_middleware(
@@ -29,47 +108,399 @@ os.makedirs(DATA_ROOT, exist_ok=True)
 
 @app.get('/health')
 def health():
-    return {'status': 'ok'}
+    return {'status': 'ok', 'queue_depth': PIPELINE.depth}
+
+def _enqueue(submit, *args):
+    try:
+        submit(*args)
+    except QueueFull:
+        REGISTRY.inc('hws_errors_total', kind='queue_full')
+        return JSONResponse(status_code=429, content={'error': 'ingest queue full, retry later'},
+                            headers={'Retry-After': '1'})
+    except ShuttingDown:
+        REGISTRY.inc('hws_errors_total', kind='shutting_down')
+        return JSONResponse(status_code=503, content={'error': 'server shutting down'})
+    return None
+
+# ---------- Metrics ----------
+
+REGISTRY.describe('hws_http_requests_total', 'counter', 'HTTP requests by method, route and status')
+REGISTRY.describe('hws_http_request_duration_seconds', 'histogram',
+                  'Request latency until the response starts (method, route)', LATENCY_BUCKETS)
+REGISTRY.describe('hws_payload_bytes', 'histogram', 'Upload body size as received (endpoint, encoding)', BYTES_BUCKETS)
+REGISTRY.describe('hws_sample_points', 'histogram', 'Points per uploaded sample', POINTS_BUCKETS)
+REGISTRY.describe('hws_samples_total', 'counter', 'Uploaded samples by endpoint and result (queued, duplicate)')
+REGISTRY.describe('hws_errors_total', 'counter', 'Rejected uploads by kind (bad_request, queue_full, shutting_down)')
+REGISTRY.describe('hws_ingest_queue_depth', 'gauge', 'Jobs waiting in the ingest queue')
+REGISTRY.describe('hws_ingest_queue_capacity', 'gauge', 'Ingest queue size limit')
+
+@app.middleware('http')
+async def track_requests(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Route templates (not raw paths) keep label cardinality bounded
+        route = request.scope.get('route')
+        path = route.path if route is not None else 'unmatched'
+        REGISTRY.observe('hws_http_request_duration_seconds', time.perf_counter() - start,
+                         method=request.method, route=path)
+        REGISTRY.inc('hws_http_requests_total', method=request.method, route=path, status=status)
+
+@app.get('/metrics')
+def metrics_endpoint(format: str = 'prometheus'):
+    # Prometheus text format; ?format=json returns the same counters as a JSON profile
+    REGISTRY.set('hws_ingest_queue_depth', PIPELINE.depth)
+    REGISTRY.set('hws_ingest_queue_capacity', PIPELINE.queue_size)
+    if format == 'json':
+        return profile()
+    return Response(REGISTRY.prometheus(), media_type='text/plain; version=0.0.4; charset=utf-8')
+
+# ---------- Sample IDs ----------
+
+CROCKFORD = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+HOST = socket.gethostname()
+
+def _timestamp_ms(timestamp):
+    try:
+        dt = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() * 1000)
+
+def sample_ulid(label, timestamp=None, device=None):
+    """
+    ULID-style sample id (26 Crockford base32 chars, sorts by time):
+    48-bit milliseconds | 16-bit device (or worker) hash | 64-bit discriminator.
+    With a client timestamp and device the id is derived from (label, device, timestamp), so
+    the JSON and PNG uploads of one sample, and any re-upload, land on the same files.
+    Otherwise this worker (host + pid) and random bits are used, with the client timestamp
+    (or server time) as the time part: two device-less tablets writing the same label in the
+    same millisecond must not share an id.
+    """
+    ms = _timestamp_ms(timestamp) if timestamp else None
+    if ms is None or not 0 <= ms < 1 << 48:
+        ms = time.time_ns() // 1_000_000
+    elif device:
+        node = hashlib.sha1(str(device).encode('utf-8')).digest()[:2]
+        tail = hashlib.sha1(f'{label}|{device}|{timestamp}'.encode('utf-8')).digest()[:8]
+        return _encode_ulid(ms, node + tail)
+    node = hashlib.sha1(f'{HOST}:{os.getpid()}'.encode('utf-8')).digest()[:2]
+    return _encode_ulid(ms, node + secrets.token_bytes(8))
+
+def _encode_ulid(ms, rest):
+    value = (ms << 80) | int.from_bytes(rest, 'big')
+    return ''.join(CROCKFORD[(value >> (5 * i)) & 31] for i in range(25, -1, -1))
+
+def _fingerprint_check(sample, meta, binary):
+    with stage_timer('ingest.dedupe'):
+        fp = fingerprint_decoded(sample) if binary else fingerprint_sample(sample)
+        if fp is None:
+            return None
+        return FINGERPRINTS.check_and_add(meta['sample_id'], fp)
+
+async def _check_duplicate(sample, meta, binary=False):
+    # Returns the sample_id this is an exact copy of, else None; near duplicates are
+    # accepted but tagged in their metadata. Re-sending the same sample_id is not a duplicate.
+    if FINGERPRINTS is None:
+        return None
+    match = await asyncio.get_running_loop().run_in_executor(None, _fingerprint_check, sample, meta, binary)
+    if match is None or match[1] == meta['sample_id']:
+        return None
+    if match[0] == 'exact':
+        return match[1]
+    meta['near_duplicate_of'] = match[1]
+    return None
+
+def _forget_fingerprint(sample_id):
+    if FINGERPRINTS is not None:
+        FINGERPRINTS.remove(sample_id)
+
+def _sample_entry(data, stroke_count, total_points):
+    label = data.get('label', 'unknown')
+    fname = sample_ulid(label, data.get('timestamp'), data.get('device'))
+    timestamp = data.get('timestamp', datetime.utcnow().isoformat())
+    folder = os.path.join(DATA_ROOT, label)
+    json_path = os.path.join(folder, f'{fname}.json')
+    meta = {
+        'sample_id': f'{label}/{fname}',
+        'label': label,
+        'timestamp': timestamp,
+        'device': data.get('device'),
+        'json_path': json_path,
+        'stroke_count': stroke_count,
+        'total_points': total_points,
+    }
+    return json_path, meta
 
 @app.post('/save_stroke_data')
 async def save_stroke_data(request: Request):
+    # Body: JSON, or HWS1 binary (Module 17) with Content-Type application/vnd.handwriting.strokes;
+    # either may be gzip / deflate compressed via Content-Encoding.
     try:
-        data = await request.json()
-        label = data.get('label', 'unknown')
-        timestamp = data.get('timestamp', datetime.utcnow().isoformat())
-        folder = os.path.join(DATA_ROOT, label)
-        os.makedirs(folder, exist_ok=True)
-        fname = timestamp.replace(':', '').replace('-', '').replace('T', '_').split('.')[0]
-        json_path = os.path.join(folder, f'{fname}.json')
-        with open(json_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        # Stub: metadata tracking (Module 7)
-        # Stub: image processing (Module 6)
-        return {'status': 'saved', 'json_path': json_path}
+        raw = await request.body()
+        encoding = request.headers.get('content-encoding')
+        REGISTRY.observe('hws_payload_bytes', len(raw), endpoint='save_stroke_data', encoding=encoding or 'identity')
+        with stage_timer('ingest.parse'):
+            body = decode_body(raw, encoding)
+            if request.headers.get('content-type', '').startswith(HWS_CONTENT_TYPE):
+                data = decode_sample(body)
+                strokes = data['strokes']
+                total_points = count_points(data)
+                submit = PIPELINE.submit_binary
+            else:
+                data = json.loads(body)
+                if not isinstance(data, dict) or not isinstance(data.get('strokes'), list):
+                    REGISTRY.inc('hws_errors_total', kind='bad_request')
+                    return JSONResponse(status_code=400, content={'error': 'expected a JSON object with a strokes list'})
+                normalize_time(data)  # stored t is milliseconds; HWS1 bodies are converted by decode_sample
+                strokes = data['strokes']
+                total_points = sum(len(s.get('points', [])) for s in strokes)
+                submit = PIPELINE.submit_json
+        REGISTRY.observe('hws_sample_points', total_points)
+        json_path, meta = _sample_entry(data, len(strokes), total_points)
+        duplicate_of = await _check_duplicate(data, meta, binary=submit == PIPELINE.submit_binary)
+        if duplicate_of is not None:
+            REGISTRY.inc('hws_samples_total', endpoint='save_stroke_data', result='duplicate')
+            return JSONResponse(status_code=200, content={'status': 'duplicate', 'duplicate_of': duplicate_of})
+        # Written, rendered and tracked by the ingest pipeline (Modules 6, 7, 9, 14)
+        rejected = _enqueue(submit, data, json_path, meta)
+        if rejected is not None:
+            _forget_fingerprint(meta['sample_id'])  # let the client's retry through
+            return rejected
+        REGISTRY.inc('hws_samples_total', endpoint='save_stroke_data', result='queued')
+        return JSONResponse(status_code=202, content={'status': 'queued', 'json_path': json_path})
     except Exception as e:
+        REGISTRY.inc('hws_errors_total', kind='bad_request')
         return JSONResponse(status_code=400, content={'error': str(e)})
 
+# Recently queued (device, timestamp) keys: covers re-uploads whose metadata row is not written yet
+RECENT_KEYS = OrderedDict()
+RECENT_KEYS_MAX = 100000
+
+def _remember(key):
+    RECENT_KEYS[key] = True
+    if len(RECENT_KEYS) > RECENT_KEYS_MAX:
+        RECENT_KEYS.popitem(last=False)
+
+async def _ingest_lines(lines, first):
+    # Parse one received chunk of NDJSON lines, dedupe them with one store lookup, queue the rest
+    results, pending = [], []
+    with stage_timer('ingest.parse_batch'):
+        for i, line in enumerate(lines, first):
+            try:
+                data = json.loads(line)
+                if not isinstance(data, dict) or not isinstance(data.get('strokes'), list):
+                    raise ValueError('expected a JSON object with a strokes list')
+                normalize_time(data)
+            except ValueError as e:
+                REGISTRY.inc('hws_errors_total', kind='bad_request')
+                results.append({'line': i, 'status': 'error', 'error': str(e)})
+                continue
+            # Without a device id the timestamp alone does not identify a sample
+            key = (data['device'], data['timestamp']) if data.get('device') and data.get('timestamp') else None
+            pending.append((i, data, key))
+    keys = [k for _, _, k in pending if k is not None and k not in RECENT_KEYS]
+    stored = set()
+    if keys:
+        stored = await asyncio.get_running_loop().run_in_executor(None, get_store(META_FILE).existing_keys, keys)
+    for i, data, key in pending:
+        if key is not None and (key in stored or key in RECENT_KEYS):
+            REGISTRY.inc('hws_samples_total', endpoint='save_stroke_batch', result='duplicate')
+            results.append({'line': i, 'status': 'duplicate'})
+            continue
+        strokes = data['strokes']
+        total_points = sum(len(s.get('points', [])) for s in strokes)
+        REGISTRY.observe('hws_sample_points', total_points)
+        json_path, meta = _sample_entry(data, len(strokes), total_points)
+        duplicate_of = await _check_duplicate(data, meta)
+        if duplicate_of is not None:
+            REGISTRY.inc('hws_samples_total', endpoint='save_stroke_batch', result='duplicate')
+            results.append({'line': i, 'status': 'duplicate', 'duplicate_of': duplicate_of})
+            continue
+        # Waits for queue space: a full queue slows the upload down instead of failing it
+        try:
+            await PIPELINE.submit_wait({'kind': 'json', 'path': json_path, 'data': data, 'meta': meta})
+        except ShuttingDown:
+            _forget_fingerprint(meta['sample_id'])
+            raise
+        if key is not None:
+            _remember(key)
+        REGISTRY.inc('hws_samples_total', endpoint='save_stroke_batch', result='queued')
+        results.append({'line': i, 'status': 'queued', 'json_path': json_path})
+    results.sort(key=lambda r: r['line'])
+    return results
+
+@app.post('/save_stroke_batch')
+async def save_stroke_batch(request: Request):
+    # Streamed NDJSON body, one sample per line, optionally gzip / deflate compressed.
+    # Lines are queued as they arrive; samples whose device + timestamp are already stored
+    # are reported as 'duplicate', so re-uploading a whole session is safe (device-less
+    # samples are only caught by the content fingerprint).
+    results = []
+    encoding = request.headers.get('content-encoding')
+    received = 0
+    try:
+        decoder = LineDecoder(encoding)
+        async for chunk in request.stream():
+            received += len(chunk)
+            lines = decoder.feed(chunk)
+            if lines:
+                results += await _ingest_lines(lines, len(results))
+        results += await _ingest_lines(decoder.close(), len(results))
+    except (PayloadError, ShuttingDown) as e:
+        # Samples before the failure stay queued; the client can re-send the rest
+        status = 503 if isinstance(e, ShuttingDown) else 400
+        REGISTRY.inc('hws_errors_total', kind='shutting_down' if status == 503 else 'bad_request')
+        return JSONResponse(status_code=status, content={'error': str(e) or 'server shutting down', 'results': results})
+    finally:
+        REGISTRY.observe('hws_payload_bytes', received, endpoint='save_stroke_batch', encoding=encoding or 'identity')
+    counts = {s: sum(r['status'] == s for r in results) for s in ('queued', 'duplicate', 'error')}
+    return {**counts, 'results': results}
+
 @app.post('/upload_png')
-async def upload_png(file: UploadFile = File(...), label: str = Form('unknown'), timestamp: str = Form(None)):
+async def upload_png(file: UploadFile = File(...), label: str = Form('unknown'), timestamp: str = Form(None),
+                     device: str = Form(None)):
     try:
         folder = os.path.join(DATA_ROOT, label)
-        os.makedirs(folder, exist_ok=True)
+        # Same label / timestamp / device as the JSON upload -> same id, so the two share a metadata row
+        fname = sample_ulid(label, timestamp, device)
         if not timestamp:
             timestamp = datetime.utcnow().isoformat()
-        fname = timestamp.replace(':', '').replace('-', '').replace('T', '_').split('.')[0]
         png_path = os.path.join(folder, f'{fname}.png')
-        with open(png_path, 'wb') as f:
-            content = await file.read()
-            f.write(content)
-        # Stub: metadata tracking (Module 7)
-        # Stub: image processing (Module 6)
-        return {'status': 'saved', 'png_path': png_path}
+        content = await file.read()
+        REGISTRY.observe('hws_payload_bytes', len(content), endpoint='upload_png', encoding='identity')
+        meta = {
+            'sample_id': f'{label}/{fname}',
+            'label': label,
+            'timestamp': timestamp,
+            'device': device,
+            'png_path': png_path,
+        }
+        rejected = _enqueue(PIPELINE.submit_png, content, png_path, meta)
+        if rejected is not None:
+            return rejected
+        return JSONResponse(status_code=202, content={'status': 'queued', 'png_path': png_path})
     except Exception as e:
+        REGISTRY.inc('hws_errors_total', kind='bad_request')
         return JSONResponse(status_code=400, content={'error': str(e)})
 
+# ---------- Read API ----------
+# Everything is looked up through the metadata store's indexes (Module 7); no directory walks.
+
+PAGE_LIMIT = 1000
+
+@app.get('/samples')
+def list_samples(label: str = None, device: str = None, since: str = None, until: str = None,
+                 min_strokes: int = None, max_strokes: int = None, min_points: int = None,
+                 max_points: int = None, limit: int = 100, cursor: int = None):
+    # Cursor pagination: pass back next_cursor until it is null
+    limit = max(1, min(limit, PAGE_LIMIT))
+    items = get_store(META_FILE).query(label=label, device=device, since=since, until=until,
+                                       min_strokes=min_strokes, max_strokes=max_strokes,
+                                       min_points=min_points, max_points=max_points,
+                                       limit=limit + 1, after_id=cursor)
+    next_cursor = items[limit - 1]['id'] if len(items) > limit else None
+    return {'items': items[:limit], 'next_cursor': next_cursor}
+
+def _file_etag(path):
+    st = os.stat(path)
+    return f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+
+def _cached_file(request, path, media_type):
+    # Serve a file with an mtime/size ETag; 304 when the client already has it
+    try:
+        etag = _file_etag(path)
+    except OSError:
+        return JSONResponse(status_code=404, content={'error': 'file not found'})
+    if etag in [t.strip() for t in request.headers.get('if-none-match', '').split(',')]:
+        return Response(status_code=304, headers={'ETag': etag})
+    return FileResponse(path, media_type=media_type, headers={'ETag': etag, 'Cache-Control': 'no-cache'})
+
+@app.get('/samples/{label}/{sample}')
+def get_sample(label: str, sample: str, request: Request):
+    entry = get_store(META_FILE).get(f'{label}/{sample}')
+    if entry is None or not entry.get('json_path'):
+        return JSONResponse(status_code=404, content={'error': 'sample not found'})
+    return _cached_file(request, entry['json_path'], 'application/json')
+
+@app.get('/samples/{label}/{sample}/png')
+def get_sample_png(label: str, sample: str, request: Request, kind: str = 'upload'):
+    # kind: 'upload' (tablet PNG), 'render' (Module 9 output) or 'processed' (Module 6 output)
+    entry = get_store(META_FILE).get(f'{label}/{sample}')
+    if entry is None:
+        return JSONResponse(status_code=404, content={'error': 'sample not found'})
+    roots = {'render': RENDER_ROOT, 'processed': PROCESSED_ROOT}
+    if kind == 'upload':
+        path = entry.get('png_path')
+    elif roots.get(kind):
+        path = os.path.join(roots[kind], label, f'{sample}.png')
+    else:
+        return JSONResponse(status_code=400, content={'error': f'unknown or disabled png kind: {kind}'})
+    if not path:
+        return JSONResponse(status_code=404, content={'error': 'no png for this sample'})
+    return _cached_file(request, path, 'image/png')
+
+def _iter_label(label, batch=500):
+    after_id = None
+    while True:
+        entries = get_store(META_FILE).query(label=label, limit=batch, after_id=after_id)
+        if not entries:
+            return
+        yield from entries
+        after_id = entries[-1]['id']
+
+def _ndjson_stream(label):
+    for entry in _iter_label(label):
+        if not entry.get('json_path'):
+            continue
+        try:
+            with open(entry['json_path'], 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        data['sample_id'] = entry['sample_id']
+        yield json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n'
+
+def _tar_stream(label):
+    # tarfile in stream mode writes into buf; hand each file's bytes out as soon as they exist
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode='w|') as tar:
+        for entry in _iter_label(label):
+            for key in ('json_path', 'png_path'):
+                path = entry.get(key)
+                if not path or not os.path.exists(path):
+                    continue
+                tar.add(path, arcname=os.path.join(label, os.path.basename(path)))
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+    yield buf.getvalue()
+
+@app.get('/labels/{label}/archive')
+def label_archive(label: str, fmt: str = 'ndjson'):
+    # Streams every sample of a label; sync generators run in the threadpool, off the event loop
+    if fmt == 'ndjson':
+        return StreamingResponse(_ndjson_stream(label), media_type='application/x-ndjson')
+    if fmt == 'tar':
+        return StreamingResponse(_tar_stream(label), media_type='application/x-tar',
+                                 headers={'Content-Disposition': f'attachment; filename="{label}.tar"'})
+    return JSONResponse(status_code=400, content={'error': "fmt must be 'ndjson' or 'tar'"})
+
 @app.get("/")
 def root():
     return {"message": "Handwriting Data Collector Backend is running."}
 
 if __name__ == '__main__':
-    uvicorn.run(app, host='0.0.0.0', port=8000) 
\ No newline at end of file
+    import sys
+    workers = int(sys.argv[sys.argv.index('--workers') + 1]) if '--workers' in sys.argv else int(os.environ.get('WEB_CONCURRENCY', 1))
+    if workers > 1:
+        # Multiple processes need the app as an import string
+        uvicorn.run('backend_server:app', host='0.0.0.0', port=8000, workers=workers)
+    else:
+        uvicorn.run(app, host='0.0.0.0', port=8000) 
\ No newline at end of file
@@ -0,0 +1,111 @@
+# bench_geometry.py
+# Micro-benchmark: dict-per-point geometry (original) vs array geometry in cairo_renderer.
+# Usage: python benchmarks/bench_geometry.py [sample.json ...]
+
+import os
+import sys
+import json
+import timeit
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import cairo_renderer as cr
+
+DEFAULT_SAMPLES = [
+    os.path.join(ROOT, 'handwriting_data', '+', '20250712_155124.json'),
+    os.path.join(ROOT, 'handwriting_data', 'Kashika', '20250707_054526.json'),
+]
+
+# ---------- Original dict implementations (reference) ----------
+
+def legacy_densify(points, num_points=60):
+    if len(points) < 2:
+        return points
+    xs = [p['x'] for p in points]
+    ys = [p['y'] for p in points]
+    ts = np.linspace(0, 1, len(points))
+    interp_t = np.linspace(0, 1, num_points)
+    interp_x = np.interp(interp_t, ts, xs)
+    interp_y = np.interp(interp_t, ts, ys)
+    return [{'x': x, 'y': y, **{k: v for k, v in points[0].items() if k not in ['x', 'y']}} for x, y in zip(interp_x, interp_y)]
+
+def legacy_catmull_rom_to_bezier(points):
+    if len(points) < 2:
+        return []
+    extended = [
+        {'x': 2 * points[0]['x'] - points[1]['x'], 'y': 2 * points[0]['y'] - points[1]['y'], **{k: v for k, v in points[0].items() if k not in ['x', 'y']}}
+    ] + points + [
+        {'x': 2 * points[-1]['x'] - points[-2]['x'], 'y': 2 * points[-1]['y'] - points[-2]['y'], **{k: v for k, v in points[-1].items() if k not in ['x', 'y']}}
+    ]
+    beziers = []
+    for i in range(1, len(extended) - 2):
+        p0, p1, p2, p3 = extended[i - 1], extended[i], extended[i + 1], extended[i + 2]
+        c1 = (p1['x'] + (p2['x'] - p0['x']) / 6, p1['y'] + (p2['y'] - p0['y']) / 6)
+        c2 = (p2['x'] - (p3['x'] - p1['x']) / 6, p2['y'] - (p3['y'] - p1['y']) / 6)
+        beziers.append((p1, c1, c2, p2))
+    return beziers
+
+def legacy_scale_points(points, width, height, padding=0.1):
+    xs = [p['x'] for p in points]
+    ys = [p['y'] for p in points]
+    min_x, max_x = min(xs), max(xs)
+    min_y, max_y = min(ys), max(ys)
+    scale = min(
+        (width * (1 - 2 * padding)) / (max_x - min_x + 1e-5),
+        (height * (1 - 2 * padding)) / (max_y - min_y + 1e-5)
+    )
+    offset_x = width * padding - min_x * scale
+    offset_y = height * padding - min_y * scale
+    return [
+        {'x': p['x'] * scale + offset_x, 'y': p['y'] * scale + offset_y, **{k: v for k, v in p.items() if k not in ['x', 'y']}}
+        for p in points
+    ]
+
+# ---------- Pipelines ----------
+
+def legacy_pipeline(strokes, num_points):
+    out = []
+    for pts in strokes:
+        pts = legacy_scale_points(legacy_densify(pts, num_points), cr.WIDTH, cr.HEIGHT)
+        out.append([(c1[0], c1[1], c2[0], c2[1], p2['x'], p2['y']) for _, c1, c2, p2 in legacy_catmull_rom_to_bezier(pts)])
+    return out
+
+def array_pipeline(arrays, num_points):
+    out = []
+    for arr in arrays:
+        arr = cr.scale_array(cr.densify_array(arr, num_points), cr.WIDTH, cr.HEIGHT)
+        out.append(cr.catmull_rom_to_bezier_array(arr)[:, 1:].reshape(-1, 6))
+    return out
+
+
+def bench(path, num_points, repeat=5):
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    strokes = [s['points'] for s in data['strokes'] if len(s['points']) >= 2]
+    arrays = [cr.points_to_array(pts) for pts in strokes]
+    ref = legacy_pipeline(strokes, num_points)
+    new = array_pipeline(arrays, num_points)
+    assert all(np.allclose(np.array(a), b) for a, b in zip(ref, new)), 'array pipeline mismatch'
+    n = max(1, int(200 / max(1, len(strokes))))
+    t_legacy = min(timeit.repeat(lambda: legacy_pipeline(strokes, num_points), number=n, repeat=repeat)) / n
+    t_array = min(timeit.repeat(lambda: array_pipeline(arrays, num_points), number=n, repeat=repeat)) / n
+    return {
+        'sample': os.path.relpath(path, ROOT),
+        'strokes': len(strokes),
+        'points': sum(len(s) for s in strokes),
+        'num_points': num_points,
+        'legacy_ms': t_legacy * 1e3,
+        'array_ms': t_array * 1e3,
+        'speedup': t_legacy / t_array,
+    }
+
+
+if __name__ == '__main__':
+    paths = sys.argv[1:] or DEFAULT_SAMPLES
+    for path in paths:
+        for num_points in (60, 1000):
+            r = bench(path, num_points)
+            print(f"{r['sample']:45s} strokes={r['strokes']:3d} pts={r['points']:4d} densify={r['num_points']:5d} "
+                  f"legacy={r['legacy_ms']:.3f}ms array={r['array_ms']:.3f}ms speedup={r['speedup']:.1f}x")
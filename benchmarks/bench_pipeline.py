@@ -0,0 +1,215 @@
+# bench_pipeline.py
+# Per-stage throughput, latency and peak-RSS benchmarks over a synthetic dataset
+# (synthetic.py) of any size. Every stage runs in a fresh spawned process so its peak
+# RSS is its own; per-item stages report latency percentiles, dataset-wide stages
+# (analyze_dataset, process_batch, export_data) report wall time and throughput.
+# Stages that need a missing optional dependency (pycairo, h5py) are reported as skipped.
+# Usage: python benchmarks/bench_pipeline.py [--n 10000] [--seed 0] [--max-items 2000]
+#            [--stages a,b,...] [--workers 0] [--work-dir DIR] [--out results.json]
+#        python benchmarks/results.py baseline.json results.json     (regression check)
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing as mp
+from glob import glob
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+from results import timed, peak_rss_mb, write_results
+import synthetic
+
+RASTER_BATCH = 256
+
+# ---------- Stages ----------
+# Each stage takes the run context and returns a result row (see results.py).
+
+def _inputs(ctx, ext='.json'):
+    paths = sorted(glob(os.path.join(ctx['data_dir'], '*', '*' + ext)))
+    return paths[:ctx['max_items']]
+
+
+def _load(paths):
+    out = []
+    for p in paths:
+        with open(p, 'r', encoding='utf-8') as f:
+            out.append(json.load(f))
+    return out
+
+
+def stage_append_metadata(ctx):
+    from metadata_tracker import append_metadata
+    db = os.path.join(ctx['work_dir'], 'metadata.sqlite')
+    paths = _inputs(ctx)
+    entries = []
+    for p, data in zip(paths, _load(paths)):
+        entries.append({
+            'sample_id': os.path.relpath(p, ctx['data_dir'])[:-5], 'label': data['label'],
+            'timestamp': data['timestamp'], 'device': data['device'], 'json_path': p,
+            'stroke_count': len(data['strokes']), 'total_points': sum(len(s['points']) for s in data['strokes']),
+        })
+    return timed(lambda e: append_metadata(db, e), entries)
+
+
+def stage_render_strokes_to_png(ctx):
+    from cairo_renderer import render_strokes_to_png
+    out = os.path.join(ctx['work_dir'], 'render')
+    os.makedirs(out, exist_ok=True)
+    return timed(lambda p: render_strokes_to_png(p, os.path.join(out, os.path.basename(p)[:-5] + '.png')),
+                 _inputs(ctx))
+
+
+def stage_process_image(ctx):
+    from image_processing import process_image
+    out = os.path.join(ctx['work_dir'], 'processed')
+    os.makedirs(out, exist_ok=True)
+    return timed(lambda p: process_image(p, save_path=os.path.join(out, os.path.basename(p))), _inputs(ctx, '.png'))
+
+
+def stage_process_batch(ctx):
+    from image_processing import process_batch
+    paths = _inputs(ctx, '.png')
+    return _whole(lambda: process_batch(paths, workers=ctx['workers']), len(paths))
+
+
+def stage_analyze_joins(ctx):
+    from joint_analysis import analyze_joins
+    return timed(analyze_joins, _inputs(ctx))
+
+
+def stage_analyze_dataset(ctx):
+    from joint_analysis import analyze_dataset
+    return _whole(lambda: analyze_dataset(ctx['data_dir'], workers=ctx['workers']), ctx['n'])
+
+
+def stage_export_data(ctx):
+    from data_exporter import export_data
+    out = os.path.join(ctx['work_dir'], 'export')
+    return _whole(lambda: export_data(ctx['data_dir'], out, fmt='shards'), ctx['n'])
+
+
+def stage_stroke_codec(ctx):
+    from stroke_codec import encode_sample, decode_sample
+    return timed(lambda d: decode_sample(encode_sample(d)), _load(_inputs(ctx)))
+
+
+def stage_fingerprint(ctx):
+    from fingerprint import fingerprint_sample
+    return timed(fingerprint_sample, _load(_inputs(ctx)))
+
+
+def stage_rasterize_batch(ctx):
+    from numpy_rasterizer import rasterize_batch, strokes_from_sample
+    samples = [strokes_from_sample(d) for d in _load(_inputs(ctx))]
+    batches = [samples[i:i + RASTER_BATCH] for i in range(0, len(samples), RASTER_BATCH)]
+    rng = np.random.default_rng(ctx['seed'])
+    row = timed(lambda b: rasterize_batch(b, size=64, augment_params={}, rng=rng), batches)
+    # Latency is per batch of RASTER_BATCH; throughput is per sample
+    row['throughput'] = len(samples) / row['seconds'] if row['seconds'] > 0 else 0.0
+    row['items'] = len(samples)
+    row['batch_size'] = RASTER_BATCH
+    return row
+
+
+def _whole(fn, items):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    return {'items': items, 'seconds': elapsed, 'throughput': items / elapsed if elapsed > 0 else 0.0,
+            'latency_ms': {}}
+
+
+STAGES = {
+    'append_metadata': stage_append_metadata,
+    'render_strokes_to_png': stage_render_strokes_to_png,
+    'process_image': stage_process_image,
+    'process_batch': stage_process_batch,
+    'analyze_joins': stage_analyze_joins,
+    'analyze_dataset': stage_analyze_dataset,
+    'export_data': stage_export_data,
+    'stroke_codec': stage_stroke_codec,
+    'fingerprint': stage_fingerprint,
+    'rasterize_batch': stage_rasterize_batch,
+}
+
+# ---------- Runner ----------
+
+def _run_stage(name, ctx):
+    rss_before = peak_rss_mb()
+    try:
+        row = STAGES[name](ctx)
+    except ImportError as e:
+        return {'name': name, 'status': 'skipped', 'reason': str(e)}
+    except Exception:
+        return {'name': name, 'status': 'error', 'reason': traceback.format_exc(limit=3)}
+    return {'name': name, 'status': 'ok', **row, 'peak_rss_mb': peak_rss_mb(), 'rss_before_mb': rss_before}
+
+
+def run(n=10000, seed=0, max_items=2000, stages=None, workers=0, work_dir=None):
+    """
+    Generate (or reuse) a synthetic dataset and benchmark each stage in its own process.
+    Args:
+        max_items: Cap for per-item stages; dataset-wide stages always use all n samples
+        work_dir: Keep the dataset here between runs (same n and seed are reused); default: temp dir
+    Returns:
+        (params, results)
+    """
+    keep = work_dir is not None
+    work_dir = work_dir or tempfile.mkdtemp(prefix='hws_bench_')
+    data_dir = os.path.join(work_dir, f'data_{n}_{seed}')
+    results = []
+    if not os.path.isdir(data_dir):
+        start = time.perf_counter()
+        synthetic.write_dataset(data_dir, n, seed=seed, png=True, workers=workers or None)
+        elapsed = time.perf_counter() - start
+        results.append({'name': 'generate', 'status': 'ok', 'items': n, 'seconds': elapsed,
+                        'throughput': n / elapsed if elapsed > 0 else 0.0, 'latency_ms': {}})
+    ctx = {'data_dir': data_dir, 'n': n, 'seed': seed, 'max_items': max_items, 'workers': workers}
+    spawn = mp.get_context('spawn')
+    try:
+        for name in stages or STAGES:
+            stage_dir = os.path.join(work_dir, 'stage_' + name)
+            shutil.rmtree(stage_dir, ignore_errors=True)
+            os.makedirs(stage_dir)
+            with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as ex:
+                row = ex.submit(_run_stage, name, dict(ctx, work_dir=stage_dir)).result()
+            shutil.rmtree(stage_dir, ignore_errors=True)
+            results.append(row)
+            _print_row(row)
+    finally:
+        if not keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    params = {'n': n, 'seed': seed, 'max_items': max_items, 'workers': workers}
+    return params, results
+
+
+def _print_row(r):
+    if r['status'] != 'ok':
+        print(f"{r['name']:24s} {r['status']}: {r['reason'].strip().splitlines()[-1]}", file=sys.stderr)
+        return
+    lat = r['latency_ms']
+    lat_text = f"p50={lat['p50']:8.2f}ms p95={lat['p95']:8.2f}ms p99={lat['p99']:8.2f}ms" if lat else ' ' * 44
+    print(f"{r['name']:24s} {r['items']:8d} items {r['throughput']:10.1f}/s {lat_text} "
+          f"peak_rss={r['peak_rss_mb']:7.1f}MB", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    opt = lambda flag, default, cast=int: cast(args[args.index(flag) + 1]) if flag in args else default
+    stages = opt('--stages', None, lambda s: s.split(','))
+    unknown = set(stages or []) - set(STAGES)
+    if unknown:
+        print(f"Unknown stages {sorted(unknown)}; available: {', '.join(STAGES)}")
+        sys.exit(2)
+    params, results = run(n=opt('--n', 10000), seed=opt('--seed', 0), max_items=opt('--max-items', 2000),
+                          stages=stages, workers=opt('--workers', 0), work_dir=opt('--work-dir', None, str))
+    write_results(opt('--out', None, str), 'pipeline', params, results)
+    sys.exit(1 if any(r['status'] == 'error' for r in results) else 0)
@@ -0,0 +1,72 @@
+# bench_render.py
+# Legacy 2048px supersample vs direct target-resolution rendering in cairo_renderer.
+# Reports per-sample time, surface memory and pixel difference against the legacy output.
+# Usage: python benchmarks/bench_render.py [--max-mean-diff 2.0] [sample.json ...]
+
+import os
+import sys
+import json
+import time
+from glob import glob
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import cairo_renderer as cr
+
+# Stated bound: mean absolute difference per channel (0-255) vs the legacy output
+MAX_MEAN_DIFF = 2.0
+
+
+def _time(fn, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, out
+
+
+def bench(paths, sizes=cr.OUTPUT_SIZES, factors=(1, 2, cr.DEFAULT_SUPERSAMPLE, 4)):
+    samples = []
+    for p in paths:
+        with open(p, 'r', encoding='utf-8') as f:
+            samples.append(json.load(f))
+    rows = []
+    for size in sizes:
+        t_legacy, refs = _time(lambda: [cr.render_sample_array(d, output_size=size) for d in samples])
+        for k in sorted(set(factors)):
+            t_direct, outs = _time(lambda: [cr.render_sample_array(d, output_size=size, supersample=k) for d in samples])
+            diffs = [np.abs(a.astype(np.int16) - b.astype(np.int16)) for a, b in zip(refs, outs)]
+            rows.append({
+                'size': size,
+                'supersample': k,
+                'legacy_ms': 1e3 * t_legacy / len(samples),
+                'direct_ms': 1e3 * t_direct / len(samples),
+                'legacy_surface_bytes': cr.WIDTH * cr.HEIGHT * 4,
+                'direct_surface_bytes': (size * k) ** 2 * 4,
+                'mean_diff': float(np.mean([d.mean() for d in diffs])),
+                'max_diff': int(max(d.max() for d in diffs)),
+            })
+    return rows
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    bound = MAX_MEAN_DIFF
+    if '--max-mean-diff' in args:
+        idx = args.index('--max-mean-diff')
+        bound = float(args[idx + 1])
+        del args[idx:idx + 2]
+    paths = args or sorted(glob(os.path.join(ROOT, 'handwriting_data', '*', '*.json')))
+    rows = bench(paths)
+    failed = False
+    for r in rows:
+        ok = r['mean_diff'] <= bound
+        failed |= not ok
+        print(f"size={r['size']:3d} k={r['supersample']} legacy={r['legacy_ms']:7.2f}ms direct={r['direct_ms']:6.2f}ms "
+              f"speedup={r['legacy_ms'] / r['direct_ms']:5.1f}x mem={r['legacy_surface_bytes'] / r['direct_surface_bytes']:6.1f}x less "
+              f"mean_diff={r['mean_diff']:.2f} max_diff={r['max_diff']:3d} {'ok' if ok else 'OVER BOUND'}")
+    print(json.dumps(rows))
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,185 @@
+# bench_server.py
+# In-process load test of the FastAPI app (backend_server.py) with concurrent clients:
+# httpx.AsyncClient over ASGITransport, so no sockets or separate server process. Runs in a
+# temp working directory with its own handwriting_data, using synthetic.py samples.
+#
+# Scenarios (each uploads distinct samples):
+#   post_json         POST /save_stroke_data, JSON body
+#   post_binary_gzip  POST /save_stroke_data, HWS1 binary (Module 17), gzip
+#   post_batch        POST /save_stroke_batch, NDJSON with --batch-size samples per request
+#   read              GET /samples pages and GET /samples/{label}/{sample}
+# Uploads report request latency (until the 202), and ingest_seconds: time until every
+# accepted sample has its metadata row, i.e. the end-to-end write rate of the pipeline.
+# 429 responses are retried after a short pause, as the UI does, and counted.
+# Usage: python benchmarks/bench_server.py [--n 2000] [--concurrency 16] [--batch-size 100]
+#            [--seed 0] [--scenarios a,b,...] [--render] [--out results.json]
+
+import os
+import sys
+import json
+import gzip
+import time
+import asyncio
+import tempfile
+import shutil
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import httpx
+from results import latency_summary, peak_rss_mb, write_results
+from synthetic import generate_samples
+
+SCENARIOS = ['post_json', 'post_binary_gzip', 'post_batch', 'read']
+RETRY_DELAY = 0.05
+
+
+async def _drive(client, requests, concurrency):
+    """
+    Send (method, url, kwargs, samples) requests from `concurrency` client tasks.
+    Returns:
+        Result row with request latencies, status counts, retries and the number of
+        samples the server accepted for ingest.
+    """
+    queue = asyncio.Queue()
+    for r in requests:
+        queue.put_nowait(r)
+    latencies, statuses = [], {}
+    counters = {'retries': 0, 'samples': 0, 'accepted': 0}
+
+    async def worker():
+        while not queue.empty():
+            method, url, kwargs, samples = queue.get_nowait()
+            t0 = time.perf_counter()
+            while True:
+                resp = await client.request(method, url, **kwargs)
+                if resp.status_code != 429:
+                    break
+                counters['retries'] += 1
+                await asyncio.sleep(RETRY_DELAY)
+            latencies.append(time.perf_counter() - t0)
+            statuses[resp.status_code] = statuses.get(resp.status_code, 0) + 1
+            counters['samples'] += samples
+            if resp.status_code == 202:
+                counters['accepted'] += samples
+            elif method == 'POST' and resp.status_code == 200:
+                counters['accepted'] += resp.json().get('queued', 0)  # batch upload summary
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        'items': len(latencies),
+        'seconds': elapsed,
+        'throughput': len(latencies) / elapsed if elapsed > 0 else 0.0,
+        'samples_per_sec': counters['samples'] / elapsed if elapsed > 0 else 0.0,
+        'latency_ms': latency_summary(latencies),
+        'statuses': {str(k): v for k, v in sorted(statuses.items())},
+        'retries': counters['retries'],
+        'accepted': counters['accepted'],
+    }
+
+
+async def _wait_ingested(store, expected, timeout=600):
+    # Metadata rows are the pipeline's last write per sample
+    start = time.perf_counter()
+    while store.count() < expected and time.perf_counter() - start < timeout:
+        await asyncio.sleep(0.02)
+    return time.perf_counter() - start
+
+
+def _upload_requests(scenario, samples, batch_size):
+    from stroke_codec import encode_sample, CONTENT_TYPE
+    if scenario == 'post_json':
+        return [('POST', '/save_stroke_data', {'content': json.dumps(s).encode('utf-8'),
+                                                'headers': {'Content-Type': 'application/json'}}, 1)
+                for s in samples]
+    if scenario == 'post_binary_gzip':
+        return [('POST', '/save_stroke_data', {'content': gzip.compress(encode_sample(s)),
+                                                'headers': {'Content-Type': CONTENT_TYPE, 'Content-Encoding': 'gzip'}}, 1)
+                for s in samples]
+    requests = []
+    for i in range(0, len(samples), batch_size):
+        chunk = samples[i:i + batch_size]
+        body = ''.join(json.dumps(s) + '\n' for s in chunk).encode('utf-8')
+        requests.append(('POST', '/save_stroke_batch', {'content': body,
+                                                         'headers': {'Content-Type': 'application/x-ndjson'}}, len(chunk)))
+    return requests
+
+
+async def _run(backend, scenarios, n, concurrency, batch_size, seed):
+    from metadata_tracker import get_store
+    store = get_store(backend.META_FILE)
+    results = []
+    transport = httpx.ASGITransport(app=backend.app)
+    async with backend.lifespan(backend.app):
+        async with httpx.AsyncClient(transport=transport, base_url='http://bench', timeout=None) as client:
+            offset = 0
+            for scenario in scenarios:
+                if scenario == 'read':
+                    entries = store.query(limit=n)
+                    requests = [('GET', '/samples', {'params': {'limit': 100}}, 0)] * max(1, n // 10)
+                    requests += [('GET', f"/samples/{e['sample_id']}", {}, 1) for e in entries]
+                    row = await _drive(client, requests, concurrency)
+                else:
+                    samples = list(generate_samples(n, seed, start=offset))
+                    offset += n
+                    before = store.count()
+                    row = await _drive(client, _upload_requests(scenario, samples, batch_size), concurrency)
+                    total = row['seconds'] + await _wait_ingested(store, before + row['accepted'])
+                    row.update({'ingested': store.count() - before, 'ingest_seconds': total,
+                                'ingest_samples_per_sec': (store.count() - before) / total if total > 0 else 0.0})
+                row.update({'name': f'server_{scenario}', 'status': 'ok', 'peak_rss_mb': peak_rss_mb()})
+                results.append(row)
+                _print_row(row)
+    return results
+
+
+def _print_row(r):
+    lat = r['latency_ms']
+    extra = f" ingest={r['ingest_samples_per_sec']:8.1f} samples/s" if 'ingest_samples_per_sec' in r else ''
+    print(f"{r['name']:24s} {r['items']:7d} req {r['throughput']:8.1f} req/s p50={lat.get('p50', 0):7.2f}ms "
+          f"p95={lat.get('p95', 0):7.2f}ms p99={lat.get('p99', 0):7.2f}ms{extra} statuses={r['statuses']} "
+          f"retries={r['retries']} peak_rss={r['peak_rss_mb']:.1f}MB", file=sys.stderr)
+
+
+def run(n=2000, concurrency=16, batch_size=100, seed=0, scenarios=None, render=False):
+    """
+    Load-test the app in a temp working directory (its handwriting_data is discarded).
+    Args:
+        render: Keep the background render / standardize stages on (needs pycairo)
+    Returns:
+        (params, results)
+    """
+    work_dir = tempfile.mkdtemp(prefix='hws_server_bench_')
+    cwd = os.getcwd()
+    if not render:
+        os.environ['RENDER_ROOT'] = ''
+        os.environ['PROCESSED_ROOT'] = ''
+    try:
+        # backend_server resolves handwriting_data relative to the working directory at import
+        os.chdir(work_dir)
+        import backend_server
+        results = asyncio.run(_run(backend_server, scenarios or SCENARIOS, n, concurrency, batch_size, seed))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(work_dir, ignore_errors=True)
+    params = {'n': n, 'concurrency': concurrency, 'batch_size': batch_size, 'seed': seed, 'render': render,
+              'ingest_workers': int(os.environ.get('INGEST_WORKERS', 4)),
+              'queue_size': int(os.environ.get('INGEST_QUEUE_SIZE', 256))}
+    return params, results
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    opt = lambda flag, default, cast=int: cast(args[args.index(flag) + 1]) if flag in args else default
+    scenarios = opt('--scenarios', None, lambda s: s.split(','))
+    unknown = set(scenarios or []) - set(SCENARIOS)
+    if unknown:
+        print(f"Unknown scenarios {sorted(unknown)}; available: {', '.join(SCENARIOS)}")
+        sys.exit(2)
+    params, results = run(n=opt('--n', 2000), concurrency=opt('--concurrency', 16),
+                          batch_size=opt('--batch-size', 100), seed=opt('--seed', 0),
+                          scenarios=scenarios, render='--render' in args)
+    write_results(opt('--out', None, str), 'server', params, results)
@@ -0,0 +1,134 @@
+# results.py
+# Shared measurement helpers and the machine-readable result format of bench_pipeline.py
+# and bench_server.py, plus a comparison of two result files for regression checks.
+# Usage: python benchmarks/results.py <baseline.json> <current.json> [--threshold 0.15]
+#
+# Result file: {"suite", "created", "env": {git commit, python, numpy, platform, cpus},
+#               "params": {...}, "results": [{"name", "items", "seconds", "throughput",
+#               "latency_ms": {"mean", "p50", "p95", "p99", "max"}, "peak_rss_mb", ...}]}
+
+import os
+import sys
+import json
+import time
+import platform
+import resource
+import subprocess
+from datetime import datetime, timezone
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Relative change that counts as a regression (throughput down / latency or memory up)
+THRESHOLD = 0.15
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far (MB)."""
+    kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return kb / 1024 if sys.platform != 'darwin' else kb / 1024 ** 2  # bytes on macOS
+
+
+def latency_summary(seconds):
+    """Per-item latencies (seconds) -> {'mean', 'p50', 'p95', 'p99', 'max'} in milliseconds."""
+    if len(seconds) == 0:
+        return {}
+    ms = np.asarray(seconds, dtype=np.float64) * 1e3
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {'mean': float(ms.mean()), 'p50': float(p50), 'p95': float(p95), 'p99': float(p99), 'max': float(ms.max())}
+
+
+def timed(fn, items):
+    """
+    Call fn(item) for every item, timing each call.
+    Returns:
+        Result row: items, seconds (wall), throughput (items/s) and latency_ms.
+    """
+    latencies = []
+    start = time.perf_counter()
+    for item in items:
+        t0 = time.perf_counter()
+        fn(item)
+        latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - start
+    return {
+        'items': len(latencies),
+        'seconds': elapsed,
+        'throughput': len(latencies) / elapsed if elapsed > 0 else 0.0,
+        'latency_ms': latency_summary(latencies),
+    }
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True,
+                                timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'git_commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def write_results(path, suite, params, results):
+    """Write a result file (see the header); path None or '-' prints it instead."""
+    doc = {
+        'suite': suite,
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'env': environment(),
+        'params': params,
+        'results': results,
+    }
+    text = json.dumps(doc, indent=2)
+    if path in (None, '-'):
+        print(text)
+    else:
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    return doc
+
+
+def compare(baseline, current, threshold=THRESHOLD):
+    """
+    Compare two result documents row by row (matched on name).
+    Returns:
+        List of {'name', 'metric', 'baseline', 'current', 'change', 'regression'} for
+        throughput, p95 latency and peak RSS.
+    """
+    base = {r['name']: r for r in baseline['results']}
+    rows = []
+    for r in current['results']:
+        b = base.get(r['name'])
+        if b is None or r.get('status', 'ok') != 'ok' or b.get('status', 'ok') != 'ok':
+            continue
+        metrics = [('throughput', b.get('throughput'), r.get('throughput'), -1),
+                   ('latency_p95_ms', b.get('latency_ms', {}).get('p95'), r.get('latency_ms', {}).get('p95'), 1),
+                   ('peak_rss_mb', b.get('peak_rss_mb'), r.get('peak_rss_mb'), 1)]
+        for metric, old, new, worse in metrics:
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            rows.append({'name': r['name'], 'metric': metric, 'baseline': old, 'current': new,
+                         'change': change, 'regression': change * worse > threshold})
+    return rows
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    if len(args) < 2:
+        print('Usage: python benchmarks/results.py <baseline.json> <current.json> [--threshold 0.15]')
+        sys.exit(2)
+    threshold = float(args[args.index('--threshold') + 1]) if '--threshold' in args else THRESHOLD
+    with open(args[0], 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    with open(args[1], 'r', encoding='utf-8') as f:
+        current = json.load(f)
+    rows = compare(baseline, current, threshold)
+    for r in rows:
+        print(f"{r['name']:32s} {r['metric']:15s} {r['baseline']:12.2f} -> {r['current']:12.2f} "
+              f"{r['change']:+7.1%} {'REGRESSION' if r['regression'] else ''}")
+    sys.exit(1 if any(r['regression'] for r in rows) else 0)
@@ -0,0 +1,206 @@
+# synthetic.py
+# Seeded synthetic handwriting samples in the stroke_recorder.js getSample() schema, with
+# size distributions fitted to handwriting_data (strokes per sample, points per stroke,
+# sampling interval, step length, ink extent, pointer types). Point times t are
+# performance.now() milliseconds (time_unit 'ms', like the recorder). Sample i of a seed is always
+# the same, whatever the dataset size, so 10k and 1M runs share their first 10k samples.
+# Usage: python benchmarks/synthetic.py <out_dir> [--n 10000] [--seed 0] [--png] [--workers N]
+#        python benchmarks/synthetic.py --describe <data_dir>     (size distribution summary)
+
+import os
+import sys
+import json
+import string
+from datetime import datetime, timedelta, timezone
+from glob import glob
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+LABELS = list(string.ascii_uppercase)
+DEVICES = [f'bench-device-{i}' for i in range(8)]
+BASE_TIME = datetime(2025, 7, 1, tzinfo=timezone.utc)
+
+# Fitted to handwriting_data: points per stroke p25/p50/p75 = 16/24/46, max 160;
+# step p50 2.9 px; sampling interval p50 11 ms; single-stroke samples dominate but
+# word / sentence samples reach 15 strokes.
+POINTS_MEDIAN = 24
+POINTS_SIGMA = 0.8
+POINTS_RANGE = (3, 400)
+STROKE_COUNTS = ([1, 2, 3, 4, 8, 15], [0.6, 0.15, 0.1, 0.05, 0.06, 0.04])
+STEP_MEDIAN = 2.9
+STEP_SIGMA = 0.75
+STEP_MAX = 40.0
+INTERVAL_MS = 11.0
+POINTER_TYPES = (['pen', 'mouse', 'touch'], [0.6, 0.3, 0.1])
+
+
+def _stroke_xy(rng, n, start):
+    """Smooth random walk: heading drifts with correlated curvature, lognormal step lengths."""
+    heading = rng.uniform(0, 2 * np.pi) + np.cumsum(np.cumsum(rng.normal(0, 0.04, n)) + rng.normal(0, 0.15, n))
+    step = np.minimum(STEP_MEDIAN * np.exp(rng.normal(0, STEP_SIGMA, n)), STEP_MAX)
+    step[0] = 0.0
+    xy = start + np.cumsum(np.stack([np.cos(heading), np.sin(heading)], axis=1) * step[:, None], axis=0)
+    # Canvas coordinates are float32 in the browser
+    return xy.astype(np.float32).astype(np.float64)
+
+
+def _curvature(xy):
+    # Same 3-point circle fit as stroke_recorder.js _estimateCurvature
+    a = np.hypot(*(xy[1:-1] - xy[:-2]).T)
+    b = np.hypot(*(xy[2:] - xy[1:-1]).T)
+    c = np.hypot(*(xy[2:] - xy[:-2]).T)
+    s = (a + b + c) / 2
+    area = np.sqrt(np.maximum(s * (s - a) * (s - b) * (s - c), 0))
+    denom = a * b * c
+    return np.where((denom > 0) & (area > 0), 4 * area / np.where(denom > 0, denom, 1), 0.0)
+
+
+def generate_sample(index, seed=0, labels=LABELS):
+    """
+    Synthetic sample number `index` of a seed (deterministic).
+    Returns:
+        Sample dict with label, device, timestamp, sampling_rate, time_unit and strokes, as sent
+        by the UI (t in ms, velocity in px/s).
+    """
+    rng = np.random.default_rng([seed, index])
+    label = labels[int(rng.integers(len(labels)))]
+    pointer = str(rng.choice(POINTER_TYPES[0], p=POINTER_TYPES[1]))
+    n_strokes = int(rng.choice(STROKE_COUNTS[0], p=STROKE_COUNTS[1]))
+    t = rng.uniform(5000.0, 600000.0)  # performance.now() ms at the first point
+    pos = rng.uniform([60, 60], [400, 300])
+    strokes, intervals = [], []
+    for sid in range(1, n_strokes + 1):
+        n = int(np.clip(round(POINTS_MEDIAN * np.exp(rng.normal(0, POINTS_SIGMA))), *POINTS_RANGE))
+        xy = _stroke_xy(rng, n, pos)
+        dt = rng.gamma(16.0, INTERVAL_MS / 16.0, n)  # ms
+        dt[0] = 0.0
+        ts = t + np.cumsum(dt)
+        intervals.append(dt[1:])
+        d = np.diff(xy, axis=0)
+        velocity = np.hypot(*d.T) / np.maximum(dt[1:], 1e-9) * 1000
+        curvature = _curvature(xy)
+        if pointer == 'pen':
+            p = np.clip(rng.normal(0.45, 0.05) + rng.normal(0, 0.03, n), 0.01, 1.0)
+            tilt = np.round(rng.normal(0, 20, 2) + rng.normal(0, 1.5, (n, 2)))
+            azimuth = np.mod(np.arctan2(tilt[:, 1], tilt[:, 0]), 2 * np.pi)
+            altitude = np.pi / 2 - np.radians(np.minimum(np.hypot(*tilt.T), 89))
+        else:
+            p = np.full(n, 0.5 if pointer == 'mouse' else 0.0)
+            tilt = np.zeros((n, 2))
+            azimuth = np.zeros(n)
+            altitude = np.full(n, np.pi / 2)
+        points = []
+        for i in range(n):
+            points.append({
+                'x': float(xy[i, 0]), 'y': float(xy[i, 1]), 't': float(ts[i]), 'p': float(p[i]),
+                'tiltX': int(tilt[i, 0]), 'tiltY': int(tilt[i, 1]),
+                'azimuth': float(azimuth[i]), 'altitude': float(altitude[i]), 'pointerType': pointer,
+                'dx': float(d[i - 1, 0]) if i else None, 'dy': float(d[i - 1, 1]) if i else None,
+                'velocity': float(velocity[i - 1]) if i else None,
+                'curvature': float(curvature[i - 2]) if 1 < i < n - 1 else None,
+                'pen_down': True,
+            })
+        strokes.append({'stroke_id': sid, 'points': points})
+        # Next stroke: after a pen-up pause, near the previous one (words advance to the right)
+        t = ts[-1] + rng.uniform(100.0, 600.0)
+        pos = xy[-1] + rng.normal([25 if n_strokes > 4 else 0, 0], 25)
+    intervals = np.concatenate(intervals)
+    timestamp = BASE_TIME + timedelta(seconds=int(index) * 7, milliseconds=int(rng.integers(1000)))
+    return {
+        'label': label,
+        'device': DEVICES[index % len(DEVICES)],
+        'timestamp': timestamp.isoformat(timespec='milliseconds').replace('+00:00', 'Z'),
+        'sampling_rate': f'{1000 / intervals.mean():.2f}' if len(intervals) else None,
+        'time_unit': 'ms',
+        'strokes': strokes,
+    }
+
+
+def generate_samples(n, seed=0, start=0, labels=LABELS):
+    """Iterate samples start .. start + n - 1 of a seed."""
+    for i in range(start, start + n):
+        yield generate_sample(i, seed, labels)
+
+
+def _write_chunk(job):
+    out_dir, start, n, seed, png, png_size, labels = job
+    if png:
+        from PIL import Image
+        from numpy_rasterizer import rasterize_batch, strokes_from_sample
+    paths = []
+    for i, data in enumerate(generate_samples(n, seed, start, labels), start):
+        folder = os.path.join(out_dir, data['label'])
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f'{i:08d}.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        if png:
+            img = rasterize_batch([strokes_from_sample(data)], size=png_size, width=4.0)[0]
+            Image.fromarray(img).save(path[:-5] + '.png')
+        paths.append(path)
+    return paths
+
+
+def write_dataset(out_dir, n, seed=0, png=False, png_size=512, labels=LABELS, workers=None, chunk_size=1000):
+    """
+    Write n samples as out_dir/<label>/<index>.json (indent=2, like the ingest pipeline),
+    plus a <index>.png upload rendered with numpy_rasterizer when png is set.
+    Args:
+        workers: Process count (None = CPU count, 0 = run in this process)
+    Returns:
+        List of JSON paths in sample order.
+    """
+    jobs = [(out_dir, s, min(chunk_size, n - s), seed, png, png_size, labels) for s in range(0, n, chunk_size)]
+    if workers == 0 or len(jobs) <= 1:
+        results = list(map(_write_chunk, jobs))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            results = list(ex.map(_write_chunk, jobs))
+    return [p for chunk in results for p in chunk]
+
+
+def describe(json_paths):
+    """Size distribution summary (percentiles) of a set of sample files; intervals in ms."""
+    strokes, points, steps, intervals, sizes = [], [], [], [], []
+    for path in json_paths:
+        sizes.append(os.path.getsize(path))
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        strokes.append(len(data.get('strokes', [])))
+        for s in data.get('strokes', []):
+            pts = s.get('points', [])
+            points.append(len(pts))
+            if len(pts) > 1:
+                xy = np.array([[pt['x'], pt['y']] for pt in pts])
+                t = np.array([pt.get('t') or 0.0 for pt in pts])
+                steps.extend(np.hypot(*np.diff(xy, axis=0).T))
+                intervals.extend(np.diff(t))
+    q = [5, 25, 50, 75, 95, 100]
+    summary = lambda v: [round(float(x), 4) for x in np.percentile(v, q)] if len(v) else []
+    return {
+        'samples': len(json_paths),
+        'percentiles': q,
+        'strokes_per_sample': summary(strokes),
+        'points_per_stroke': summary(points),
+        'step_px': summary(steps),
+        'interval_ms': summary(intervals),
+        'file_bytes': summary(sizes),
+    }
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    if len(args) >= 2 and args[0] == '--describe':
+        print(json.dumps(describe(sorted(glob(os.path.join(args[1], '*', '*.json')))), indent=2))
+    elif not args:
+        print('Usage: python benchmarks/synthetic.py <out_dir> [--n 10000] [--seed 0] [--png] [--workers N]')
+        print('       python benchmarks/synthetic.py --describe <data_dir>')
+    else:
+        n = int(args[args.index('--n') + 1]) if '--n' in args else 10000
+        seed = int(args[args.index('--seed') + 1]) if '--seed' in args else 0
+        workers = int(args[args.index('--workers') + 1]) if '--workers' in args else None
+        paths = write_dataset(args[0], n, seed=seed, png='--png' in args, workers=workers)
+        print(f'Wrote {len(paths)} samples to {args[0]}')
@@ -8,283 +8,551 @@
 import cairo
 import math
 import json
+import os
+import time
+import hashlib
+import logging
+import multiprocessing
+from glob import glob
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 from PIL import Image, ImageFilter
+from stroke_processing import interp_column, process_stroke
+from metrics import stage_timer, pool_map
 
 WIDTH, HEIGHT = 2048, 2048
 OUTPUT_WIDTH, OUTPUT_HEIGHT = 256, 256
+RENDER_VERSION = 2  # bump when rendering code changes output
+MANIFEST_NAME = '.render_manifest.json'
+
+log = logging.getLogger('render')
+
+# ---------- Array Geometry ----------
+# A stroke is an (N, k) float64 array whose columns follow STROKE_FIELDS.
+# Missing values (null / absent keys) become NaN.
+
+STROKE_FIELDS = ('x', 'y', 't', 'p', 'tiltX', 'tiltY')
+X, Y, T, P, TILT_X, TILT_Y = range(len(STROKE_FIELDS))
+
+
+def points_to_array(points, fields=STROKE_FIELDS):
+    rows = [[pt.get(f) for f in fields] for pt in points]
+    return np.array(rows, dtype=np.float64).reshape(len(points), len(fields))
+
+
+def densify_array(arr, num_points=60, channels=(X, Y)):
+    """
+    Resample `channels` to num_points by point index, skipping nulls; other columns repeat the
+    first point (legacy render geometry; see stroke_processing for arc-length resampling).
+    """
+    if len(arr) < 2:
+        return arr
+    ts = np.linspace(0, 1, len(arr))
+    interp_t = np.linspace(0, 1, num_points)
+    out = np.repeat(arr[:1], num_points, axis=0)
+    for c in channels:
+        out[:, c] = interp_column(interp_t, ts, arr[:, c])
+    return out
+
+
+def scale_transform(arr, width, height, padding=0.1):
+    """Return (scale, offset_x, offset_y) fitting the stroke's bbox into width x height."""
+    min_x, min_y = arr[:, X].min(), arr[:, Y].min()
+    max_x, max_y = arr[:, X].max(), arr[:, Y].max()
+    scale = min(
+        (width * (1 - 2 * padding)) / (max_x - min_x + 1e-5),
+        (height * (1 - 2 * padding)) / (max_y - min_y + 1e-5)
+    )
+    return scale, width * padding - min_x * scale, height * padding - min_y * scale
+
+
+def scale_array(arr, width, height, padding=0.1):
+    scale, offset_x, offset_y = scale_transform(arr, width, height, padding)
+    out = arr.copy()
+    out[:, X] = arr[:, X] * scale + offset_x
+    out[:, Y] = arr[:, Y] * scale + offset_y
+    return out
+
+
+def catmull_rom_to_bezier_array(arr):
+    """
+    Convert a Catmull-Rom spline through arr[:, :2] into cubic Bezier segments.
+    Returns:
+        (N-1, 4, 2) array of [start, control1, control2, end] per segment.
+    """
+    n = len(arr)
+    if n < 2:
+        return np.empty((0, 4, 2))
+    xy = arr[:, :2]
+    ext = np.empty((n + 2, 2))
+    ext[1:-1] = xy
+    ext[0] = 2 * xy[0] - xy[1]
+    ext[-1] = 2 * xy[-1] - xy[-2]
+    p0, p1, p2, p3 = ext[:-3], ext[1:-2], ext[2:-1], ext[3:]
+    beziers = np.empty((n - 1, 4, 2))
+    beziers[:, 0] = p1
+    beziers[:, 1] = p1 + (p2 - p0) / 6
+    beziers[:, 2] = p2 - (p3 - p1) / 6
+    beziers[:, 3] = p2
+    return beziers
+
+
+def stroke_pressure(arr):
+    """Per-point pressure with missing/zero values treated as 1 (mouse input)."""
+    p = np.nan_to_num(arr[:, P], nan=1.0)
+    p[p == 0] = 1.0
+    return p
+
+
+def trace_beziers(ctx, beziers):
+    """Append a move_to + curve_to path for (M, 4, 2) Bezier segments to a Cairo context."""
+    ctx.move_to(*beziers[0, 0].tolist())
+    for c1x, c1y, c2x, c2y, x, y in beziers[:, 1:].reshape(-1, 6).tolist():
+        ctx.curve_to(c1x, c1y, c2x, c2y, x, y)
+
+
+
+# ---------- Variable-Width Outlines ----------
+
+def sample_beziers(beziers, steps=4):
+    """Evaluate (M, 4, 2) Bezier segments at `steps` points each; returns (M * steps + 1, 2)."""
+    t = np.linspace(0, 1, steps, endpoint=False)
+    mt = 1 - t
+    basis = np.stack([mt ** 3, 3 * mt * mt * t, 3 * mt * t * t, t ** 3], axis=1)  # (steps, 4)
+    pts = np.einsum('sk,mkd->msd', basis, beziers).reshape(-1, 2)
+    return np.vstack([pts, beziers[-1, 3]])
+
+
+def stroke_widths(arr, base_width=6, taper=True, tilt_gain=0.0):
+    """
+    Per-point ink width from pressure, with optional end taper and tilt broadening.
+    tilt_gain widens the line by up to that fraction at 90 degrees of pen tilt.
+    """
+    widths = base_width * stroke_pressure(arr)
+    if tilt_gain:
+        tilt = np.hypot(np.nan_to_num(arr[:, TILT_X]), np.nan_to_num(arr[:, TILT_Y]))
+        widths = widths * (1 + tilt_gain * np.clip(tilt, 0, 90) / 90)
+    if taper:
+        n = len(arr)
+        i = np.arange(n)
+        ramp = max(1.0, 0.2 * n)
+        widths = widths * np.clip(np.minimum(i, n - 1 - i) / ramp, 0.2, 1)
+    return np.maximum(widths, 1)
+
+
+def stroke_outline(xy, widths, cap_steps=8):
+    """
+    Closed outline polygon of a polyline with per-point widths and round caps.
+    Returns:
+        (K, 2) polygon vertices.
+    """
+    half = widths[:, None] / 2
+    tangent = np.gradient(xy, axis=0)
+    norm = np.hypot(tangent[:, 0], tangent[:, 1])[:, None]
+    tangent = np.where(norm > 1e-9, tangent / np.maximum(norm, 1e-9), [1.0, 0.0])
+    normal = np.stack([-tangent[:, 1], tangent[:, 0]], axis=1)
+    left = xy + normal * half
+    right = xy - normal * half
+
+    def cap(center, r, start_angle):
+        a = start_angle - np.linspace(0, np.pi, cap_steps + 2)[1:-1]
+        return center + r * np.stack([np.cos(a), np.sin(a)], axis=1)
+
+    a_end = np.arctan2(normal[-1, 1], normal[-1, 0])
+    a_start = np.arctan2(normal[0, 1], normal[0, 0]) + np.pi
+    return np.vstack([
+        left,
+        cap(xy[-1], half[-1], a_end),
+        right[::-1],
+        cap(xy[0], half[0], a_start),
+    ])
+
+
+def sharp_joints(xy, min_turn=np.pi / 6):
+    """Indices of interior vertices where the polyline turns by more than min_turn radians."""
+    if len(xy) < 3:
+        return np.empty(0, dtype=np.int64)
+    d = np.diff(xy, axis=0)
+    ang = np.arctan2(d[:, 1], d[:, 0])
+    turn = np.abs((np.diff(ang) + np.pi) % (2 * np.pi) - np.pi)
+    return np.nonzero(turn > min_turn)[0] + 1
+
+
+def fill_outline(ctx, polygon, joints=None, joint_radii=None):
+    """
+    Fill a stroke outline with one Cairo fill. Round joints at sharp turns are added
+    as circles wound in the same direction as the polygon so WINDING fills their union.
+    """
+    ctx.new_path()
+    pts = polygon.tolist()
+    ctx.move_to(*pts[0])
+    for x, y in pts[1:]:
+        ctx.line_to(x, y)
+    ctx.close_path()
+    if joints is not None and len(joints):
+        x, y = polygon[:, 0], polygon[:, 1]
+        ccw = np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1)) > 0
+        arc = ctx.arc if ccw else ctx.arc_negative
+        end = 2 * np.pi if ccw else -2 * np.pi
+        for (cx, cy), r in zip(joints.tolist(), joint_radii.tolist()):
+            ctx.new_sub_path()
+            arc(cx, cy, r, 0, end)
+    ctx.set_fill_rule(cairo.FILL_RULE_WINDING)
+    ctx.fill()
 
 # ---------- Helper Functions ----------
+# Dict-based API kept for existing callers; the math runs on arrays above.
 
 def densify(points, num_points=60):
     if len(points) < 2:
         return points
-    xs = [p['x'] for p in points]
-    ys = [p['y'] for p in points]
-    ts = np.linspace(0, 1, len(points))
-    interp_t = np.linspace(0, 1, num_points)
-    interp_x = np.interp(interp_t, ts, xs)
-    interp_y = np.interp(interp_t, ts, ys)
-    return [{'x': x, 'y': y, **{k: v for k, v in points[0].items() if k not in ['x', 'y']}} for x, y in zip(interp_x, interp_y)]
+    xy = densify_array(points_to_array(points, ('x', 'y')), num_points)
+    rest = {k: v for k, v in points[0].items() if k not in ['x', 'y']}
+    return [{'x': x, 'y': y, **rest} for x, y in xy.tolist()]
 
 def catmull_rom_to_bezier(points):
     if len(points) < 2:
         return []
-    extended = [
-        {'x': 2 * points[0]['x'] - points[1]['x'], 'y': 2 * points[0]['y'] - points[1]['y'], **{k: v for k, v in points[0].items() if k not in ['x', 'y']}}
-    ] + points + [
-        {'x': 2 * points[-1]['x'] - points[-2]['x'], 'y': 2 * points[-1]['y'] - points[-2]['y'], **{k: v for k, v in points[-1].items() if k not in ['x', 'y']}}
-    ]
-    beziers = []
-    for i in range(1, len(extended) - 2):
-        p0 = extended[i - 1]
-        p1 = extended[i]
-        p2 = extended[i + 1]
-        p3 = extended[i + 2]
-        c1 = (
-            p1['x'] + (p2['x'] - p0['x']) / 6,
-            p1['y'] + (p2['y'] - p0['y']) / 6
-        )
-        c2 = (
-            p2['x'] - (p3['x'] - p1['x']) / 6,
-            p2['y'] - (p3['y'] - p1['y']) / 6
-        )
-        beziers.append((p1, c1, c2, p2))
-    return beziers
+    beziers = catmull_rom_to_bezier_array(points_to_array(points, ('x', 'y'))).tolist()
+    return [(points[i], tuple(c1), tuple(c2), points[i + 1]) for i, (_, c1, c2, _) in enumerate(beziers)]
 
 def scale_points(points, width, height, padding=0.1):
-    xs = [p['x'] for p in points]
-    ys = [p['y'] for p in points]
-    min_x, max_x = min(xs), max(xs)
-    min_y, max_y = min(ys), max(ys)
-    scale = min(
-        (width * (1 - 2 * padding)) / (max_x - min_x + 1e-5),
-        (height * (1 - 2 * padding)) / (max_y - min_y + 1e-5)
-    )
-    offset_x = width * padding - min_x * scale
-    offset_y = height * padding - min_y * scale
+    scale, offset_x, offset_y = scale_transform(points_to_array(points, ('x', 'y')), width, height, padding)
     return [
-        {'x': p['x'] * scale + offset_x, 'y': p['y'] * scale + offset_y, **{k: v for k, v in p.items() if k not in ['x', 'y']}}
+        {**p, 'x': p['x'] * scale + offset_x, 'y': p['y'] * scale + offset_y}
         for p in points
     ]
 
 # ---------- Main Rendering ----------
+# Two raster modes:
+#   supersample=None -> legacy: draw at WIDTH x HEIGHT, LANCZOS resize, light blur
+#   supersample=k    -> direct: draw at (output_size * k)^2 with Cairo antialiasing,
+#                       then box-average k x k blocks down to output_size
+# Direct mode with k <= 4 allocates <= 1/4 of the legacy surface at 256px and far less
+# at 28/64/128px. Its speed and pixel difference against legacy are measured by
+# benchmarks/bench_render.py (bound: MAX_MEAN_DIFF) and checked by test_cairo_renderer.py;
+# until those numbers are recorded it stays opt-in (legacy is the default everywhere).
 
-def render_strokes_to_png(json_path, png_path, base_width=6, ink_color=(0, 0, 0), bg_color=(1, 1, 1), svg_path=None):
-    with open(json_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+OUTPUT_SIZES = (28, 64, 128, 256)
+DEFAULT_SUPERSAMPLE = 2
 
-    surface = cairo.ImageSurface(cairo.FORMAT_RGB24, WIDTH, HEIGHT)
+
+def _new_context(surface, bg_color):
     ctx = cairo.Context(surface)
     ctx.set_source_rgb(*bg_color)
     ctx.paint()
     ctx.set_line_cap(cairo.LINE_CAP_ROUND)
     ctx.set_line_join(cairo.LINE_JOIN_ROUND)
-
-    for stroke in data['strokes']:
-        if len(stroke['points']) < 2:
-            continue
-        points = scale_points(densify(stroke['points']), WIDTH, HEIGHT)
-
-        ctx.new_path()
-        ctx.move_to(points[0]['x'], points[0]['y'])
-
-        beziers = catmull_rom_to_bezier(points)
-
-        for i, (p1, c1, c2, p2) in enumerate(beziers):
-            ctx.curve_to(c1[0], c1[1], c2[0], c2[1], p2['x'], p2['y'])
-
-        # Use average stroke width
-        pressures = [p.get('p', 1) or 1 for p in points]
-        avg_pressure = sum(pressures) / len(pressures)
-        ctx.set_source_rgb(*ink_color)
-        ctx.set_line_width(max(1, base_width * avg_pressure))
-        ctx.stroke()
-
-    # Downsample with blur
-    buf = surface.get_data()
-    arr = np.ndarray(shape=(HEIGHT, WIDTH, 4), dtype=np.uint8, buffer=buf)
-    rgb_arr = arr[:, :, :3]
-    pil_img = Image.fromarray(rgb_arr, 'RGB')
-    pil_img = pil_img.resize((OUTPUT_WIDTH, OUTPUT_HEIGHT), resample=Image.LANCZOS)
-    pil_img = pil_img.filter(ImageFilter.GaussianBlur(radius=0.3))  # Smooth jagged lines
-    pil_img.save(png_path)
-
-    # Optional SVG render
-    if svg_path:
-        svg_surface = cairo.SVGSurface(svg_path, WIDTH, HEIGHT)
-        svg_ctx = cairo.Context(svg_surface)
-        svg_ctx.set_source_rgb(*bg_color)
-        svg_ctx.paint()
-        svg_ctx.set_line_cap(cairo.LINE_CAP_ROUND)
-        svg_ctx.set_line_join(cairo.LINE_JOIN_ROUND)
+    return ctx
+
+
+class StrokePath:
+    """
+    Stroke geometry computed once (densify or resample -> scale -> Bezier) in WIDTH x HEIGHT
+    reference space, replayable onto any number of Cairo targets at any size.
+    """
+
+    def __init__(self, segments, outlines=()):
+        self.segments = segments  # list of ((M, 4, 2) beziers, line width)
+        self.outlines = list(outlines)  # list of (polygon, joint centers, joint radii)
+
+    @classmethod
+    def from_sample(cls, data, base_width=6, variable_width=False, tilt_gain=0.0, taper=True,
+                    spacing=None, tolerance=None):
+        """
+        Args:
+            variable_width: Build filled outlines from per-point pressure (and tilt)
+                instead of one averaged line width per stroke
+            spacing / tolerance: Arc-length resample and / or RDP-simplify each stroke
+                (stroke_processing, in input pixels) instead of the fixed 60-point densify.
+                These interpolate every column, so pressure and tilt follow the stroke; the
+                default densify keeps the legacy per-stroke values (first point's pressure
+                for the averaged width)
+        """
+        segments, outlines = [], []
         for stroke in data['strokes']:
             if len(stroke['points']) < 2:
                 continue
-            points = scale_points(densify(stroke['points']), WIDTH, HEIGHT)
-            svg_ctx.move_to(points[0]['x'], points[0]['y'])
-            beziers = catmull_rom_to_bezier(points)
-            for i, (p1, c1, c2, p2) in enumerate(beziers):
-                svg_ctx.curve_to(c1[0], c1[1], c2[0], c2[1], p2['x'], p2['y'])
-            pressures = [p.get('p', 1) or 1 for p in points]
-            avg_pressure = sum(pressures) / len(pressures)
-            svg_ctx.set_source_rgb(*ink_color)
-            svg_ctx.set_line_width(max(1, base_width * avg_pressure))
-            svg_ctx.stroke()
-        svg_surface.finish()
-
-# ---------- CLI Stub ----------
-
-if __name__ == '__main__':
-    import sys
-    if len(sys.argv) < 3:
-        print('Usage: python cairo_renderer.py <input.json> <output.png> [--svg output.svg]')
-    else:
-        svg_path = None
-        if '--svg' in sys.argv:
-            idx = sys.argv.index('--svg')
-            svg_path = sys.argv[idx + 1]
-        render_strokes_to_png(sys.argv[1], sys.argv[2], svg_path=svg_path)
-
-
-
-
-
-
-
-
-
-
-
-"""import cairo
-import math
-import json
-import numpy as np
-from PIL import Image
+            arr = points_to_array(stroke['points'])
+            if spacing or tolerance:
+                arr = process_stroke(arr, spacing, tolerance)
+                if len(arr) < 2:
+                    continue
+            elif variable_width:
+                arr = densify_array(arr, channels=(X, Y, P, TILT_X, TILT_Y))
+            else:
+                arr = densify_array(arr)
+            if not variable_width:
+                points = scale_array(arr, WIDTH, HEIGHT)
+                # Use average stroke width
+                avg_pressure = stroke_pressure(points).mean()
+                segments.append((catmull_rom_to_bezier_array(points), max(1, base_width * avg_pressure)))
+                continue
+            points = scale_array(arr, WIDTH, HEIGHT)
+            steps = 4
+            xy = sample_beziers(catmull_rom_to_bezier_array(points), steps)
+            w = stroke_widths(points, base_width, taper=taper, tilt_gain=tilt_gain)
+            w = np.interp(np.arange(len(xy)) / steps, np.arange(len(w)), w)
+            joints = sharp_joints(xy)
+            outlines.append((stroke_outline(xy, w), xy[joints], w[joints] / 2))
+        return cls(segments, outlines)
+
+    def draw(self, ctx, size, ink_color=(0, 0, 0)):
+        """Draw every stroke onto ctx, scaled so the reference canvas maps to size x size."""
+        ctx.save()
+        ctx.scale(size / WIDTH, size / HEIGHT)
+        ctx.set_source_rgb(*ink_color)
+        for beziers, line_width in self.segments:
+            ctx.new_path()
+            trace_beziers(ctx, beziers)
+            ctx.set_line_width(line_width)  # user space, so it scales with the canvas
+            ctx.stroke()
+        for polygon, joints, radii in self.outlines:
+            fill_outline(ctx, polygon, joints, radii)
+        ctx.restore()
 
-WIDTH, HEIGHT = 2048, 2048
-OUTPUT_WIDTH, OUTPUT_HEIGHT = 256, 256
 
-# Helper: Catmull-Rom to Bezier
-def catmull_rom_to_bezier(points):
-    # Improved: add phantom points at start/end for smoothness
-    if len(points) < 2:
-        return []
-    extended = [
-        {'x': 2*points[0]['x'] - points[1]['x'], 'y': 2*points[0]['y'] - points[1]['y'], **{k: v for k, v in points[0].items() if k not in ['x', 'y']}}
-    ] + points + [
-        {'x': 2*points[-1]['x'] - points[-2]['x'], 'y': 2*points[-1]['y'] - points[-2]['y'], **{k: v for k, v in points[-1].items() if k not in ['x', 'y']}}
-    ]
-    beziers = []
-    for i in range(1, len(extended) - 2):
-        p0 = extended[i - 1]
-        p1 = extended[i]
-        p2 = extended[i + 1]
-        p3 = extended[i + 2]
-        c1 = (
-            p1['x'] + (p2['x'] - p0['x']) / 6,
-            p1['y'] + (p2['y'] - p0['y']) / 6
-        )
-        c2 = (
-            p2['x'] - (p3['x'] - p1['x']) / 6,
-            p2['y'] - (p3['y'] - p1['y']) / 6
-        )
-        beziers.append((p1, c1, c2, p2))
-    return beziers
+def _surface_rgb(surface, width, height):
+    # RGB24 is stored as native-endian 32-bit XRGB, i.e. B, G, R, X bytes on little-endian
+    surface.flush()
+    stride = surface.get_stride()
+    arr = np.ndarray(shape=(height, stride // 4, 4), dtype=np.uint8, buffer=surface.get_data())
+    return arr[:, :width, 2::-1]
 
-def scale_points(points, width, height, padding=0.1):
-    xs = [p['x'] for p in points]
-    ys = [p['y'] for p in points]
-    min_x, max_x = min(xs), max(xs)
-    min_y, max_y = min(ys), max(ys)
-    # Avoid division by zero
-    scale = min(
-        (width * (1 - 2 * padding)) / (max_x - min_x + 1e-5),
-        (height * (1 - 2 * padding)) / (max_y - min_y + 1e-5)
-    )
-    offset_x = width * padding - min_x * scale
-    offset_y = height * padding - min_y * scale
-    return [
-        {'x': p['x'] * scale + offset_x, 'y': p['y'] * scale + offset_y, **{k: v for k, v in p.items() if k not in ['x', 'y']}}
-        for p in points
-    ]
 
-# Main rendering function
-def render_strokes_to_png(json_path, png_path, base_width=6, ink_color=(0, 0, 0), bg_color=(1, 1, 1), svg_path=None):
-    with open(json_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+def _render_reference(path, ink_color, bg_color):
     surface = cairo.ImageSurface(cairo.FORMAT_RGB24, WIDTH, HEIGHT)
-    ctx = cairo.Context(surface)
-    ctx.set_source_rgb(*bg_color)
-    ctx.paint()
-    ctx.set_line_cap(cairo.LINE_CAP_ROUND)
-    ctx.set_line_join(cairo.LINE_JOIN_ROUND)
-    for stroke in data['strokes']:
-        points = scale_points(stroke['points'], WIDTH, HEIGHT)
-        if len(points) < 2:
-            continue
-        # Always move to the first point before drawing curves
-        ctx.move_to(points[0]['x'], points[0]['y'])
-        beziers = catmull_rom_to_bezier(points)
-        for i, (p1, c1, c2, p2) in enumerate(beziers):
-            pressure1 = p1.get('p', 1) or 1
-            pressure2 = p2.get('p', 1) or 1
-            taper = 1
-            if i < len(beziers) * 0.2:
-                taper = i / (len(beziers) * 0.2)
-            elif i > len(beziers) * 0.8:
-                taper = (len(beziers) - i) / (len(beziers) * 0.2)
-            taper = max(0.2, min(1, taper))
-            width = max(1, base_width * (pressure1 + pressure2) / 2 * taper)
-            ctx.set_source_rgb(*ink_color)
-            ctx.set_line_width(width)
-            ctx.curve_to(c1[0], c1[1], c2[0], c2[1], p2['x'], p2['y'])
-            ctx.stroke()
-    # Downsample to 256x256 using PIL for smooth output
-    buf = surface.get_data()
-    arr = np.ndarray(shape=(HEIGHT, WIDTH, 4), dtype=np.uint8, buffer=buf)
-    rgb_arr = arr[:, :, :3]
-    pil_img = Image.fromarray(rgb_arr, 'RGB')
-    pil_img = pil_img.resize((OUTPUT_WIDTH, OUTPUT_HEIGHT), resample=Image.LANCZOS)
-    pil_img.save(png_path)
-    # Optionally save SVG
+    ctx = _new_context(surface, bg_color)
+    path.draw(ctx, WIDTH, ink_color)
+    return Image.fromarray(np.ascontiguousarray(_surface_rgb(surface, WIDTH, HEIGHT)), 'RGB')
+
+
+def rasterize(path, output_size=OUTPUT_WIDTH, supersample=None, ink_color=(0, 0, 0), bg_color=(1, 1, 1),
+              _reference=None):
+    """
+    Rasterize a StrokePath to an (output_size, output_size, 3) uint8 RGB array.
+    Args:
+        output_size: Output edge length in pixels (e.g. one of OUTPUT_SIZES)
+        supersample: None for the legacy 2048px path, or a small int factor for direct rendering
+    """
+    if supersample is None:
+        pil_img = _reference if _reference is not None else _render_reference(path, ink_color, bg_color)
+        pil_img = pil_img.resize((output_size, output_size), resample=Image.LANCZOS)
+        pil_img = pil_img.filter(ImageFilter.GaussianBlur(radius=0.3))  # Smooth jagged lines
+        return np.asarray(pil_img)
+
+    size = output_size * supersample
+    surface = cairo.ImageSurface(cairo.FORMAT_RGB24, size, size)
+    ctx = _new_context(surface, bg_color)
+    ctx.set_antialias(cairo.ANTIALIAS_GOOD)
+    path.draw(ctx, size, ink_color)
+    arr = _surface_rgb(surface, size, size)
+    if supersample > 1:
+        arr = arr.reshape(output_size, supersample, output_size, supersample, 3).mean(axis=(1, 3))
+        return np.rint(arr).astype(np.uint8)
+    return np.ascontiguousarray(arr)
+
+
+def render_sample_array(data, output_size=OUTPUT_WIDTH, supersample=None, base_width=6,
+                        ink_color=(0, 0, 0), bg_color=(1, 1, 1), variable_width=False, tilt_gain=0.0,
+                        spacing=None, tolerance=None):
+    """
+    Render a loaded sample to an (output_size, output_size, 3) uint8 RGB array.
+    """
+    path = StrokePath.from_sample(data, base_width, variable_width=variable_width, tilt_gain=tilt_gain,
+                                  spacing=spacing, tolerance=tolerance)
+    return rasterize(path, output_size, supersample, ink_color, bg_color)
+
+
+def render_targets(data, targets, base_width=6, ink_color=(0, 0, 0), bg_color=(1, 1, 1), supersample=None,
+                   variable_width=False, tilt_gain=0.0, spacing=None, tolerance=None):
+    """
+    Compute stroke geometry once and replay it onto several targets.
+    Args:
+        data: Loaded sample dict, or a path to its JSON
+        targets: List of (kind, path, size) tuples:
+            ('png', png_path, size)   raster PNG at size x size
+            ('array', None, size)     raster returned as a uint8 array
+            ('svg', svg_path, None)   vector output at WIDTH x HEIGHT
+            ('pdf', pdf_path, None)   vector output at WIDTH x HEIGHT
+        supersample: Raster mode for png/array targets (see rasterize)
+        variable_width / tilt_gain: Pressure-varying filled outlines (see StrokePath.from_sample)
+        spacing / tolerance: Arc-length resampling / RDP simplification (see StrokePath.from_sample)
+    Returns:
+        List aligned with targets: arrays for 'array' targets, output paths otherwise.
+    """
+    if isinstance(data, str):
+        with stage_timer('render.load'):
+            with open(data, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+    with stage_timer('render.geometry'):
+        path = StrokePath.from_sample(data, base_width, variable_width=variable_width, tilt_gain=tilt_gain,
+                                      spacing=spacing, tolerance=tolerance)
+    reference = None  # legacy 2048px raster, shared by every raster target
+    results = []
+    for kind, out_path, size in targets:
+        if kind in ('png', 'array'):
+            with stage_timer('render.rasterize'):
+                if supersample is None and reference is None:
+                    reference = _render_reference(path, ink_color, bg_color)
+                arr = rasterize(path, size, supersample, ink_color, bg_color, _reference=reference)
+            if kind == 'png':
+                with stage_timer('render.encode'):
+                    Image.fromarray(arr, 'RGB').save(out_path)
+                results.append(out_path)
+            else:
+                results.append(arr)
+        elif kind in ('svg', 'pdf'):
+            with stage_timer('render.vector'):
+                surface_cls = cairo.SVGSurface if kind == 'svg' else cairo.PDFSurface
+                surface = surface_cls(out_path, WIDTH, HEIGHT)
+                path.draw(_new_context(surface, bg_color), WIDTH, ink_color)
+                surface.finish()
+            results.append(out_path)
+        else:
+            raise ValueError(f'Unknown render target: {kind}')
+    return results
+
+
+def render_strokes_to_png(json_path, png_path, base_width=6, ink_color=(0, 0, 0), bg_color=(1, 1, 1), svg_path=None,
+                          output_size=OUTPUT_WIDTH, supersample=None, variable_width=False, tilt_gain=0.0,
+                          spacing=None, tolerance=None):
+    targets = [('png', png_path, output_size)]
+    # Optional SVG render
     if svg_path:
-        svg_surface = cairo.SVGSurface(svg_path, WIDTH, HEIGHT)
-        svg_ctx = cairo.Context(svg_surface)
-        svg_ctx.set_source_rgb(*bg_color)
-        svg_ctx.paint()
-        svg_ctx.set_line_cap(cairo.LINE_CAP_ROUND)
-        svg_ctx.set_line_join(cairo.LINE_JOIN_ROUND)
-        for stroke in data['strokes']:
-            points = scale_points(stroke['points'], WIDTH, HEIGHT)
-            if len(points) < 2:
-                continue
-            svg_ctx.move_to(points[0]['x'], points[0]['y'])
-            beziers = catmull_rom_to_bezier(points)
-            for i, (p1, c1, c2, p2) in enumerate(beziers):
-                pressure1 = p1.get('p', 1) or 1
-                pressure2 = p2.get('p', 1) or 1
-                taper = 1
-                if i < len(beziers) * 0.2:
-                    taper = i / (len(beziers) * 0.2)
-                elif i > len(beziers) * 0.8:
-                    taper = (len(beziers) - i) / (len(beziers) * 0.2)
-                taper = max(0.2, min(1, taper))
-                width = max(1, base_width * (pressure1 + pressure2) / 2 * taper)
-                svg_ctx.set_source_rgb(*ink_color)
-                svg_ctx.set_line_width(width)
-                svg_ctx.curve_to(c1[0], c1[1], c2[0], c2[1], p2['x'], p2['y'])
-                svg_ctx.stroke()
-        svg_surface.finish()
-
-# Stub for batch rendering or CLI
+        targets.append(('svg', svg_path, None))
+    render_targets(json_path, targets, base_width=base_width, ink_color=ink_color, bg_color=bg_color,
+                   supersample=supersample, variable_width=variable_width, tilt_gain=tilt_gain,
+                   spacing=spacing, tolerance=tolerance)
+
+# ---------- Batch Rendering ----------
+
+def render_params_hash(**render_kwargs):
+    """Hash of everything that affects the rendered output (used to skip unchanged files)."""
+    params = {'version': RENDER_VERSION, 'size': [WIDTH, HEIGHT, OUTPUT_WIDTH, OUTPUT_HEIGHT], **render_kwargs}
+    blob = json.dumps(params, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha1(blob).hexdigest()[:16]
+
+
+def collect_inputs(source):
+    """
+    Resolve a data root (handwriting_data/<label>/*.json) or a glob into a sorted list of JSON paths.
+    """
+    if os.path.isdir(source):
+        return sorted(glob(os.path.join(source, '*', '*.json')))
+    return sorted(glob(source, recursive=True))
+
+
+def _render_job(job):
+    json_path, png_path, svg_path, render_kwargs = job
+    try:
+        os.makedirs(os.path.dirname(png_path) or '.', exist_ok=True)
+        render_strokes_to_png(json_path, png_path, svg_path=svg_path, **render_kwargs)
+        return json_path, None
+    except Exception as e:
+        return json_path, f'{type(e).__name__}: {e}'
+
+
+def render_batch(source, out_dir, workers=None, force=False, svg=False, **render_kwargs):
+    """
+    Render every sample under a data root (or matching a glob) across a process pool.
+    Outputs go to out_dir/<label>/<stem>.png. A file is skipped when its PNG is newer
+    than the source JSON and was rendered with the same parameter hash.
+    Args:
+        source: handwriting_data root or glob pattern for JSON files
+        out_dir: Output root
+        workers: Process count (default: os.cpu_count())
+        force: Re-render everything
+        svg: Also write <stem>.svg next to each PNG
+        render_kwargs: Passed through to render_strokes_to_png
+    Returns:
+        Dict with rendered/skipped counts, failures {json_path: error} and throughput.
+        Per-stage timings from the workers are merged into this process's metrics (Module 21).
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    manifest_path = os.path.join(out_dir, MANIFEST_NAME)
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    params_hash = render_params_hash(svg=svg, **render_kwargs)
+
+    jobs, skipped = [], 0
+    for jp in collect_inputs(source):
+        label = os.path.basename(os.path.dirname(jp))
+        stem = os.path.splitext(os.path.basename(jp))[0]
+        png_path = os.path.join(out_dir, label, f'{stem}.png')
+        key = f'{label}/{stem}'
+        if (not force and manifest.get(key) == params_hash and os.path.exists(png_path)
+                and os.path.getmtime(png_path) >= os.path.getmtime(jp)):
+            skipped += 1
+            continue
+        svg_path = os.path.join(out_dir, label, f'{stem}.svg') if svg else None
+        jobs.append((jp, png_path, svg_path, render_kwargs))
+
+    failures = {}
+    start = time.perf_counter()
+    if jobs:
+        workers = workers or os.cpu_count() or 1
+        chunksize = max(1, len(jobs) // (workers * 8))
+        # spawn, not fork, like the ingest pipeline: a forked child can inherit locks held by
+        # other threads of the caller (logging, metrics) and deadlock
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            for jp, err in pool_map(pool, _render_job, jobs, chunksize=chunksize):
+                label = os.path.basename(os.path.dirname(jp))
+                stem = os.path.splitext(os.path.basename(jp))[0]
+                if err is None:
+                    manifest[f'{label}/{stem}'] = params_hash
+                else:
+                    failures[jp] = err
+                    log.warning('Render failed for %s: %s', jp, err)
+    elapsed = time.perf_counter() - start
+
+    with open(manifest_path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, sort_keys=True)
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+    rendered = len(jobs) - len(failures)
+    return {
+        'rendered': rendered,
+        'skipped': skipped,
+        'failed': len(failures),
+        'failures': failures,
+        'seconds': elapsed,
+        'files_per_sec': rendered / elapsed if elapsed > 0 else 0.0,
+    }
+
+# ---------- CLI Stub ----------
+
 if __name__ == '__main__':
     import sys
-    if len(sys.argv) < 3:
-        print('Usage: python cairo_renderer.py <input.json> <output.png> [--svg output.svg]')
+    render_kwargs = {}
+    if '--size' in sys.argv:
+        render_kwargs['output_size'] = int(sys.argv[sys.argv.index('--size') + 1])
+    if '--supersample' in sys.argv:
+        render_kwargs['supersample'] = int(sys.argv[sys.argv.index('--supersample') + 1])
+    if '--variable-width' in sys.argv:
+        render_kwargs['variable_width'] = True
+    if '--tilt-gain' in sys.argv:
+        render_kwargs['tilt_gain'] = float(sys.argv[sys.argv.index('--tilt-gain') + 1])
+    if '--spacing' in sys.argv:
+        render_kwargs['spacing'] = float(sys.argv[sys.argv.index('--spacing') + 1])
+    if '--tolerance' in sys.argv:
+        render_kwargs['tolerance'] = float(sys.argv[sys.argv.index('--tolerance') + 1])
+    if len(sys.argv) >= 4 and sys.argv[1] == '--batch':
+        workers = int(sys.argv[sys.argv.index('--workers') + 1]) if '--workers' in sys.argv else None
+        stats = render_batch(sys.argv[2], sys.argv[3], workers=workers,
+                             force='--force' in sys.argv, svg='--svg' in sys.argv, **render_kwargs)
+        for jp, err in stats['failures'].items():
+            print(f'FAILED {jp}: {err}')
+        print(f"Rendered {stats['rendered']}, skipped {stats['skipped']}, failed {stats['failed']} "
+              f"in {stats['seconds']:.2f}s ({stats['files_per_sec']:.1f} files/s)")
+    elif len(sys.argv) < 3:
+        print('Usage: python cairo_renderer.py <input.json> <output.png> [--svg output.svg] [--size N] [--supersample K] [--variable-width] [--spacing PX] [--tolerance PX]')
+        print('       python cairo_renderer.py --batch <data_root|glob> <out_dir> [--workers N] [--force] [--svg] [--size N] [--supersample K] [--variable-width] [--spacing PX] [--tolerance PX]')
     else:
         svg_path = None
         if '--svg' in sys.argv:
             idx = sys.argv.index('--svg')
             svg_path = sys.argv[idx + 1]
-        render_strokes_to_png(sys.argv[1], sys.argv[2], svg_path=svg_path)"""
\ No newline at end of file
+        render_strokes_to_png(sys.argv[1], sys.argv[2], svg_path=svg_path, **render_kwargs)
@@ -4,13 +4,20 @@
 
 import os
 import json
+import hashlib
 import numpy as np
 from glob import glob
-from sklearn.model_selection import train_test_split
+from tfrecord_io import ShardedTFRecordWriter, encode_example
+from stroke_processing import process_stroke
+from fingerprint import dedupe_report
+from metrics import stage_timer
 
-# Optional: import h5py, tensorflow as tf if needed
+try:
+    import h5py
+except ImportError:  # only needed for fmt='h5'
+    h5py = None
 
-SUPPORTED_FORMATS = ['npz', 'h5', 'tfrecord']
+SUPPORTED_FORMATS = ['npz', 'shards', 'h5', 'tfrecord']
 
 
 def normalize_stroke(stroke, width=256, height=256):
@@ -37,54 +44,651 @@ def delta_encode(stroke):
     return {'stroke_id': stroke['stroke_id'], 'points': deltas}
 
 
-def export_data(data_dir, out_dir, fmt='npz', test_size=0.1, val_size=0.1, delta=False):
+def load_sample(jf, delta=False):
+    with open(jf, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    label = data.get('label', 'unknown')
+    strokes = [normalize_stroke(s) for s in data['strokes']]
+    if delta:
+        strokes = [delta_encode(s) for s in strokes]
+    png_path = jf.replace('.json', '.png')
+    return {'label': label, 'strokes': strokes, 'png_path': png_path}
+
+
+# ---------- Streaming Shard Export ----------
+# Each split is written as fixed-size shards of plain .npy arrays (no pickle):
+#   shard_00000/values.npy          float32 (n_points, len(fields)) point features
+#   shard_00000/stroke_offsets.npy  int64 (n_strokes + 1,) row offsets into values
+#   shard_00000/sample_offsets.npy  int64 (n_samples + 1,) offsets into stroke_offsets
+#   shard_00000/labels.npy          unicode (n_samples,)
+# plus index.json describing fields, shard sizes and the export-wide class table ('classes', the
+# same sorted label list in every split). Load with np.load(..., mmap_mode='r').
+
+POINT_FIELDS = ['x', 'y', 't', 'p', 'tiltX', 'tiltY']
+DELTA_FIELDS = POINT_FIELDS + ['dx', 'dy']
+SHARD_SIZE = 4096
+
+
+def sample_to_arrays(data, width=256, height=256, delta=False, spacing=None, tolerance=None):
+    """
+    Convert one JSON sample into (values, stroke_lengths) without per-point dict copies.
+    x/y are normalized like normalize_stroke; t is made relative to the sample's first point.
+    Args:
+        spacing / tolerance: Arc-length resample and / or RDP-simplify each stroke
+            (stroke_processing, in input pixels) before normalizing
+    Returns:
+        float32 (n_points, len(fields)) array and an int64 array of points per stroke.
+    """
+    strokes = data.get('strokes', [])
+    lengths = np.array([len(s['points']) for s in strokes], dtype=np.int64)
+    rows = [[pt.get(f) for f in POINT_FIELDS] for s in strokes for pt in s['points']]
+    values = np.array(rows, dtype=np.float64).reshape(len(rows), len(POINT_FIELDS))
+    if spacing or tolerance:
+        bounds = np.concatenate([[0], np.cumsum(lengths)])
+        parts = [process_stroke(values[a:b], spacing, tolerance) for a, b in zip(bounds[:-1], bounds[1:])]
+        lengths = np.array([len(p) for p in parts], dtype=np.int64)
+        values = np.concatenate(parts) if parts else values
+    values[:, 0] /= width
+    values[:, 1] /= height
+    if len(values):
+        values[:, 2] -= values[0, 2]  # time relative to the first point keeps float32 precision
+    if delta:
+        d = np.zeros((len(values), 2))
+        d[1:] = np.diff(values[:, :2], axis=0)
+        starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+        d[starts[lengths > 0]] = 0  # first point of every stroke has no predecessor
+        values = np.hstack([values, d])
+    return values.astype(np.float32), lengths
+
+
+def load_arrays(jf, delta=False, spacing=None, tolerance=None):
+    """Read one JSON sample and convert it with sample_to_arrays. Returns (data, values, lengths)."""
+    with stage_timer('export.read'):
+        with open(jf, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    with stage_timer('export.convert'):
+        values, lengths = sample_to_arrays(data, delta=delta, spacing=spacing, tolerance=tolerance)
+    return data, values, lengths
+
+
+class ExportShardWriter:
+    """
+    Buffers at most shard_size samples, then flushes them as one shard directory.
+    With append=True, new shards are added after the ones already listed in index.json.
+    classes (the export-wide label table) is written to index.json; on append the stored one is kept unless given.
+    """
+
+    def __init__(self, out_dir, fields, shard_size=SHARD_SIZE, append=False, classes=None):
+        self.out_dir = out_dir
+        self.fields = fields
+        self.shard_size = shard_size
+        self.classes = classes
+        self.shards = []
+        self.removed = {}  # shard name -> local indices superseded by later exports
+        os.makedirs(out_dir, exist_ok=True)
+        index_path = os.path.join(out_dir, 'index.json')
+        if append and os.path.exists(index_path):
+            with open(index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            if index['fields'] != fields:
+                raise ValueError(f'Cannot append {fields} to an export with fields {index["fields"]}')
+            self.shards = index['shards']
+            self.removed = index.get('removed', {})
+            if self.classes is None:
+                self.classes = index.get('classes')
+        self._reset()
+
+    def _reset(self):
+        self._values, self._lengths, self._counts, self._labels = [], [], [], []
+
+    def add(self, values, stroke_lengths, label):
+        """Buffer one sample. Returns its (shard name, index within shard)."""
+        location = (f'shard_{len(self.shards):05d}', len(self._labels))
+        self._values.append(values)
+        self._lengths.append(stroke_lengths)
+        self._counts.append(len(stroke_lengths))
+        self._labels.append(label)
+        if len(self._labels) >= self.shard_size:
+            self.flush()
+        return location
+
+    def remove(self, shard_name, index):
+        """Hide a previously written sample from readers (it was changed or deleted)."""
+        self.removed.setdefault(shard_name, []).append(index)
+
+    def flush(self):
+        if not self._labels:
+            return
+        name = f'shard_{len(self.shards):05d}'
+        shard_dir = os.path.join(self.out_dir, name)
+        os.makedirs(shard_dir, exist_ok=True)
+        values = np.concatenate(self._values) if self._values else np.empty((0, len(self.fields)), np.float32)
+        lengths = np.concatenate(self._lengths)
+        stroke_offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=stroke_offsets[1:])
+        sample_offsets = np.zeros(len(self._counts) + 1, dtype=np.int64)
+        np.cumsum(self._counts, out=sample_offsets[1:])
+        np.save(os.path.join(shard_dir, 'values.npy'), values.reshape(-1, len(self.fields)))
+        np.save(os.path.join(shard_dir, 'stroke_offsets.npy'), stroke_offsets)
+        np.save(os.path.join(shard_dir, 'sample_offsets.npy'), sample_offsets)
+        np.save(os.path.join(shard_dir, 'labels.npy'), np.array(self._labels, dtype=str))
+        self.shards.append({'name': name, 'n_samples': len(self._labels), 'n_points': int(len(values))})
+        self._reset()
+
+    def close(self):
+        self.flush()
+        with open(os.path.join(self.out_dir, 'index.json'), 'w', encoding='utf-8') as f:
+            json.dump({'fields': self.fields, 'classes': self.classes, 'shards': self.shards,
+                       'removed': self.removed}, f, indent=2)
+
+
+class ExportShardReader:
+    """
+    Memory-mapped reader over one exported split directory.
+    reader[i] returns (label, list of (n, len(fields)) float32 stroke views).
+    classes is the export-wide label table (None for exports written before it existed).
+    """
+
+    def __init__(self, split_dir):
+        with open(os.path.join(split_dir, 'index.json'), 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        self.fields = index['fields']
+        self.classes = index.get('classes')
+        self.shards = []
+        for shard in index['shards']:
+            shard_dir = os.path.join(split_dir, shard['name'])
+            self.shards.append({
+                k: np.load(os.path.join(shard_dir, f'{k}.npy'), mmap_mode='r')
+                for k in ('values', 'stroke_offsets', 'sample_offsets', 'labels')
+            })
+        self._starts = np.cumsum([0] + [len(s['labels']) for s in self.shards])
+        # Samples superseded by incremental exports are skipped via a map of live rows
+        self._live = None
+        removed = index.get('removed', {})
+        if any(removed.values()):
+            names = [shard['name'] for shard in index['shards']]
+            dead = [self._starts[names.index(name)] + j for name, idx in removed.items() for j in idx]
+            self._live = np.setdiff1d(np.arange(self._starts[-1]), np.array(dead, dtype=np.int64))
+
+    def __len__(self):
+        return int(self._starts[-1]) if self._live is None else len(self._live)
+
+    def locate(self, i):
+        """Return (shard dict, index within shard) for global sample i."""
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        if self._live is not None:
+            i = int(self._live[i])
+        k = int(np.searchsorted(self._starts, i, side='right') - 1)
+        return self.shards[k], i - int(self._starts[k])
+
+    def lengths_and_labels(self):
+        """Per-sample point counts and labels, computed from the offset tables only."""
+        lengths, labels = [], []
+        for shard in self.shards:
+            so, st = np.asarray(shard['sample_offsets']), np.asarray(shard['stroke_offsets'])
+            lengths.append(st[so[1:]] - st[so[:-1]])
+            labels.extend(np.asarray(shard['labels']).tolist())
+        lengths = np.concatenate(lengths) if lengths else np.empty(0, np.int64)
+        if self._live is not None:
+            return lengths[self._live], [labels[i] for i in self._live]
+        return lengths, labels
+
+    def __getitem__(self, i):
+        shard, j = self.locate(i)
+        s0, s1 = shard['sample_offsets'][j], shard['sample_offsets'][j + 1]
+        offs = shard['stroke_offsets'][s0:s1 + 1]
+        values = shard['values']
+        return str(shard['labels'][j]), [values[a:b] for a, b in zip(offs[:-1], offs[1:])]
+
+
+def export_shards(json_files, out_dir, delta=False, shard_size=SHARD_SIZE, spacing=None, tolerance=None,
+                  classes=None):
+    """
+    Stream JSON files one at a time into fixed-size shards; memory stays bounded by shard_size.
+    classes defaults to the labels of json_files; export_data passes the table of the whole export.
+    Returns:
+        Number of exported samples.
+    """
+    if classes is None:
+        classes = export_classes(json_files)
+    writer = ExportShardWriter(out_dir, DELTA_FIELDS if delta else POINT_FIELDS, shard_size=shard_size,
+                               classes=classes)
+    count = 0
+    for jf in json_files:
+        _, values, lengths = load_arrays(jf, delta, spacing, tolerance)
+        with stage_timer('export.write'):
+            writer.add(values, lengths, sample_label(jf))
+        count += 1
+    with stage_timer('export.write'):
+        writer.close()
+    return count
+
+
+# ---------- HDF5 Export ----------
+# One data.h5 per split:
+#   values          float32 (n_points, len(fields)), chunked + gzip
+#   stroke_offsets  int64 (n_strokes + 1,)
+#   sample_offsets  int64 (n_samples + 1,)
+#   label_ids       int32 (n_samples,) indices into attrs['classes']
+#   attrs['classes'] JSON export-wide label table (same in every split, so ids match across splits)
+#   images          uint8 (n_samples, IMAGE_SIZE, IMAGE_SIZE), optional, one chunk per image
+
+IMAGE_SIZE = 256
+H5_POINT_CHUNK = 16384
+H5_FLUSH_SAMPLES = 1024
+
+
+def load_png_tensor(png_path, size=IMAGE_SIZE):
+    """Grayscale uint8 (size, size) array from a sample PNG; white if the PNG is missing."""
+    from PIL import Image
+    if not os.path.exists(png_path):
+        return np.full((size, size), 255, dtype=np.uint8)
+    img = Image.open(png_path).convert('L')
+    if img.size != (size, size):
+        img = img.resize((size, size), Image.LANCZOS)
+    return np.asarray(img, dtype=np.uint8)
+
+
+def _h5_append(dset, arr):
+    n = dset.shape[0]
+    dset.resize(n + len(arr), axis=0)
+    dset[n:] = arr
+
+
+def export_h5(json_files, out_path, delta=False, images=False, spacing=None, tolerance=None, classes=None):
+    """
+    Stream JSON files into a chunked, compressed HDF5 file (see layout above).
+    classes defaults to the labels of json_files; export_data passes the table of the whole export.
+    Returns:
+        Number of exported samples.
+    """
+    if h5py is None:
+        raise ImportError('h5py is required for HDF5 export (pip install h5py)')
+    fields = DELTA_FIELDS if delta else POINT_FIELDS
+    k = len(fields)
+    if classes is None:
+        classes = export_classes(json_files)
+    label_ids = {c: i for i, c in enumerate(classes)}
+    with h5py.File(out_path, 'w') as h5:
+        h5.attrs['fields'] = json.dumps(fields)
+        h5.attrs['classes'] = json.dumps(list(classes))
+        values = h5.create_dataset('values', shape=(0, k), maxshape=(None, k), dtype='float32',
+                                   chunks=(H5_POINT_CHUNK, k), compression='gzip', shuffle=True)
+        stroke_offsets = h5.create_dataset('stroke_offsets', data=np.zeros(1, np.int64), maxshape=(None,),
+                                           chunks=(H5_POINT_CHUNK,), compression='gzip')
+        sample_offsets = h5.create_dataset('sample_offsets', data=np.zeros(1, np.int64), maxshape=(None,),
+                                           chunks=(H5_POINT_CHUNK,), compression='gzip')
+        ids = h5.create_dataset('label_ids', shape=(0,), maxshape=(None,), dtype='int32',
+                                chunks=(H5_POINT_CHUNK,), compression='gzip')
+        imgs = None
+        if images:
+            imgs = h5.create_dataset('images', shape=(0, IMAGE_SIZE, IMAGE_SIZE), dtype='uint8',
+                                     maxshape=(None, IMAGE_SIZE, IMAGE_SIZE),
+                                     chunks=(1, IMAGE_SIZE, IMAGE_SIZE), compression='gzip')
+
+        n_points, n_strokes = 0, 0
+        buf = {'values': [], 'strokes': [], 'samples': [], 'ids': [], 'images': []}
+
+        def flush():
+            if not buf['ids']:
+                return
+            _h5_append(values, np.concatenate(buf['values']).reshape(-1, k))
+            _h5_append(stroke_offsets, np.array(buf['strokes'], dtype=np.int64))
+            _h5_append(sample_offsets, np.array(buf['samples'], dtype=np.int64))
+            _h5_append(ids, np.array(buf['ids'], dtype=np.int32))
+            if imgs is not None:
+                _h5_append(imgs, np.stack(buf['images']))
+            for v in buf.values():
+                v.clear()
+
+        for jf in json_files:
+            _, vals, lengths = load_arrays(jf, delta, spacing, tolerance)
+            label = sample_label(jf)
+            if label not in label_ids:
+                raise ValueError(f'{jf}: label {label!r} is not in the class table')
+            buf['values'].append(vals)
+            buf['strokes'].extend((n_points + np.cumsum(lengths)).tolist())
+            n_points += len(vals)
+            n_strokes += len(lengths)
+            buf['samples'].append(n_strokes)
+            buf['ids'].append(label_ids[label])
+            if imgs is not None:
+                with stage_timer('export.image'):
+                    buf['images'].append(load_png_tensor(os.path.splitext(jf)[0] + '.png'))
+            if len(buf['ids']) >= H5_FLUSH_SAMPLES:
+                with stage_timer('export.write'):
+                    flush()
+        with stage_timer('export.write'):
+            flush()
+        return int(ids.shape[0])
+
+
+class H5SampleReader:
+    """
+    Random access to samples in an exported data.h5 without reading the rest of the file.
+    The file is opened lazily per process, so one reader can be shared by forked workers.
+    reader[i] returns (label, list of (n, len(fields)) float32 strokes[, image]).
+    """
+
+    def __init__(self, path, with_images=False):
+        self.path = path
+        self.with_images = with_images
+        self._h5 = None
+        self._pid = None
+        h5 = self._file()
+        self.fields = json.loads(h5.attrs['fields'])
+        self.classes = json.loads(h5.attrs['classes']) if 'classes' in h5.attrs else None
+        if 'label_names' in h5:
+            # Files written before label_ids indexed the class table: ids are per split
+            self.label_names = [n.decode('utf-8') if isinstance(n, bytes) else n for n in h5['label_names'][()]]
+        else:
+            self.label_names = self.classes
+        self._len = h5['label_ids'].shape[0]
+
+    def _file(self):
+        if self._h5 is None or self._pid != os.getpid():
+            if h5py is None:
+                raise ImportError('h5py is required to read HDF5 exports (pip install h5py)')
+            self._h5 = h5py.File(self.path, 'r')
+            self._pid = os.getpid()
+        return self._h5
+
+    def __len__(self):
+        return self._len
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_h5'] = None
+        return state
+
+    def lengths_and_labels(self):
+        """Per-sample point counts and labels, computed from the offset tables only."""
+        h5 = self._file()
+        so, st = h5['sample_offsets'][()], h5['stroke_offsets'][()]
+        return st[so[1:]] - st[so[:-1]], [self.label_names[i] for i in h5['label_ids'][()]]
+
+    def image(self, i):
+        return self._file()['images'][i]
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self._len
+        if not 0 <= i < self._len:
+            raise IndexError(i)
+        h5 = self._file()
+        s0, s1 = h5['sample_offsets'][i:i + 2]
+        offs = h5['stroke_offsets'][s0:s1 + 1]
+        values = h5['values'][offs[0]:offs[-1]] if len(offs) else np.empty((0, len(self.fields)), np.float32)
+        rel = offs - offs[0] if len(offs) else offs
+        strokes = [values[a:b] for a, b in zip(rel[:-1], rel[1:])]
+        label = self.label_names[h5['label_ids'][i]]
+        if self.with_images:
+            return label, strokes, h5['images'][i]
+        return label, strokes
+
+# ---------- TFRecord Export ----------
+# tf.train.Example features per sample:
+#   label (bytes), sample_id (bytes, <label>/<stem>), values (float, flattened n_points x num_fields),
+#   num_fields (int64), stroke_lengths (int64 per stroke)
+# Field names and the export-wide class table are written to index.json next to the shards.
+
+TFRECORD_SHARDS = 4
+
+
+def export_tfrecord(json_files, out_dir, delta=False, num_shards=TFRECORD_SHARDS, spacing=None, tolerance=None,
+                    classes=None):
+    """
+    Stream JSON files into num_shards TFRecord files under out_dir.
+    Returns:
+        Number of exported samples.
+    """
+    fields = DELTA_FIELDS if delta else POINT_FIELDS
+    with ShardedTFRecordWriter(os.path.join(out_dir, 'data'), num_shards=num_shards) as writer:
+        for jf in json_files:
+            _, values, lengths = load_arrays(jf, delta, spacing, tolerance)
+            with stage_timer('export.write'):
+                writer.write(encode_example({
+                    'label': sample_label(jf),
+                    'sample_id': sample_key(jf),
+                    'values': values,
+                    'num_fields': len(fields),
+                    'stroke_lengths': lengths,
+                }))
+    with open(os.path.join(out_dir, 'index.json'), 'w', encoding='utf-8') as f:
+        json.dump({'fields': fields, 'classes': export_classes(json_files) if classes is None else classes,
+                   'files': [os.path.basename(p) for p in writer.paths],
+                   'n_samples': writer.count}, f, indent=2)
+    return writer.count
+
+
+def example_to_sample(example):
+    """Turn a decoded TFRecord example back into (label, list of (n, num_fields) stroke arrays)."""
+    k = int(example['num_fields'][0])
+    values = example['values'].reshape(-1, k)
+    offsets = np.concatenate([[0], np.cumsum(example['stroke_lengths'])])
+    return example['label'][0].decode('utf-8'), [values[a:b] for a, b in zip(offsets[:-1], offsets[1:])]
+
+# ---------- Splits and Incremental Export ----------
+# Split membership comes from a hash of each sample's id (<label>/<stem>), so it never
+# changes as the dataset grows (every format, npz included).
+# manifest.json records each exported file's size, mtime, content hash, split and shard
+# location; incremental runs only touch new/changed files, then rewrite the class table of
+# every split so ids stay identical across train / val / test. With dedupe, fingerprints
+# are cached the same way (size + mtime) in fingerprint_cache.json.
+
+MANIFEST_NAME = 'manifest.json'
+FINGERPRINT_CACHE_NAME = 'fingerprint_cache.json'
+
+
+def sample_key(json_path):
+    return f'{os.path.basename(os.path.dirname(json_path))}/{os.path.splitext(os.path.basename(json_path))[0]}'
+
+
+def sample_label(json_path):
+    """
+    Label a sample is exported under: its label folder (the server files each sample under its label).
+    The class table is built from the same folders, so every exported label has an id.
+    """
+    return os.path.basename(os.path.dirname(json_path))
+
+
+def export_classes(json_files):
+    """Sorted label table for an export, from the label folders (see sample_label)."""
+    return sorted({sample_label(jf) for jf in json_files})
+
+
+def hash_split(key, test_size=0.1, val_size=0.1):
+    """Deterministically assign a sample id to 'train', 'val' or 'test'."""
+    u = int(hashlib.sha1(key.encode('utf-8')).hexdigest()[:8], 16) / 2 ** 32
+    if u < test_size:
+        return 'test'
+    if u < test_size + val_size:
+        return 'val'
+    return 'train'
+
+
+def file_sha1(path):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def load_manifest(out_dir):
+    path = os.path.join(out_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {'samples': {}}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_manifest(out_dir, manifest):
+    path = os.path.join(out_dir, MANIFEST_NAME)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    os.replace(path + '.tmp', path)
+
+
+def load_fingerprint_cache(out_dir):
+    path = os.path.join(out_dir, FINGERPRINT_CACHE_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_fingerprint_cache(out_dir, cache):
+    path = os.path.join(out_dir, FINGERPRINT_CACHE_NAME)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(cache, f)
+    os.replace(path + '.tmp', path)
+
+
+def export_incremental(json_files, out_dir, test_size=0.1, val_size=0.1, delta=False, shard_size=SHARD_SIZE,
+                       spacing=None, tolerance=None):
+    """
+    Append only new or changed samples to a 'shards' export; changed and deleted
+    samples are hidden from readers. Unchanged files are detected by size + mtime,
+    falling back to the content hash.
+    Returns:
+        Dict with added / updated / removed / unchanged counts.
+    """
+    fields = DELTA_FIELDS if delta else POINT_FIELDS
+    manifest = load_manifest(out_dir)
+    if manifest.get('fields', fields) != fields:
+        raise ValueError('Incremental export must keep the same delta setting as the existing export')
+    resample = {'spacing': spacing, 'tolerance': tolerance}
+    if manifest.get('resample', resample) != resample:
+        raise ValueError('Incremental export must keep the same spacing / tolerance as the existing export')
+    samples = manifest['samples']
+    writers = {}
+    stats = {'added': 0, 'updated': 0, 'removed': 0, 'unchanged': 0}
+
+    def writer_for(split):
+        if split not in writers:
+            writers[split] = ExportShardWriter(os.path.join(out_dir, split), fields, shard_size, append=True)
+        return writers[split]
+
+    seen = set()
+    for jf in json_files:
+        key = sample_key(jf)
+        seen.add(key)
+        st = os.stat(jf)
+        old = samples.get(key)
+        if old and old['size'] == st.st_size and old['mtime'] == st.st_mtime:
+            stats['unchanged'] += 1
+            continue
+        with stage_timer('export.hash'):
+            digest = file_sha1(jf)
+        if old and old['sha1'] == digest:
+            old['mtime'] = st.st_mtime
+            stats['unchanged'] += 1
+            continue
+        _, values, lengths = load_arrays(jf, delta, spacing, tolerance)
+        split = hash_split(key, test_size, val_size)
+        if old:
+            writer_for(old['split']).remove(old['shard'], old['index'])
+            stats['updated'] += 1
+        else:
+            stats['added'] += 1
+        with stage_timer('export.write'):
+            shard, index = writer_for(split).add(values, lengths, sample_label(jf))
+        samples[key] = {'sha1': digest, 'size': st.st_size, 'mtime': st.st_mtime,
+                        'split': split, 'shard': shard, 'index': index}
+
+    for key in [k for k in samples if k not in seen]:
+        old = samples.pop(key)
+        writer_for(old['split']).remove(old['shard'], old['index'])
+        stats['removed'] += 1
+
+    classes = sorted({key.split('/', 1)[0] for key in samples})
+    for split in ('train', 'val', 'test'):
+        writer_for(split).classes = classes
+    with stage_timer('export.write'):
+        for writer in writers.values():
+            writer.close()
+    manifest['fields'] = fields
+    manifest['resample'] = resample
+    manifest['classes'] = classes
+    save_manifest(out_dir, manifest)
+    return stats
+
+def export_data(data_dir, out_dir, fmt='npz', test_size=0.1, val_size=0.1, delta=False, shard_size=SHARD_SIZE,
+                images=False, num_shards=TFRECORD_SHARDS, incremental=False, spacing=None, tolerance=None,
+                dedupe=None):
     """
     Convert all JSON+PNG samples in data_dir to ML format in out_dir.
     Args:
         data_dir: Directory with label folders containing .json and .png
         out_dir: Output directory
-        fmt: 'npz', 'h5', or 'tfrecord'
+        fmt: 'npz', 'shards', 'h5', or 'tfrecord'
         test_size: Fraction for test split
         val_size: Fraction for val split
         delta: If True, use delta encoding
+        shard_size: Samples per shard for the streaming 'shards' format
+        images: For 'h5', also store each sample's PNG as a uint8 tensor
+        num_shards: Number of TFRecord files per split (match reader parallelism)
+        incremental: Only export new/changed samples (requires fmt='shards')
+        spacing: Arc-length resample strokes to this point spacing (input pixels)
+        tolerance: RDP-simplify strokes to this error (input pixels); both apply
+            to the array formats (shards, h5, tfrecord), not the legacy npz
+        dedupe: None, 'exact' or 'near': drop duplicate samples before splitting (first
+            file of each group is kept) and write out_dir/dedupe_report.json. Fingerprints are
+            cached in out_dir/fingerprint_cache.json, so reruns only read new or changed files
     """
     assert fmt in SUPPORTED_FORMATS
     os.makedirs(out_dir, exist_ok=True)
-    json_files = glob(os.path.join(data_dir, '*', '*.json'))
-    samples = []
+    json_files = sorted(glob(os.path.join(data_dir, '*', '*.json')))
+    if dedupe:
+        assert dedupe in ('exact', 'near')
+        with stage_timer('export.dedupe'):
+            cache = load_fingerprint_cache(out_dir)
+            json_files, duplicates = dedupe_report(json_files, near=dedupe == 'near', cache=cache)
+            save_fingerprint_cache(out_dir, cache)
+        with open(os.path.join(out_dir, 'dedupe_report.json'), 'w', encoding='utf-8') as f:
+            json.dump({'kept': len(json_files), 'duplicates': duplicates}, f, indent=2)
+    if incremental:
+        if fmt != 'shards':
+            raise ValueError("Incremental export is only supported for fmt='shards'")
+        return export_incremental(json_files, out_dir, test_size, val_size, delta=delta, shard_size=shard_size,
+                                  spacing=spacing, tolerance=tolerance)
+    # Split file paths by hash, so streaming formats never hold more than one shard in memory
+    splits = {'train': [], 'val': [], 'test': []}
     for jf in json_files:
-        with open(jf, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        label = data.get('label', 'unknown')
-        strokes = [normalize_stroke(s) for s in data['strokes']]
-        if delta:
-            strokes = [delta_encode(s) for s in strokes]
-        png_path = jf.replace('.json', '.png')
-        samples.append({'label': label, 'strokes': strokes, 'png_path': png_path})
-    # Split
-    train, test = train_test_split(samples, test_size=test_size, random_state=42)
-    train, val = train_test_split(train, test_size=val_size/(1-test_size), random_state=42)
-    splits = {'train': train, 'val': val, 'test': test}
+        splits[hash_split(sample_key(jf), test_size, val_size)].append(jf)
+    # One class table for the whole export, so label ids match across splits
+    classes = export_classes(json_files)
     # Export
-    for split, items in splits.items():
+    for split, files in splits.items():
         split_dir = os.path.join(out_dir, split)
         os.makedirs(split_dir, exist_ok=True)
-        if fmt == 'npz':
-            X = [s['strokes'] for s in items]
+        if fmt == 'shards':
+            export_shards(files, split_dir, delta=delta, shard_size=shard_size, spacing=spacing, tolerance=tolerance,
+                          classes=classes)
+        elif fmt == 'npz':
+            items = [load_sample(jf, delta=delta) for jf in files]
+            # Legacy format: ragged nested dicts stored as a pickled object array
+            X = np.empty(len(items), dtype=object)
+            X[:] = [s['strokes'] for s in items]
             y = [s['label'] for s in items]
             np.savez_compressed(os.path.join(split_dir, 'data.npz'), X=X, y=y)
         elif fmt == 'h5':
-            # Stub: implement HDF5 export
-            pass
+            export_h5(files, os.path.join(split_dir, 'data.h5'), delta=delta, images=images,
+                      spacing=spacing, tolerance=tolerance, classes=classes)
         elif fmt == 'tfrecord':
-            # Stub: implement TFRecord export
-            pass
+            export_tfrecord(files, split_dir, delta=delta, num_shards=num_shards,
+                            spacing=spacing, tolerance=tolerance, classes=classes)
+
 
 # CLI stub
 if __name__ == '__main__':
     import sys
     if len(sys.argv) < 3:
-        print('Usage: python data_exporter.py <data_dir> <out_dir> [--fmt npz|h5|tfrecord] [--delta]')
+        print('Usage: python data_exporter.py <data_dir> <out_dir> [--fmt npz|shards|h5|tfrecord] [--delta] [--shard-size N] [--images] [--num-shards N] [--incremental] [--spacing PX] [--tolerance PX] [--dedupe exact|near]')
     else:
         fmt = 'npz'
         delta = False
@@ -93,4 +697,16 @@ if __name__ == '__main__':
             fmt = sys.argv[idx + 1]
         if '--delta' in sys.argv:
             delta = True
-        export_data(sys.argv[1], sys.argv[2], fmt=fmt, delta=delta) 
\ No newline at end of file
+        shard_size = SHARD_SIZE
+        if '--shard-size' in sys.argv:
+            shard_size = int(sys.argv[sys.argv.index('--shard-size') + 1])
+        num_shards = TFRECORD_SHARDS
+        if '--num-shards' in sys.argv:
+            num_shards = int(sys.argv[sys.argv.index('--num-shards') + 1])
+        spacing = float(sys.argv[sys.argv.index('--spacing') + 1]) if '--spacing' in sys.argv else None
+        tolerance = float(sys.argv[sys.argv.index('--tolerance') + 1]) if '--tolerance' in sys.argv else None
+        dedupe = sys.argv[sys.argv.index('--dedupe') + 1] if '--dedupe' in sys.argv else None
+        export_data(sys.argv[1], sys.argv[2], fmt=fmt, delta=delta, shard_size=shard_size,
+                    images='--images' in sys.argv, num_shards=num_shards,
+                    incremental='--incremental' in sys.argv, spacing=spacing, tolerance=tolerance,
+                    dedupe=dedupe) 
\ No newline at end of file
@@ -0,0 +1,378 @@
+# fingerprint.py
+# MODULE 19: Sample Fingerprints
+# Exact content hashes plus normalized, arc-length resampled stroke signatures with
+# random-projection LSH bands, for O(1) duplicate / near-duplicate lookup at ingest
+# and for batch dedupe reports before export.
+#
+#   content_hash  sha1 of the stroke point arrays (ignores label, timestamp, device)
+#   signature     SIG_POINTS (x, y) points spread evenly over the sample's total ink length,
+#                 after translating / scaling the sample's bounding box to the unit square
+#   bands         LSH_BANDS integer keys, each a hash of BAND_PROJECTIONS random projections
+#                 of the centred signature quantized to BAND_WIDTH cells (p-stable LSH), so
+#                 buckets follow signature distance; near-duplicate signatures share at least
+#                 one band with high probability, and at most MAX_CANDIDATES candidates (most
+#                 shared bands first) are confirmed by mean point distance
+#
+# The server's index is filled from the existing corpus by backfill() (at startup, or
+# python fingerprint.py --backfill). Batch dedupe can keep fingerprints in a cache keyed by
+# file size + mtime, so repeated exports only fingerprint new or changed files.
+
+import os
+import json
+import base64
+import sqlite3
+import hashlib
+import threading
+from collections import namedtuple
+import numpy as np
+
+FIELDS = ('x', 'y', 't', 'p', 'tiltX', 'tiltY')
+SIG_POINTS = 32
+LSH_BANDS = 16
+BAND_PROJECTIONS = 4
+BAND_WIDTH = 0.25
+MAX_CANDIDATES = 64
+NEAR_THRESHOLD = 0.01  # mean signature point distance (fraction of the bounding box)
+# Band keys stored in an index are rebuilt from the signatures when the scheme changes
+BAND_SCHEME = f'pstable:{LSH_BANDS}x{BAND_PROJECTIONS}:{BAND_WIDTH}'
+_rng = np.random.default_rng(1234)
+_PROJECTIONS = _rng.normal(size=(SIG_POINTS * 2, LSH_BANDS * BAND_PROJECTIONS))
+_OFFSETS = _rng.uniform(0, BAND_WIDTH, LSH_BANDS * BAND_PROJECTIONS)
+
+Fingerprint = namedtuple('Fingerprint', ['content_hash', 'signature', 'bands'])
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fingerprints (
+    sample_id TEXT PRIMARY KEY,
+    content_hash TEXT,
+    signature BLOB
+);
+CREATE INDEX IF NOT EXISTS idx_fp_hash ON fingerprints(content_hash);
+CREATE TABLE IF NOT EXISTS fp_bands (
+    band_key INTEGER,
+    sample_id TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_fp_bands ON fp_bands(band_key);
+CREATE INDEX IF NOT EXISTS idx_fp_bands_sample ON fp_bands(sample_id);
+CREATE TABLE IF NOT EXISTS fp_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# ---------- Fingerprints ----------
+
+def _signature(strokes):
+    xy = [s[:, :2] for s in strokes if len(s)]
+    pts = np.concatenate(xy)
+    lo = pts.min(axis=0)
+    scale = max(float((pts.max(axis=0) - lo).max()), 1e-9)
+    # Arc length over all strokes, with no length across pen lifts
+    seg = np.hypot(*np.diff(pts, axis=0).T)
+    seg[np.cumsum([len(s) for s in xy])[:-1] - 1] = 0.0
+    s = np.concatenate([[0.0], np.cumsum(seg)])
+    targets = np.linspace(0.0, s[-1], SIG_POINTS)
+    sig = np.stack([np.interp(targets, s, pts[:, 0]), np.interp(targets, s, pts[:, 1])], axis=1)
+    return ((sig - lo) / scale).astype(np.float32)
+
+
+def _bands(signature):
+    # Band b -> b << 56 | 56-bit hash of its quantized projections (fits a SQLite INTEGER)
+    v = (signature - signature.mean(axis=0)).ravel().astype(np.float64)
+    cells = np.floor((v @ _PROJECTIONS + _OFFSETS) / BAND_WIDTH).astype('<i8')
+    return [b << 56 | int.from_bytes(hashlib.blake2b(row.tobytes(), digest_size=7).digest(), 'little')
+            for b, row in enumerate(cells.reshape(LSH_BANDS, BAND_PROJECTIONS))]
+
+
+def fingerprint(strokes):
+    """
+    Fingerprint a sample given as a list of (n, k) stroke arrays with columns in FIELDS order.
+    Returns:
+        Fingerprint, or None for samples without points.
+    """
+    strokes = [np.ascontiguousarray(s, dtype=np.float64) for s in strokes]
+    if not any(len(s) for s in strokes):
+        return None
+    h = hashlib.sha1()
+    for s in strokes:
+        h.update(np.int64(len(s)).tobytes())
+        h.update(s.tobytes())
+    sig = _signature(strokes)
+    return Fingerprint(h.hexdigest(), sig, _bands(sig))
+
+
+def fingerprint_sample(data):
+    """Fingerprint a JSON-style sample dict."""
+    strokes = []
+    for s in data.get('strokes', []):
+        rows = [[pt.get(f) for f in FIELDS] for pt in s.get('points', [])]
+        strokes.append(np.array(rows, dtype=np.float64).reshape(len(rows), len(FIELDS)))
+    return fingerprint(strokes)
+
+
+def fingerprint_decoded(decoded):
+    """Fingerprint a stroke_codec.decode_sample() result (same hash as its stored JSON)."""
+    return fingerprint([s['columns'][:len(FIELDS)].T for s in decoded['strokes']])
+
+
+def fingerprint_file(json_path):
+    with open(json_path, 'r', encoding='utf-8') as f:
+        return fingerprint_sample(json.load(f))
+
+
+def signature_distance(a, b):
+    return float(np.hypot(*(a - b).T).mean())
+
+
+def _signatures(blobs):
+    return np.frombuffer(b''.join(blobs), dtype=np.float32).reshape(len(blobs), SIG_POINTS, 2)
+
+# ---------- Index ----------
+
+class FingerprintIndex:
+    """
+    Fingerprint store backed by SQLite (WAL), so several server workers share one index.
+    Lookups use the content_hash and band_key indexes and check at most max_candidates
+    signatures, so their cost does not grow with the corpus size.
+    db_path=':memory:' gives a private in-memory index (single thread).
+    """
+
+    def __init__(self, db_path=':memory:', near_threshold=NEAR_THRESHOLD, timeout=30.0,
+                 max_candidates=MAX_CANDIDATES):
+        self.db_path = db_path
+        self.near_threshold = near_threshold
+        self.timeout = timeout
+        self.max_candidates = max_candidates
+        self._local = threading.local()
+        folder = os.path.dirname(db_path) if db_path != ':memory:' else ''
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self._conn().executescript(SCHEMA)
+        self._check_scheme()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=self.timeout, isolation_level=None)
+            if self.db_path != ':memory:':
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _check_scheme(self):
+        # Rebuild the band keys of an index written with other LSH parameters
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute("SELECT value FROM fp_meta WHERE key = 'band_scheme'").fetchone()
+            if row is None or row[0] != BAND_SCHEME:
+                conn.execute('DELETE FROM fp_bands')
+                rows = conn.execute('SELECT sample_id, signature FROM fingerprints').fetchall()
+                for sample_id, blob in rows:
+                    sig = np.frombuffer(blob, dtype=np.float32).reshape(SIG_POINTS, 2)
+                    conn.executemany('INSERT INTO fp_bands (band_key, sample_id) VALUES (?, ?)',
+                                     [(b, sample_id) for b in _bands(sig)])
+                conn.execute("INSERT OR REPLACE INTO fp_meta (key, value) VALUES ('band_scheme', ?)", (BAND_SCHEME,))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _exact(self, conn, fp):
+        row = conn.execute('SELECT sample_id FROM fingerprints WHERE content_hash = ? LIMIT 1',
+                           (fp.content_hash,)).fetchone()
+        return None if row is None else ('exact', row[0], 0.0)
+
+    def _near(self, conn, fp):
+        marks = ', '.join('?' for _ in fp.bands)
+        rows = conn.execute(
+            f'SELECT f.sample_id, f.signature FROM fingerprints f JOIN'
+            f' (SELECT sample_id, COUNT(*) AS shared FROM fp_bands WHERE band_key IN ({marks})'
+            f'  GROUP BY sample_id ORDER BY shared DESC LIMIT ?) c USING (sample_id)',
+            (*fp.bands, self.max_candidates)).fetchall()
+        if not rows:
+            return None
+        d = np.hypot(*(_signatures([blob for _, blob in rows]) - fp.signature).transpose(2, 0, 1)).mean(axis=1)
+        i = int(np.argmin(d))
+        return ('near', rows[i][0], float(d[i])) if d[i] <= self.near_threshold else None
+
+    def lookup(self, fp):
+        """
+        Returns:
+            ('exact', sample_id, 0.0), ('near', sample_id, distance) or None.
+        """
+        conn = self._conn()
+        return self._exact(conn, fp) or self._near(conn, fp)
+
+    def _insert(self, conn, sample_id, fp):
+        conn.execute('INSERT OR REPLACE INTO fingerprints (sample_id, content_hash, signature) VALUES (?, ?, ?)',
+                     (sample_id, fp.content_hash, fp.signature.tobytes()))
+        conn.execute('DELETE FROM fp_bands WHERE sample_id = ?', (sample_id,))
+        conn.executemany('INSERT INTO fp_bands (band_key, sample_id) VALUES (?, ?)',
+                         [(b, sample_id) for b in fp.bands])
+
+    def add(self, sample_id, fp):
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            self._insert(conn, sample_id, fp)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def check_and_add(self, sample_id, fp):
+        """
+        Look fp up and register it unless it is an exact duplicate (near duplicates are
+        registered too, so later copies still match them). The near-duplicate search runs
+        before the write lock; under it only the exact-hash check is repeated, so concurrent
+        uploads of the same content still register once.
+        Returns:
+            The lookup() match, or None for a new sample.
+        """
+        conn = self._conn()
+        match = self.lookup(fp)
+        if match is not None and match[0] == 'exact':
+            return match
+        conn.execute('BEGIN IMMEDIATE')  # serializes concurrent uploads across workers
+        try:
+            match = self._exact(conn, fp) or match
+            if match is None or match[0] == 'near':
+                self._insert(conn, sample_id, fp)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return match
+
+    def remove(self, sample_id):
+        conn = self._conn()
+        conn.execute('DELETE FROM fingerprints WHERE sample_id = ?', (sample_id,))
+        conn.execute('DELETE FROM fp_bands WHERE sample_id = ?', (sample_id,))
+
+    def sample_ids(self):
+        return {row[0] for row in self._conn().execute('SELECT sample_id FROM fingerprints')}
+
+    def add_many(self, items):
+        """Register (sample_id, fp) pairs in one transaction."""
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for sample_id, fp in items:
+                self._insert(conn, sample_id, fp)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+
+BACKFILL_BATCH = 256
+
+
+def backfill(index, data_root, stop=None):
+    """
+    Add every <label>/<stem>.json under data_root that the index does not know yet
+    (sample ids as the server assigns them), committing every BACKFILL_BATCH samples.
+    Args:
+        stop: Optional threading.Event; the backfill returns early once it is set
+    Returns:
+        Number of samples added.
+    """
+    from glob import glob
+    known = index.sample_ids()
+    added, batch = 0, []
+    for jf in sorted(glob(os.path.join(data_root, '*', '*.json'))):
+        if stop is not None and stop.is_set():
+            break
+        sample_id = f'{os.path.basename(os.path.dirname(jf))}/{os.path.splitext(os.path.basename(jf))[0]}'
+        if sample_id in known:
+            continue
+        try:
+            fp = fingerprint_file(jf)
+        except (OSError, ValueError, KeyError, TypeError):
+            fp = None
+        if fp is not None:
+            batch.append((sample_id, fp))
+        if len(batch) >= BACKFILL_BATCH:
+            index.add_many(batch)
+            added += len(batch)
+            batch = []
+    if batch:
+        index.add_many(batch)
+        added += len(batch)
+    return added
+
+# ---------- Batch Dedupe ----------
+
+def _cached_fingerprint(jf, cache, fresh):
+    """fingerprint_file(jf) unless cache holds it for the file's current size and mtime."""
+    st = os.stat(jf)
+    key = os.path.abspath(jf)
+    entry = cache.get(key) if cache is not None else None
+    if entry is None or entry['size'] != st.st_size or entry['mtime'] != st.st_mtime:
+        fp = fingerprint_file(jf)
+        entry = {'size': st.st_size, 'mtime': st.st_mtime, 'content_hash': fp and fp.content_hash,
+                 'signature': fp and base64.b64encode(fp.signature.tobytes()).decode('ascii')}
+    elif entry['content_hash'] is None:
+        fp = None
+    else:
+        sig = np.frombuffer(base64.b64decode(entry['signature']), dtype=np.float32).reshape(-1, 2)
+        fp = Fingerprint(entry['content_hash'], sig, _bands(sig))
+    fresh[key] = entry
+    return fp
+
+
+def dedupe_report(json_files, near=True, near_threshold=NEAR_THRESHOLD, cache=None):
+    """
+    Group duplicate samples; the first file (in the given order) of each group is kept.
+    Args:
+        near: Also group near duplicates (LSH candidates within near_threshold)
+        cache: Optional JSON-serializable dict of fingerprints from an earlier run, keyed by
+            absolute path; unchanged files (size + mtime) are not re-read. It is updated in
+            place to hold exactly the given files.
+    Returns:
+        (kept, duplicates): kept file paths, and a list of
+        {'path', 'duplicate_of', 'kind': 'exact'|'near', 'distance'} entries.
+    """
+    index = FingerprintIndex(':memory:', near_threshold=near_threshold)
+    kept, duplicates, fresh = [], [], {}
+    for jf in json_files:
+        try:
+            fp = _cached_fingerprint(jf, cache, fresh)
+        except (OSError, ValueError, KeyError, TypeError):
+            fp = None
+        if fp is None:
+            kept.append(jf)
+            continue
+        match = index.lookup(fp)
+        if match is not None and (near or match[0] == 'exact'):
+            duplicates.append({'path': jf, 'duplicate_of': match[1], 'kind': match[0], 'distance': match[2]})
+            continue
+        index.add(jf, fp)
+        kept.append(jf)
+    if cache is not None:
+        cache.clear()
+        cache.update(fresh)
+    return kept, duplicates
+
+# CLI: dedupe report
+if __name__ == '__main__':
+    import sys
+    from glob import glob
+    if len(sys.argv) >= 3 and sys.argv[1] == '--backfill':
+        # python fingerprint.py --backfill <data_dir> [--db index.sqlite]
+        db = sys.argv[sys.argv.index('--db') + 1] if '--db' in sys.argv else os.path.join(sys.argv[2], 'fingerprints.sqlite')
+        print(f'Added {backfill(FingerprintIndex(db), sys.argv[2])} samples to {db}')
+    elif len(sys.argv) < 2:
+        print('Usage: python fingerprint.py <data_dir> [--exact-only] [--out report.json]')
+        print('       python fingerprint.py --backfill <data_dir> [--db index.sqlite]')
+    else:
+        files = sorted(glob(os.path.join(sys.argv[1], '*', '*.json')))
+        kept, duplicates = dedupe_report(files, near='--exact-only' not in sys.argv)
+        for d in duplicates:
+            print(f"{d['kind']:5s} {d['path']} -> {d['duplicate_of']} ({d['distance']:.4f})")
+        print(f'{len(files)} samples, {len(duplicates)} duplicates, {len(kept)} kept')
+        if '--out' in sys.argv:
+            with open(sys.argv[sys.argv.index('--out') + 1], 'w', encoding='utf-8') as f:
+                json.dump({'kept': kept, 'duplicates': duplicates}, f, indent=2)
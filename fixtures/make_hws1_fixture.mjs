@@ -0,0 +1,39 @@
+// make_hws1_fixture.mjs
+// Builds the HWS1 fixture used by test_stroke_codec.py from a corpus sample, with the
+// browser-side code in stroke_recorder.js:
+//   <name>.json  the sample as getSample() returns it (derived fields from derivePoint)
+//   <name>.hws   encodeSampleBinary() of that sample
+// Run from the repo root: node fixtures/make_hws1_fixture.mjs [handwriting_data/A/20250704_222004.json]
+
+import { readFileSync, writeFileSync } from 'fs';
+import { basename, dirname, join } from 'path';
+import { fileURLToPath } from 'url';
+import { encodeSampleBinary, derivePoint } from '../stroke_recorder.js';
+
+const here = dirname(fileURLToPath(import.meta.url));
+const src = process.argv[2] || join(here, '..', 'handwriting_data', 'A', '20250704_222004.json');
+const data = JSON.parse(readFileSync(src, 'utf8'));
+
+const sample = {
+  label: data.label,
+  device: 'fixture',
+  timestamp: data.timestamp,
+  sampling_rate: null,
+  time_unit: 'ms',
+  strokes: data.strokes.map(s => ({
+    stroke_id: s.stroke_id,
+    points: s.points.map((pt, i, pts) => {
+      const { dx, dy, velocity, curvature } = derivePoint(i > 1 ? pts[i - 2] : null, i > 0 ? pts[i - 1] : null, pt);
+      return {
+        x: pt.x, y: pt.y, t: pt.t, p: pt.p, tiltX: pt.tiltX, tiltY: pt.tiltY,
+        azimuth: pt.azimuth, altitude: pt.altitude, pointerType: pt.pointerType,
+        dx, dy, velocity, curvature, pen_down: pt.pen_down
+      };
+    })
+  }))
+};
+
+const name = `hws1_${data.label}_${basename(src, '.json')}`;
+writeFileSync(join(here, `${name}.json`), JSON.stringify(sample, null, 2) + '\n');
+writeFileSync(join(here, `${name}.hws`), encodeSampleBinary(sample));
+console.log(`wrote fixtures/${name}.json and fixtures/${name}.hws`);
@@ -1,6 +1,20 @@
 // handwriting_ui.js
 // Full modular handwriting UI: drawing, stroke recording, PNG+JSON saving, status updates
 
+// Persistent per-browser device id: the server derives sample ids from (label, device, timestamp),
+// so the JSON and PNG uploads of a sample pair up and two tablets never collide
+function getDeviceId() {
+  const key = 'hws_device_id';
+  let id = null;
+  try { id = localStorage.getItem(key); } catch (e) { /* storage disabled */ }
+  if (!id) {
+    id = 'tablet-' + (crypto.randomUUID ? crypto.randomUUID()
+      : Array.from(crypto.getRandomValues(new Uint8Array(16)), b => b.toString(16).padStart(2, '0')).join(''));
+    try { localStorage.setItem(key, id); } catch (e) { /* id lasts for this page only */ }
+  }
+  return id;
+}
+
 class StrokeRecorder {
   constructor(canvas) {
     this.canvas = canvas;
@@ -45,6 +59,7 @@ class StrokeRecorder {
   getData(label) {
     return {
       label,
+      device: getDeviceId(),
       timestamp: new Date().toISOString(),
       strokes: this.strokes.map((points, i) => ({
         stroke_id: i + 1,
@@ -120,6 +135,7 @@ class HandwritingUI {
         form.append('file', pngBlob, `${label}.png`);
         form.append('label', label);
         form.append('timestamp', jsonData.timestamp);
+        form.append('device', jsonData.device);
         return form;
       })()
     });
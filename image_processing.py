@@ -5,48 +5,152 @@
 from PIL import Image, ImageOps
 import numpy as np
 import os
+from concurrent.futures import ProcessPoolExecutor
+from metrics import stage_timer, pool_map
 
-def process_image(png_path, invert=False, save_path=None):
+IMAGE_SIZE = 256
+INK_THRESHOLD = 250  # pixels darker than this count as ink
+
+
+def load_gray(png_path, flatten_alpha=False):
     """
-    Standardize a PNG: grayscale, crop to bbox, pad to square, resize to 256x256, optionally invert.
-    Args:
-        png_path: Path to input PNG.
-        invert: If True, invert image (black ink on white).
-        save_path: If provided, save to this path; else overwrite input.
+    Open a PNG as grayscale with Pillow's plain convert('L'), which drops alpha, as before.
+    flatten_alpha=True composites transparent areas onto white paper first (opt-in: it changes
+    the output for transparent PNGs; the corpus PNGs are opaque, so they are unaffected).
+    """
+    img = Image.open(png_path)
+    if flatten_alpha and (img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info)):
+        img = img.convert('RGBA')
+        bg = Image.new('RGBA', img.size, (255, 255, 255, 255))
+        img = Image.alpha_composite(bg, img)
+    return img.convert('L')
+
+
+def ink_bbox(arr, threshold=INK_THRESHOLD):
+    """
+    Bounding box (x0, y0, x1, y1) of ink pixels, from row / column any() projections.
+    Returns the full image box if there is no ink.
+    """
+    mask = arr < threshold
+    rows = mask.any(axis=1)
+    cols = mask.any(axis=0)
+    if not rows.any():
+        return (0, 0, arr.shape[1], arr.shape[0])
+    y0 = int(rows.argmax())
+    y1 = len(rows) - int(rows[::-1].argmax())
+    x0 = int(cols.argmax())
+    x1 = len(cols) - int(cols[::-1].argmax())
+    return (x0, y0, x1, y1)
+
+
+def standardize(img, size=IMAGE_SIZE, invert=False):
+    """
+    Crop a grayscale image to its ink, pad to square (white), resize to size x size.
     Returns:
-        Path to processed image.
+        Standardized PIL image (mode 'L').
     """
-    img = Image.open(png_path).convert('L')  # Grayscale
-    arr = np.array(img)
-    # Crop to bounding box (non-white)
-    mask = arr < 250  # threshold for ink
-    coords = np.argwhere(mask)
-    if coords.size == 0:
-        bbox = (0, 0, img.width, img.height)
-    else:
-        y0, x0 = coords.min(axis=0)
-        y1, x1 = coords.max(axis=0) + 1
-        bbox = (x0, y0, x1, y1)
-    img_cropped = img.crop(bbox)
+    img_cropped = img.crop(ink_bbox(np.asarray(img)))
     # Pad to square
     max_side = max(img_cropped.width, img_cropped.height)
     new_img = Image.new('L', (max_side, max_side), 255)
     offset = ((max_side - img_cropped.width) // 2, (max_side - img_cropped.height) // 2)
     new_img.paste(img_cropped, offset)
-    # Resize to 256x256
-    img_resized = new_img.resize((256, 256), Image.LANCZOS)
-    # Optional invert
+    img_resized = new_img.resize((size, size), Image.LANCZOS)
     if invert:
         img_resized = ImageOps.invert(img_resized)
-    # Save
+    return img_resized
+
+
+def process_image(png_path, invert=False, save_path=None, flatten_alpha=False):
+    """
+    Standardize a PNG: grayscale, crop to bbox, pad to square, resize to 256x256, optionally invert.
+    Args:
+        png_path: Path to input PNG.
+        invert: If True, invert image (black ink on white).
+        save_path: If provided, save to this path; else overwrite input.
+        flatten_alpha: Composite transparency onto white before converting (see load_gray).
+    Returns:
+        Path to processed image.
+    """
+    with stage_timer('image.load'):
+        img = load_gray(png_path, flatten_alpha=flatten_alpha)
+    with stage_timer('image.standardize'):
+        img_resized = standardize(img, invert=invert)
     out_path = save_path or png_path
-    img_resized.save(out_path)
+    with stage_timer('image.save'):
+        img_resized.save(out_path)
     return out_path
 
+# ---------- Batch Processing ----------
+
+def collect_pngs(source):
+    """A directory (searched recursively, sorted) or a list of PNG paths."""
+    if isinstance(source, str) and os.path.isdir(source):
+        found = []
+        for root, _, files in os.walk(source):
+            found.extend(os.path.join(root, f) for f in files if f.lower().endswith('.png'))
+        return sorted(found)
+    if isinstance(source, str):
+        return [source]
+    return list(source)
+
+
+def _standardize_file(args):
+    png_path, size, invert, flatten_alpha = args
+    with stage_timer('image.load'):
+        img = load_gray(png_path, flatten_alpha=flatten_alpha)
+    with stage_timer('image.standardize'):
+        return np.asarray(standardize(img, size=size, invert=invert), dtype=np.uint8)
+
+
+def process_batch(source, out_path=None, size=IMAGE_SIZE, invert=False, workers=None, chunksize=16,
+                  flatten_alpha=False):
+    """
+    Standardize many PNGs into one stacked tensor. Inputs are never modified.
+    Args:
+        source: Directory of PNGs (e.g. handwriting_data/A) or list of paths
+        out_path: If set, results are written into a memory-mapped .npy at this path
+        workers: Process pool size (None = CPU count, 0 = run in this process)
+        flatten_alpha: Composite transparency onto white before converting (see load_gray)
+    Returns:
+        (images, paths): uint8 (N, size, size) array (np.memmap when out_path is set)
+        and the input paths in row order.
+    """
+    paths = collect_pngs(source)
+    shape = (len(paths), size, size)
+    if out_path:
+        folder = os.path.dirname(out_path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        images = np.lib.format.open_memmap(out_path, mode='w+', dtype=np.uint8, shape=shape)
+    else:
+        images = np.empty(shape, dtype=np.uint8)
+    jobs = [(p, size, invert, flatten_alpha) for p in paths]
+    if workers == 0 or len(paths) <= 1:
+        results = map(_standardize_file, jobs)
+        for i, arr in enumerate(results):
+            images[i] = arr
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            for i, arr in enumerate(pool_map(ex, _standardize_file, jobs, chunksize=chunksize)):
+                images[i] = arr
+    if out_path:
+        images.flush()
+    return images, paths
+
 # Stub for backend integration
 if __name__ == '__main__':
     import sys
-    if len(sys.argv) < 2:
-        print('Usage: python image_processing.py <png_path> [--invert]')
+    if len(sys.argv) >= 4 and sys.argv[1] == '--batch':
+        # python image_processing.py --batch <png_dir> <out.npy> [--invert] [--workers N] [--flatten-alpha]
+        workers = int(sys.argv[sys.argv.index('--workers') + 1]) if '--workers' in sys.argv else None
+        images, paths = process_batch(sys.argv[2], out_path=sys.argv[3], invert='--invert' in sys.argv, workers=workers,
+                                      flatten_alpha='--flatten-alpha' in sys.argv)
+        with open(os.path.splitext(sys.argv[3])[0] + '.paths.txt', 'w', encoding='utf-8') as f:
+            f.write('\n'.join(paths) + '\n')
+        print(f'Wrote {images.shape} to {sys.argv[3]}')
+    elif len(sys.argv) < 2:
+        print('Usage: python image_processing.py <png_path> [--invert] [--flatten-alpha]')
+        print('       python image_processing.py --batch <png_dir> <out.npy> [--invert] [--workers N] [--flatten-alpha]')
     else:
-        process_image(sys.argv[1], invert='--invert' in sys.argv) 
\ No newline at end of file
+        process_image(sys.argv[1], invert='--invert' in sys.argv, flatten_alpha='--flatten-alpha' in sys.argv)
@@ -0,0 +1,316 @@
+# ingest_pipeline.py
+# MODULE 16: Ingest Pipeline
+# Moves disk writes and post-processing off the FastAPI event loop.
+# Handlers validate and enqueue; background workers write files (batched fsync),
+# append metadata, and hand rendering / image standardization to a process pool.
+# Failures are handled per job: the rest of a batch is still written, the failed job is
+# retried from the step it stopped at, then dead-lettered (payload + error) for replay.
+
+import os
+import json
+import asyncio
+import threading
+import logging
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from metadata_tracker import append_metadata
+from stroke_codec import to_json_sample
+from metrics import REGISTRY, stage_timer, call_collected, inc
+
+log = logging.getLogger('ingest')
+
+QUEUE_SIZE = 256
+WORKERS = 4
+BATCH_SIZE = 32
+RETRIES = 2
+RETRY_DELAY = 0.5  # seconds, multiplied by the attempt number
+
+REGISTRY.describe('hws_ingest_jobs_total', 'counter', 'Ingest jobs by outcome (queued, written, retried, failed, rejected)')
+REGISTRY.describe('hws_ingest_batch_size', 'histogram', 'Jobs persisted per I/O batch', (1, 2, 4, 8, 16, 32, 64))
+REGISTRY.describe('hws_postprocess_failures_total', 'counter', 'Failed background renders / PNG standardizations')
+
+
+class QueueFull(Exception):
+    """Raised by submit() when the ingest queue is at capacity (HTTP 429)."""
+
+
+class ShuttingDown(Exception):
+    """Raised by submit() once drain() has started (HTTP 503)."""
+
+
+# ---------- Post-processing (run in worker processes) ----------
+
+def render_sample(json_path, out_path, render_kwargs):
+    import cairo_renderer  # needs pycairo; imported lazily so ingest works without it
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    cairo_renderer.render_strokes_to_png(json_path, out_path, **render_kwargs)
+    return out_path
+
+
+def standardize_png(png_path, out_path):
+    from image_processing import process_image
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    return process_image(png_path, save_path=out_path)
+
+
+# ---------- Disk writes (run in I/O threads) ----------
+
+def write_files(items):
+    """
+    Write (path, bytes) pairs via temp file + rename, then fsync every file and
+    parent directory once for the whole batch. Temp names are unique per process and
+    thread, so concurrent server workers never share a partially written file.
+    """
+    suffix = f'.{os.getpid()}.{threading.get_ident()}.tmp'
+    handles = []
+    try:
+        # A path queued twice in one batch (a re-upload) is written once, last payload wins
+        for path, payload in dict(items).items():
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            f = open(path + suffix, 'wb')
+            handles.append((f, path))
+            f.write(payload)
+        for f, _ in handles:
+            f.flush()
+            os.fsync(f.fileno())
+    finally:
+        for f, _ in handles:
+            f.close()
+    for _, path in handles:
+        os.replace(path + suffix, path)
+    if hasattr(os, 'O_DIRECTORY'):
+        for folder in {os.path.dirname(path) for _, path in handles}:
+            fd = os.open(folder, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+
+class IngestPipeline:
+    """
+    Bounded queue + background workers for sample ingest.
+    Args:
+        meta_file: Metadata store path (Module 7)
+        shard_writer: Optional shard_store.ShardWriter mirror (Module 14)
+        render_root: If set, each JSON is re-rendered to render_root/<label>/<stem>.png
+        processed_root: If set, each PNG is standardized to processed_root/<label>/<stem>.png
+        render_kwargs: Passed to cairo_renderer.render_strokes_to_png
+        cpu_workers: Process pool size for rendering / image processing
+        retries: Extra attempts for a job that failed to persist
+        dead_letter_root: If set, jobs that still fail are saved to dead_letter_root/<label>/
+            (payload plus <name>.error.json with the metadata entry and the error)
+    """
+
+    def __init__(self, meta_file, shard_writer=None, render_root=None, processed_root=None,
+                 render_kwargs=None, queue_size=QUEUE_SIZE, workers=WORKERS, batch_size=BATCH_SIZE,
+                 cpu_workers=1, retries=RETRIES, dead_letter_root=None):
+        self.meta_file = meta_file
+        self.shard_writer = shard_writer
+        self.render_root = render_root
+        self.processed_root = processed_root
+        self.render_kwargs = render_kwargs or {}
+        self.queue_size = queue_size
+        self.workers = workers
+        self.batch_size = batch_size
+        self.cpu_workers = cpu_workers
+        self.retries = retries
+        self.dead_letter_root = dead_letter_root
+        self.queue = None
+        self.stats = {'queued': 0, 'written': 0, 'retried': 0, 'failed': 0, 'rejected': 0}
+        self._tasks = []
+        self._io_pool = None
+        self._cpu_pool = None
+        self._closing = False
+
+    # ----- lifecycle -----
+
+    async def start(self):
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self._io_pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='ingest-io')
+        if self.render_root or self.processed_root:
+            # spawn, not fork: the I/O threads and the event loop may hold the logging / REGISTRY
+            # locks at fork time, which would deadlock the child
+            self._cpu_pool = ProcessPoolExecutor(max_workers=self.cpu_workers,
+                                                 mp_context=multiprocessing.get_context('spawn'))
+        self._closing = False
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def drain(self):
+        """Stop accepting work, finish everything queued, then stop the workers."""
+        self._closing = True
+        if self.queue is not None:
+            await self.queue.join()
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._io_pool:
+            self._io_pool.shutdown(wait=True)
+        if self._cpu_pool:
+            self._cpu_pool.shutdown(wait=True)
+
+    @property
+    def depth(self):
+        return self.queue.qsize() if self.queue is not None else 0
+
+    # ----- submission -----
+
+    def submit(self, job):
+        """
+        Enqueue a job without blocking.
+        job: dict with kind ('json' or 'png'), path, payload (bytes) and metadata entry ('meta').
+             JSON jobs carry the parsed sample as 'data' (or an HWS1 decode as 'decoded')
+             and are serialized by the I/O threads, off the event loop.
+        """
+        if self._closing or self.queue is None:
+            raise ShuttingDown()
+        try:
+            self.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.stats['rejected'] += 1
+            inc('hws_ingest_jobs_total', state='rejected')
+            raise QueueFull()
+        self.stats['queued'] += 1
+        inc('hws_ingest_jobs_total', state='queued')
+
+    async def submit_wait(self, job):
+        """Like submit(), but waits for queue space instead of raising QueueFull (bulk uploads)."""
+        if self._closing or self.queue is None:
+            raise ShuttingDown()
+        await self.queue.put(job)
+        self.stats['queued'] += 1
+        inc('hws_ingest_jobs_total', state='queued')
+
+    def submit_json(self, data, json_path, meta):
+        self.submit({'kind': 'json', 'path': json_path, 'data': data, 'meta': meta})
+
+    def submit_binary(self, decoded, json_path, meta):
+        """Enqueue a stroke_codec.decode_sample() result; stored as the usual JSON file."""
+        self.submit({'kind': 'json', 'path': json_path, 'decoded': decoded, 'meta': meta})
+
+    def submit_png(self, content, png_path, meta):
+        self.submit({'kind': 'png', 'path': png_path, 'payload': content, 'meta': meta})
+
+    # ----- workers -----
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < self.batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            pending = batch
+            try:
+                for attempt in range(self.retries + 1):
+                    if attempt:
+                        self.stats['retried'] += len(pending)
+                        inc('hws_ingest_jobs_total', len(pending), state='retried')
+                        await asyncio.sleep(RETRY_DELAY * attempt)
+                    failed = await loop.run_in_executor(self._io_pool, self._persist, pending)
+                    written = [job for job in pending if id(job) not in failed]
+                    self.stats['written'] += len(written)
+                    inc('hws_ingest_jobs_total', len(written), state='written')
+                    pending = [job for job in pending if id(job) in failed]
+                    await asyncio.gather(*[self._postprocess(loop, job) for job in written])
+                    if not pending:
+                        break
+                for job in pending:
+                    await loop.run_in_executor(self._io_pool, self._dead_letter, job, failed[id(job)])
+            except Exception:
+                log.exception('Ingest worker failed on a batch of %d', len(batch))
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def _persist(self, batch):
+        """
+        Write a batch of jobs; one bad job never fails the others.
+        Each job records the steps it completed in job['done'], so a retry resumes where it stopped
+        (the metadata row and the shard record are appended once).
+        Returns:
+            {id(job): exception} for the jobs that failed.
+        """
+        REGISTRY.observe('hws_ingest_batch_size', len(batch))
+        failed = {}
+
+        def step(name, jobs, fn):
+            for job in jobs:
+                if id(job) in failed or name in job['done']:
+                    continue
+                try:
+                    fn(job)
+                    job['done'].add(name)
+                except Exception as e:
+                    failed[id(job)] = e
+                    log.warning('Ingest %s failed for %s: %s', name, job['path'], e)
+
+        for job in batch:
+            job.setdefault('done', set())
+        with stage_timer('ingest.serialize'):
+            step('serialize', [job for job in batch if job['kind'] == 'json'], self._serialize)
+        with stage_timer('ingest.write'):
+            todo = [job for job in batch if id(job) not in failed and 'write' not in job['done']]
+            try:
+                write_files([(job['path'], job['payload']) for job in todo])
+                for job in todo:
+                    job['done'].add('write')
+            except Exception:
+                # Isolate the failing file; the rest are still written (one fsync each)
+                step('write', todo, lambda job: write_files([(job['path'], job['payload'])]))
+        with stage_timer('ingest.metadata'):
+            step('metadata', batch, lambda job: append_metadata(self.meta_file, job['meta']))
+        if self.shard_writer is not None:
+            with stage_timer('ingest.shard'):
+                step('shard', [job for job in batch if job['kind'] == 'json'],
+                     lambda job: self.shard_writer.append(
+                         job['data'], sample_id=os.path.splitext(os.path.basename(job['path']))[0]))
+        return failed
+
+    @staticmethod
+    def _serialize(job):
+        if 'payload' in job:
+            return
+        if 'data' not in job:
+            job['data'] = to_json_sample(job['decoded'])
+        job['payload'] = json.dumps(job['data'], ensure_ascii=False, indent=2).encode('utf-8')
+
+    def _dead_letter(self, job, error):
+        """Give up on a job: count it, log it and keep what we have of it for replay."""
+        self.stats['failed'] += 1
+        inc('hws_ingest_jobs_total', state='failed')
+        log.error('Ingest failed for %s after %d attempts: %r', job['path'], self.retries + 1, error)
+        if not self.dead_letter_root:
+            return
+        folder = os.path.join(self.dead_letter_root, os.path.basename(os.path.dirname(job['path'])))
+        name = os.path.basename(job['path'])
+        record = {'path': job['path'], 'kind': job['kind'], 'meta': job['meta'], 'error': repr(error),
+                  'done': sorted(job['done'])}
+        items = [(os.path.join(folder, name + '.error.json'), json.dumps(record, indent=2, default=str).encode('utf-8'))]
+        if 'payload' in job:
+            items.append((os.path.join(folder, name), job['payload']))
+        try:
+            write_files(items)
+        except Exception:
+            log.exception('Could not dead-letter %s', job['path'])
+
+    async def _postprocess(self, loop, job):
+        if self._cpu_pool is None:
+            return
+        rel = os.path.join(os.path.basename(os.path.dirname(job['path'])),
+                           os.path.splitext(os.path.basename(job['path']))[0] + '.png')
+        try:
+            # call_collected brings the worker's stage timings (render.*, image.*) back here
+            if job['kind'] == 'json' and self.render_root:
+                _, snapshot = await loop.run_in_executor(self._cpu_pool, call_collected, render_sample, job['path'],
+                                                         os.path.join(self.render_root, rel), self.render_kwargs)
+                REGISTRY.merge(snapshot)
+            elif job['kind'] == 'png' and self.processed_root:
+                _, snapshot = await loop.run_in_executor(self._cpu_pool, call_collected, standardize_png, job['path'],
+                                                         os.path.join(self.processed_root, rel))
+                REGISTRY.merge(snapshot)
+        except Exception as e:
+            # Post-processing can be redone offline (cairo_renderer --batch); never lose the sample for it
+            inc('hws_postprocess_failures_total', kind=job['kind'])
+            log.warning('Post-processing failed for %s: %s', job['path'], e)
@@ -1,57 +1,294 @@
 # joint_analysis.py
 # MODULE 11: Joint Analysis Engine
 # Detects how letters join: spacing, stroke direction, continuation.
+# Join features are computed as columnar arrays, per sample or across a whole dataset.
+# Times are milliseconds (stroke_processing.TIME_UNIT): samples recorded in seconds are
+# converted when loaded, so time_gap is comparable across the corpus.
 
 import json
 import numpy as np
 import os
+from glob import glob
+from concurrent.futures import ProcessPoolExecutor
+from metrics import stage_timer, pool_map
+from stroke_processing import time_scale, interval_time_scale
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+CONTINUOUS_SPACING = 10  # max gap (px) for a pen-down join to count as continuous
+JOIN_FEATURES = ['spacing', 'time_gap', 'dir_diff', 'dir_turn']
+# Histogram bin edges per feature (shared by all labels so histograms are comparable)
+HIST_BINS = {
+    'spacing': np.linspace(0, 400, 41),
+    'time_gap': np.linspace(0, 2000, 41),  # ms
+    'dir_diff': np.linspace(0, 2 * np.pi, 73),
+    'dir_turn': np.linspace(0, np.pi, 37),
+}
+
+# ---------- Per-sample Join Table ----------
+
+def _stroke_rows(strokes, rows):
+    """
+    Append one endpoint row per stroke: size, first two and last two points (xy),
+    start / end t and start / end pen_down. Loops over strokes, never over points.
+    """
+    for s in strokes:
+        pts = s.get('points', [])
+        if not pts:
+            rows.append((0,) + (0.0,) * 12)
+            continue
+        a, b = pts[0], pts[min(1, len(pts) - 1)]
+        c, d = pts[max(len(pts) - 2, 0)], pts[-1]
+        rows.append((len(pts), a['x'], a['y'], b['x'], b['y'], c['x'], c['y'], d['x'], d['y'],
+                     a.get('t') or 0.0, d.get('t') or 0.0,
+                     bool(a.get('pen_down', True)), bool(d.get('pen_down', True))))
+
+
+def _sample_rows(data, rows):
+    """
+    _stroke_rows for one sample with start / end t in milliseconds: scaled by the declared
+    time_unit, else by the unit its mean point interval per stroke implies.
+    """
+    start = len(rows)
+    _stroke_rows(data.get('strokes', []), rows)
+    if data.get('time_unit') is not None:
+        scale = time_scale([], data['time_unit'])
+    else:
+        scale = interval_time_scale([(r[10] - r[9]) / (r[0] - 1) for r in rows[start:] if r[0] >= 2])
+    if scale != 1.0:
+        rows[start:] = [r[:9] + (r[9] * scale, r[10] * scale) + r[11:] for r in rows[start:]]
+
+
+def _join_columns(rows, sample, stroke_no):
+    """
+    Join features for consecutive strokes of the same sample, for any number of samples at once.
+    Args:
+        rows: _stroke_rows() output
+        sample / stroke_no: Per-row sample index and 1-based stroke number
+    """
+    if len(rows) < 2:
+        return _empty_table(), np.zeros(0, np.int64)
+    r = np.array(rows, dtype=np.float64)
+    size = r[:, 0]
+    # Single-point strokes have no direction
+    dir_in = np.where(size >= 2, np.arctan2(r[:, 4] - r[:, 2], r[:, 3] - r[:, 1]), 0.0)
+    dir_out = np.where(size >= 2, np.arctan2(r[:, 8] - r[:, 6], r[:, 7] - r[:, 5]), 0.0)
+    # Pairs (i, i + 1) inside one sample where neither stroke is empty
+    idx = np.nonzero((sample[:-1] == sample[1:]) & (size[:-1] > 0) & (size[1:] > 0))[0]
+    nxt = idx + 1
+    spacing = np.hypot(r[nxt, 1] - r[idx, 7], r[nxt, 2] - r[idx, 8])
+    diff = np.abs(dir_in[nxt] - dir_out[idx])
+    pen_lifted = ~((r[idx, 12] > 0) & (r[nxt, 11] > 0))
+    table = {
+        'from_stroke': stroke_no[idx].astype(np.int32),
+        'spacing': spacing.astype(np.float32),
+        'time_gap': (r[nxt, 9] - r[idx, 10]).astype(np.float32),
+        'dir_diff': diff.astype(np.float32),
+        'dir_turn': np.minimum(diff, 2 * np.pi - diff).astype(np.float32),
+        'pen_lifted': pen_lifted,
+        'continuous': ~pen_lifted & (spacing < CONTINUOUS_SPACING),
+    }
+    return table, sample[idx]
+
+
+def join_table(data):
+    """
+    Join features between consecutive strokes of one sample, as columns.
+    Pairs where either stroke is empty are skipped.
+    Returns:
+        Dict of equal-length arrays: from_stroke (1-based), spacing, time_gap (ms),
+        dir_diff (radians, |in - out| in [0, 2pi] as the original per-join loop reported it),
+        dir_turn (the same turn wrapped to [0, pi]), pen_lifted, continuous.
+    """
+    rows = []
+    _sample_rows(data, rows)
+    n = len(rows)
+    return _join_columns(rows, np.zeros(n, np.int64), np.arange(1, n + 1))[0]
+
+
+def _empty_table():
+    return {
+        'from_stroke': np.zeros(0, np.int32),
+        'spacing': np.zeros(0, np.float32),
+        'time_gap': np.zeros(0, np.float32),
+        'dir_diff': np.zeros(0, np.float32),
+        'dir_turn': np.zeros(0, np.float32),
+        'pen_lifted': np.zeros(0, bool),
+        'continuous': np.zeros(0, bool),
+    }
+
 
 def analyze_joins(json_path):
     """
     Analyze stroke joins in a handwriting sample JSON.
     Returns a list of join features between strokes.
     """
-    with open(json_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    strokes = data['strokes']
-    joins = []
-    for i in range(len(strokes) - 1):
-        s1 = strokes[i]['points']
-        s2 = strokes[i+1]['points']
-        if not s1 or not s2:
-            continue
-        end1 = s1[-1]
-        start2 = s2[0]
-        # Spacing (Euclidean distance)
-        spacing = np.hypot(start2['x'] - end1['x'], start2['y'] - end1['y'])
-        # Time gap
-        time_gap = start2['t'] - end1['t']
-        # Direction (angle between last segment of s1 and first of s2)
-        def angle(p0, p1):
-            return np.arctan2(p1['y'] - p0['y'], p1['x'] - p0['x'])
-        dir1 = angle(s1[-2], s1[-1]) if len(s1) > 1 else 0
-        dir2 = angle(s2[0], s2[1]) if len(s2) > 1 else 0
-        dir_diff = np.abs(dir2 - dir1)
-        # Continuation (was pen lifted?)
-        pen_lifted = not (end1.get('pen_down', True) and start2.get('pen_down', True))
-        # Stub: advanced join type detection
-        join_type = 'continuous' if not pen_lifted and spacing < 10 else 'lifted'
-        joins.append({
-            'from_stroke': i+1,
-            'to_stroke': i+2,
-            'spacing': spacing,
-            'time_gap': time_gap,
-            'dir_diff': dir_diff,
-            'pen_lifted': pen_lifted,
-            'join_type': join_type
-        })
-    return joins
+    with stage_timer('joins.parse'):
+        with open(json_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    with stage_timer('joins.features'):
+        table = join_table(data)
+    return [{
+        'from_stroke': int(i),
+        'to_stroke': int(i) + 1,
+        'spacing': float(sp),
+        'time_gap': float(tg),
+        'dir_diff': float(dd),
+        'dir_turn': float(dt),
+        'pen_lifted': bool(pl),
+        'join_type': 'continuous' if c else 'lifted',
+    } for i, sp, tg, dd, dt, pl, c in zip(*(table[k] for k in
+        ('from_stroke', 'spacing', 'time_gap', 'dir_diff', 'dir_turn', 'pen_lifted', 'continuous')))]
+
+# ---------- Dataset Engine ----------
+
+def collect_samples(data_root, label=None):
+    """Sorted JSON paths under data_root/<label>/ (one label or all)."""
+    return sorted(glob(os.path.join(data_root, label or '*', '*.json')))
+
+
+def _analyze_chunk(paths):
+    """Join table for a list of files (one vectorized pass) and the chunk-local sample of each join."""
+    rows, sample, stroke_no = [], [], []
+    with stage_timer('joins.parse'):
+        for k, path in enumerate(paths):
+            start = len(rows)
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    _sample_rows(json.load(f), rows)
+            except (OSError, ValueError, KeyError, TypeError, AttributeError):
+                del rows[start:]
+            sample.extend([k] * (len(rows) - start))
+            stroke_no.extend(range(1, len(rows) - start + 1))
+    with stage_timer('joins.features'):
+        return _join_columns(rows, np.array(sample, np.int64), np.array(stroke_no, np.int64))
+
+
+def analyze_dataset(data_root, label=None, workers=None, chunk_size=256):
+    """
+    Compute join features for every sample under data_root (or one label) across a process pool.
+    Args:
+        data_root: handwriting_data root (<label>/<sample>.json)
+        label: Restrict to one label
+        workers: Process count (None = CPU count, 0 = run in this process)
+    Returns:
+        Columnar table (dict of equal-length arrays, one row per join) with the
+        join_table() columns plus sample (int32 row into 'samples') and label_id
+        (int16 row into 'label_names'); 'samples' and 'label_names' hold the lookups.
+    """
+    paths = collect_samples(data_root, label)
+    chunks = [paths[i:i + chunk_size] for i in range(0, len(paths), chunk_size)]
+    if workers == 0 or len(chunks) <= 1:
+        results = list(map(_analyze_chunk, chunks))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            results = list(pool_map(ex, _analyze_chunk, chunks))
+    tables = [r[0] for r in results] or [_empty_table()]
+    table = {k: np.concatenate([t[k] for t in tables]) for k in tables[0]}
+    # Chunk-local sample numbers -> dataset-wide rows
+    table['sample'] = np.concatenate([r[1] + i * chunk_size for i, r in enumerate(results)]
+                                     or [np.zeros(0, np.int64)]).astype(np.int32)
+
+    sample_labels = [os.path.basename(os.path.dirname(p)) for p in paths]
+    label_names = sorted(set(sample_labels))
+    label_ids = {l: i for i, l in enumerate(label_names)}
+    sample_label_ids = np.array([label_ids[l] for l in sample_labels], dtype=np.int16)
+    table['label_id'] = sample_label_ids[table['sample']] if len(paths) else np.zeros(0, np.int16)
+    table['samples'] = np.array([os.path.relpath(p, data_root) for p in paths])
+    table['label_names'] = np.array(label_names)
+    return table
+
+# ---------- Aggregates ----------
+
+def label_stats(table):
+    """
+    Per-label aggregates of a dataset join table.
+    Returns:
+        Columnar dict: label, joins, pen_lift_rate, continuous_rate, and for each feature
+        <feature>_mean / _median / _p90, plus <feature>_hist (n_labels, n_bins) counts
+        over HIST_BINS[<feature>] (values outside the edges are clipped into the end bins).
+    """
+    with stage_timer('joins.stats'):
+        return _label_stats(table)
+
+
+def _label_stats(table):
+    names = table['label_names']
+    n_labels = len(names)
+    label_id = table['label_id'].astype(np.int64)
+    joins = np.bincount(label_id, minlength=n_labels)
+    denom = np.maximum(joins, 1)
+    stats = {
+        'label': names,
+        'joins': joins,
+        'pen_lift_rate': np.bincount(label_id, table['pen_lifted'], minlength=n_labels) / denom,
+        'continuous_rate': np.bincount(label_id, table['continuous'], minlength=n_labels) / denom,
+    }
+    order = np.argsort(label_id, kind='stable')
+    bounds = np.concatenate([[0], np.cumsum(joins)])
+    for feat in JOIN_FEATURES:
+        values = table[feat].astype(np.float64)
+        stats[f'{feat}_mean'] = np.bincount(label_id, values, minlength=n_labels) / denom
+        grouped = values[order]
+        med, p90 = np.full(n_labels, np.nan), np.full(n_labels, np.nan)
+        for i in np.nonzero(joins)[0]:
+            med[i], p90[i] = np.percentile(grouped[bounds[i]:bounds[i + 1]], [50, 90])
+        stats[f'{feat}_median'] = med
+        stats[f'{feat}_p90'] = p90
+        edges = HIST_BINS[feat]
+        n_bins = len(edges) - 1
+        bins = np.clip(np.searchsorted(edges, values, side='right') - 1, 0, n_bins - 1)
+        stats[f'{feat}_hist'] = np.bincount(label_id * n_bins + bins,
+                                            minlength=n_labels * n_bins).reshape(n_labels, n_bins)
+    return stats
+
+# ---------- Output ----------
+
+def save_npz(out_path, table, stats=None):
+    """Write the join table (and stats with a 'stats_' prefix) into one .npz."""
+    arrays = dict(table)
+    for k, v in (stats or {}).items():
+        arrays[f'stats_{k}'] = v
+    for feat, edges in HIST_BINS.items():
+        arrays[f'bins_{feat}'] = edges
+    np.savez_compressed(out_path, **arrays)
+
+
+def save_parquet(out_path, table):
+    """Write the per-join rows as Parquet (needs pyarrow); labels and sample paths are inlined."""
+    if pa is None:
+        raise ImportError('pyarrow is required for Parquet output')
+    cols = {k: v for k, v in table.items() if k not in ('samples', 'label_names')}
+    cols['label'] = table['label_names'][table['label_id']] if len(table['label_id']) else np.array([], dtype=str)
+    cols['sample'] = table['samples'][table['sample']] if len(table['sample']) else np.array([], dtype=str)
+    pq.write_table(pa.table({k: pa.array(v) for k, v in cols.items()}), out_path)
 
 # CLI stub for batch analysis
 if __name__ == '__main__':
     import sys
-    if len(sys.argv) < 2:
+    if len(sys.argv) >= 3 and sys.argv[1] == '--dataset':
+        # python joint_analysis.py --dataset handwriting_data [--label A] [--out joins.npz|joins.parquet] [--workers N]
+        label = sys.argv[sys.argv.index('--label') + 1] if '--label' in sys.argv else None
+        workers = int(sys.argv[sys.argv.index('--workers') + 1]) if '--workers' in sys.argv else None
+        table = analyze_dataset(sys.argv[2], label=label, workers=workers)
+        stats = label_stats(table)
+        for i, name in enumerate(stats['label']):
+            print(f"{name}: {stats['joins'][i]} joins, spacing mean {stats['spacing_mean'][i]:.1f}, "
+                  f"gap mean {stats['time_gap_mean'][i]:.0f} ms, pen-lift {stats['pen_lift_rate'][i]:.0%}")
+        if '--out' in sys.argv:
+            out = sys.argv[sys.argv.index('--out') + 1]
+            if out.endswith('.parquet'):
+                save_parquet(out, table)
+            else:
+                save_npz(out, table, stats)
+            print(f'Wrote {len(table["spacing"])} joins to {out}')
+    elif len(sys.argv) < 2:
         print('Usage: python joint_analysis.py <sample.json>')
+        print('       python joint_analysis.py --dataset <data_root> [--label L] [--out joins.npz|joins.parquet] [--workers N]')
     else:
         joins = analyze_joins(sys.argv[1])
-        print(json.dumps(joins, indent=2)) 
\ No newline at end of file
+        print(json.dumps(joins, indent=2))
@@ -1,35 +1,190 @@
 # metadata_tracker.py
 # MODULE 7: Metadata Tracker
-# Tracks all saved samples in a metadata.json file.
+# Tracks all saved samples in an indexed SQLite metadata store.
+# SQLite (WAL mode) gives cheap appends and is safe for several writer processes,
+# e.g. multiple uvicorn workers sharing one handwriting_data folder.
 
 import os
 import json
-from threading import Lock
+import sqlite3
+import threading
+
+FIELDS = ['sample_id', 'label', 'timestamp', 'device', 'json_path', 'png_path', 'stroke_count', 'total_points']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    sample_id TEXT UNIQUE,
+    label TEXT,
+    timestamp TEXT,
+    device TEXT,
+    json_path TEXT,
+    png_path TEXT,
+    stroke_count INTEGER,
+    total_points INTEGER,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_samples_label ON samples(label);
+CREATE INDEX IF NOT EXISTS idx_samples_device ON samples(device);
+CREATE INDEX IF NOT EXISTS idx_samples_timestamp ON samples(timestamp);
+CREATE INDEX IF NOT EXISTS idx_samples_strokes ON samples(stroke_count);
+CREATE INDEX IF NOT EXISTS idx_samples_points ON samples(total_points);
+CREATE INDEX IF NOT EXISTS idx_samples_device_ts ON samples(device, timestamp);
+"""
+
+
+class MetadataStore:
+    """
+    Indexed metadata store backed by a single SQLite file.
+    Connections are per-thread; cross-process locking is handled by SQLite.
+    """
+
+    def __init__(self, db_path, timeout=30.0):
+        self.db_path = db_path
+        self.timeout = timeout
+        self._local = threading.local()
+        folder = os.path.dirname(db_path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=self.timeout, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def append(self, entry):
+        """
+        Insert a metadata entry. Entries with the same sample_id are merged,
+        so the JSON and PNG uploads of one sample end up in a single row.
+        Args:
+            entry: Dict with metadata fields (see example below)
+        """
+        row = {k: entry.get(k) for k in FIELDS}
+        extra = {k: v for k, v in entry.items() if k not in FIELDS}
+        row['extra'] = json.dumps(extra, ensure_ascii=False) if extra else None
+        cols = list(row)
+        updates = ', '.join(f'{c} = COALESCE(excluded.{c}, {c})' for c in cols if c != 'sample_id')
+        sql = (f'INSERT INTO samples ({", ".join(cols)}) VALUES ({", ".join("?" for _ in cols)})'
+               f' ON CONFLICT(sample_id) DO UPDATE SET {updates}')
+        self._conn().execute(sql, [row[c] for c in cols])
+
+    def query(self, label=None, device=None, since=None, until=None,
+              min_strokes=None, max_strokes=None, min_points=None, max_points=None,
+              limit=None, after_id=None):
+        """
+        Query entries using the indexed columns.
+        Args:
+            since / until: ISO timestamps (inclusive / exclusive)
+            after_id: Return only rows with id > after_id (for pagination)
+        Returns:
+            List of entry dicts ordered by insertion.
+        """
+        clauses, params = [], []
+        for clause, value in [
+            ('label = ?', label), ('device = ?', device),
+            ('timestamp >= ?', since), ('timestamp < ?', until),
+            ('stroke_count >= ?', min_strokes), ('stroke_count <= ?', max_strokes),
+            ('total_points >= ?', min_points), ('total_points <= ?', max_points),
+            ('id > ?', after_id),
+        ]:
+            if value is not None:
+                clauses.append(clause)
+                params.append(value)
+        sql = 'SELECT * FROM samples'
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+        sql += ' ORDER BY id'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(int(limit))
+        return [self._row_to_entry(r) for r in self._conn().execute(sql, params)]
+
+    def get(self, sample_id):
+        """Look up one entry by sample_id (unique index). Returns None if missing."""
+        row = self._conn().execute('SELECT * FROM samples WHERE sample_id = ?', (sample_id,)).fetchone()
+        return self._row_to_entry(row) if row is not None else None
+
+    def count(self, label=None):
+        if label is None:
+            return self._conn().execute('SELECT COUNT(*) FROM samples').fetchone()[0]
+        return self._conn().execute('SELECT COUNT(*) FROM samples WHERE label = ?', (label,)).fetchone()[0]
+
+    def existing_keys(self, keys):
+        """
+        Check which (device, timestamp) pairs are already stored (upload dedupe).
+        Returns:
+            Set of the pairs from keys that have a row.
+        """
+        conn = self._conn()
+        sql = 'SELECT 1 FROM samples WHERE device IS ? AND timestamp = ? LIMIT 1'
+        return {k for k in keys if conn.execute(sql, k).fetchone() is not None}
+
+    @staticmethod
+    def _row_to_entry(row):
+        entry = {k: row[k] for k in FIELDS if row[k] is not None}
+        entry['id'] = row['id']
+        if row['extra']:
+            entry.update(json.loads(row['extra']))
+        return entry
+
+    def import_json(self, json_path):
+        """
+        Import entries from a legacy metadata.json list.
+        Returns:
+            Number of imported entries.
+        """
+        with open(json_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        conn = self._conn()
+        conn.execute('BEGIN')
+        try:
+            for entry in data:
+                self.append(entry)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return len(data)
+
+
+_STORES = {}
+_STORES_LOCK = threading.Lock()
+
+
+def get_store(meta_path):
+    with _STORES_LOCK:
+        store = _STORES.get(meta_path)
+        if store is None:
+            store = _STORES[meta_path] = MetadataStore(meta_path)
+        return store
 
-META_LOCK = Lock()
 
 def append_metadata(meta_path, entry):
     """
-    Append a metadata entry to metadata.json, creating the file if needed.
+    Append a metadata entry to the store at meta_path, creating it if needed.
     Args:
-        meta_path: Path to metadata.json
+        meta_path: Path to the SQLite metadata file
         entry: Dict with metadata fields
     """
-    META_LOCK.acquire()
-    try:
-        if os.path.exists(meta_path):
-            with open(meta_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-        else:
-            data = []
-        data.append(entry)
-        with open(meta_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-    finally:
-        META_LOCK.release()
+    get_store(meta_path).append(entry)
+
+
+def query_metadata(meta_path, **filters):
+    """
+    Query the store at meta_path. See MetadataStore.query for filters.
+    """
+    return get_store(meta_path).query(**filters)
 
 # Example entry:
 # {
+#   "sample_id": "A/20250704_154311",
 #   "label": "A",
 #   "timestamp": "2025-07-04T15:43:11Z",
 #   "device": "Samsung Tab S9 FE",
@@ -41,13 +196,21 @@ def append_metadata(meta_path, entry):
 
 # Stub for backend integration
 if __name__ == '__main__':
-    entry = {
-        "label": "A",
-        "timestamp": "2025-07-04T15:43:11Z",
-        "device": "Samsung Tab S9 FE",
-        "json_path": "data/A/20250704_154311.json",
-        "png_path": "data/A/20250704_154311.png",
-        "stroke_count": 2,
-        "total_points": 134
-    }
-    append_metadata('handwriting_data/metadata.json', entry) 
\ No newline at end of file
+    import sys
+    if len(sys.argv) >= 3 and sys.argv[1] == '--import':
+        # python metadata_tracker.py --import handwriting_data/metadata.json [db_path]
+        db_path = sys.argv[3] if len(sys.argv) > 3 else 'handwriting_data/metadata.sqlite'
+        n = MetadataStore(db_path).import_json(sys.argv[2])
+        print(f'Imported {n} entries into {db_path}')
+    else:
+        entry = {
+            "sample_id": "A/20250704_154311",
+            "label": "A",
+            "timestamp": "2025-07-04T15:43:11Z",
+            "device": "Samsung Tab S9 FE",
+            "json_path": "data/A/20250704_154311.json",
+            "png_path": "data/A/20250704_154311.png",
+            "stroke_count": 2,
+            "total_points": 134
+        }
+        append_metadata('handwriting_data/metadata.sqlite', entry)
@@ -0,0 +1,307 @@
+# metrics.py
+# MODULE 21: Metrics & Stage Timing
+# In-process counters, gauges and histograms, rendered in the Prometheus text format
+# (backend_server GET /metrics) or dumped as a JSON profile by offline batch runs, and
+# the timing hook API the pipeline modules report per-stage durations through:
+#
+#     with stage_timer('render.rasterize'):      # or record_stage('export.write', seconds)
+#         ...
+#     add_timing_hook(lambda stage, seconds: ...)
+#
+# Stage durations land in the hws_stage_duration_seconds{stage=...} histogram. Metrics are
+# per process: with several server workers each one exposes its own counters (scrape each
+# worker, or aggregate in Prometheus). Work done in process pools is merged back into the
+# parent with pool_map() / call_collected(); hooks only fire in the process doing the work.
+# A forked child starts with an empty registry, so values recorded by the parent before the
+# fork are not merged back once per worker.
+#
+# Offline runs: set METRICS_PROFILE=profile.json to write the profile when the process exits,
+# e.g. METRICS_PROFILE=export.json python data_exporter.py handwriting_data out --fmt shards
+
+import os
+import json
+import time
+import atexit
+import bisect
+import threading
+import multiprocessing
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+STAGE_METRIC = 'hws_stage_duration_seconds'
+# Histogram upper bounds; +Inf is implicit
+STAGE_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 33554432)
+POINTS_BUCKETS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000)
+KINDS = ('counter', 'gauge', 'histogram')
+
+# ---------- Registry ----------
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(v):
+    if v == float('inf'):
+        return '+Inf'
+    return repr(float(v)) if not float(v).is_integer() else str(int(v))
+
+
+class Registry:
+    """
+    Thread-safe metric store. Series are keyed by (name, labels); histograms keep
+    per-bucket counts, sum and count. Metrics used before describe() get a default
+    type from the call (inc -> counter, set -> gauge, observe -> histogram).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meta = {}    # name -> {'type', 'help', 'buckets'}
+        self._series = {}  # name -> {label key: float, or [bucket counts, sum, count]}
+
+    def describe(self, name, kind, help='', buckets=None):
+        assert kind in KINDS
+        with self._lock:
+            self._describe(name, kind, help, buckets)
+
+    def _describe(self, name, kind, help='', buckets=None):
+        if name not in self._meta:
+            if kind == 'histogram':
+                buckets = tuple(sorted(buckets or STAGE_BUCKETS))
+            self._meta[name] = {'type': kind, 'help': help, 'buckets': buckets}
+            self._series[name] = {}
+        return self._meta[name]
+
+    def inc(self, name, value=1.0, **labels):
+        with self._lock:
+            self._describe(name, 'counter')
+            series = self._series[name]
+            key = _label_key(labels)
+            series[key] = series.get(key, 0.0) + value
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self._describe(name, 'gauge')
+            self._series[name][_label_key(labels)] = float(value)
+
+    def observe(self, name, value, **labels):
+        with self._lock:
+            meta = self._describe(name, 'histogram')
+            series = self._series[name]
+            key = _label_key(labels)
+            h = series.get(key)
+            if h is None:
+                h = series[key] = [[0] * (len(meta['buckets']) + 1), 0.0, 0]
+            h[0][bisect.bisect_left(meta['buckets'], value)] += 1
+            h[1] += value
+            h[2] += 1
+
+    def get(self, name, **labels):
+        """Current value of a counter / gauge, or (counts, sum, count) of a histogram; None if unset."""
+        with self._lock:
+            v = self._series.get(name, {}).get(_label_key(labels))
+            return (list(v[0]), v[1], v[2]) if isinstance(v, list) else v
+
+    def reset(self):
+        with self._lock:
+            for series in self._series.values():
+                series.clear()
+
+    def snapshot(self, reset=False):
+        """JSON-serializable copy of every metric (optionally clearing the values)."""
+        with self._lock:
+            out = {}
+            for name, meta in self._meta.items():
+                series = []
+                for key, v in self._series[name].items():
+                    entry = {'labels': dict(key)}
+                    if isinstance(v, list):
+                        entry.update({'counts': list(v[0]), 'sum': v[1], 'count': v[2]})
+                    else:
+                        entry['value'] = v
+                    series.append(entry)
+                out[name] = {'type': meta['type'], 'help': meta['help'],
+                             'buckets': list(meta['buckets']) if meta['buckets'] else None, 'series': series}
+                if reset:
+                    self._series[name].clear()
+            return out
+
+    def merge(self, snapshot):
+        """Add a snapshot() (e.g. from a pool worker) into this registry; gauges are overwritten."""
+        with self._lock:
+            for name, m in snapshot.items():
+                meta = self._describe(name, m['type'], m['help'], m['buckets'])
+                series = self._series[name]
+                for entry in m['series']:
+                    key = _label_key(entry['labels'])
+                    if m['type'] == 'counter':
+                        series[key] = series.get(key, 0.0) + entry['value']
+                    elif m['type'] == 'gauge':
+                        series[key] = entry['value']
+                    elif list(meta['buckets']) == list(m['buckets']):
+                        h = series.setdefault(key, [[0] * (len(meta['buckets']) + 1), 0.0, 0])
+                        h[0] = [a + b for a, b in zip(h[0], entry['counts'])]
+                        h[1] += entry['sum']
+                        h[2] += entry['count']
+
+    def prometheus(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        for name, m in self.snapshot().items():
+            if m['help']:
+                lines.append(f"# HELP {name} {_escape(m['help'])}")
+            lines.append(f"# TYPE {name} {m['type']}")
+            for entry in sorted(m['series'], key=lambda e: sorted(e['labels'].items())):
+                labels = ','.join(f'{k}="{_escape(v)}"' for k, v in sorted(entry['labels'].items()))
+                if m['type'] != 'histogram':
+                    lines.append(f"{name}{{{labels}}} {_format_value(entry['value'])}" if labels
+                                 else f"{name} {_format_value(entry['value'])}")
+                    continue
+                prefix = labels + ',' if labels else ''
+                cumulative = 0
+                for bound, n in zip(list(m['buckets']) + [float('inf')], entry['counts']):
+                    cumulative += n
+                    lines.append(f'{name}_bucket{{{prefix}le="{_format_value(bound)}"}} {cumulative}')
+                suffix = f'{{{labels}}}' if labels else ''
+                lines.append(f"{name}_sum{suffix} {_format_value(entry['sum'])}")
+                lines.append(f"{name}_count{suffix} {entry['count']}")
+        return '\n'.join(lines) + '\n'
+
+
+    def _after_fork(self):
+        # Child side of a fork: the parent's values stay with the parent
+        self._lock = threading.Lock()
+        for series in self._series.values():
+            series.clear()
+
+
+REGISTRY = Registry()
+if hasattr(os, 'register_at_fork'):
+    # Hold the lock across fork() so the child never inherits it mid-update
+    os.register_at_fork(before=lambda: REGISTRY._lock.acquire(),
+                        after_in_parent=lambda: REGISTRY._lock.release(),
+                        after_in_child=REGISTRY._after_fork)
+REGISTRY.describe(STAGE_METRIC, 'histogram', 'Duration of pipeline stages (timing hooks)', STAGE_BUCKETS)
+
+
+def inc(name, value=1.0, **labels):
+    REGISTRY.inc(name, value, **labels)
+
+
+def set_gauge(name, value, **labels):
+    REGISTRY.set(name, value, **labels)
+
+
+def observe(name, value, **labels):
+    REGISTRY.observe(name, value, **labels)
+
+# ---------- Timing Hooks ----------
+
+_HOOKS = []
+
+
+def add_timing_hook(fn):
+    """Call fn(stage, seconds) for every stage duration recorded in this process."""
+    _HOOKS.append(fn)
+    return fn
+
+
+def remove_timing_hook(fn):
+    if fn in _HOOKS:
+        _HOOKS.remove(fn)
+
+
+def record_stage(stage, seconds):
+    REGISTRY.observe(STAGE_METRIC, seconds, stage=stage)
+    for fn in list(_HOOKS):
+        fn(stage, seconds)
+
+
+@contextmanager
+def stage_timer(stage):
+    """Time the with-block as `stage` (recorded even if it raises)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+# ---------- Process Pools ----------
+
+def call_collected(fn, *args):
+    """Run fn(*args) in a pool worker. Returns (result, metrics recorded by this call)."""
+    result = fn(*args)
+    return result, REGISTRY.snapshot(reset=True)
+
+
+def _call_job(item):
+    fn, job = item
+    return call_collected(fn, job)
+
+
+def pool_map(pool, fn, jobs, chunksize=1):
+    """pool.map(fn, jobs) that merges each job's metrics into this process's registry."""
+    for result, snapshot in pool.map(_call_job, [(fn, job) for job in jobs], chunksize=chunksize):
+        REGISTRY.merge(snapshot)
+        yield result
+
+# ---------- Profiles ----------
+
+def _bucket_quantile(buckets, counts, q):
+    # Upper bound of the bucket holding the q-quantile (Prometheus-style estimate)
+    total = sum(counts)
+    if not total:
+        return None
+    target, running = q * total, 0
+    for bound, n in zip(list(buckets) + [float('inf')], counts):
+        running += n
+        if running >= target:
+            return bound
+    return float('inf')
+
+
+def stage_summary(snapshot=None):
+    """Per-stage count, total / mean seconds and bucket-estimated p50 / p95 from a snapshot."""
+    m = (snapshot or REGISTRY.snapshot()).get(STAGE_METRIC)
+    if not m:
+        return {}
+    out = {}
+    for entry in m['series']:
+        count = entry['count']
+        out[entry['labels'].get('stage', '')] = {
+            'count': count,
+            'total_s': entry['sum'],
+            'mean_ms': 1e3 * entry['sum'] / count if count else 0.0,
+            'p50_le_ms': 1e3 * (_bucket_quantile(m['buckets'], entry['counts'], 0.5) or 0.0),
+            'p95_le_ms': 1e3 * (_bucket_quantile(m['buckets'], entry['counts'], 0.95) or 0.0),
+        }
+    return dict(sorted(out.items(), key=lambda kv: -kv[1]['total_s']))
+
+
+def profile():
+    """JSON profile: stage summary plus every metric of this process."""
+    snapshot = REGISTRY.snapshot()
+    return {
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'pid': os.getpid(),
+        'stages': stage_summary(snapshot),
+        'metrics': snapshot,
+    }
+
+
+def dump_profile(path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(profile(), f, indent=2, default=str)
+    return path
+
+
+_PROFILE_PATH = os.environ.get('METRICS_PROFILE')
+if _PROFILE_PATH and multiprocessing.parent_process() is None:
+    _owner = os.getpid()
+    # Only the main process writes it: pool workers report through pool_map() instead
+    atexit.register(lambda: os.getpid() == _owner and dump_profile(_PROFILE_PATH))
@@ -1 +1,272 @@
- 
\ No newline at end of file
+# replicator_training.py
+# MODULE 12: Replicator Training Data Pipeline (PyTorch)
+# Feeds exported stroke data to training through memory-mapped shards, length-bucketed
+# batching and a padding collate that does no per-point Python work. RasterCollate draws
+# freshly augmented rasters for each batch from the sequences (numpy_rasterizer).
+
+import os
+import time
+import numpy as np
+import torch
+from torch.utils.data import Dataset, DataLoader, Sampler
+
+from data_exporter import ExportShardReader, H5SampleReader
+from numpy_rasterizer import rasterize_batch
+
+
+def _open_reader(path):
+    if path.endswith('.h5'):
+        return H5SampleReader(path, with_images=False)
+    return ExportShardReader(path)
+
+
+class StrokeDataset(Dataset):
+    """
+    Dataset over one exported split: a 'shards' split directory or an 'h5' data file.
+    Each item is a dict with:
+        points: float32 (n, len(fields) + 1) with a trailing pen-lift flag (1 on each stroke's last point)
+        label:  int class id
+        raster: uint8 (H, W), only when mode includes rasters
+    Args:
+        path: Split directory (fmt='shards') or data.h5 file (fmt='h5')
+        mode: 'sequence', 'raster' or 'both'
+        images_path: For shards, a (N, H, W) uint8 .npy aligned with the split (memory-mapped).
+            For h5, rasters are read from the file's 'images' dataset.
+        classes: Optional list of label names fixing the id order. Defaults to the export-wide
+            table the exporter stores with every split, so ids match across train / val / test
+    Readers are opened lazily per process, so the dataset is safe with fork or spawn workers.
+    """
+
+    def __init__(self, path, mode='sequence', images_path=None, classes=None):
+        assert mode in ('sequence', 'raster', 'both')
+        self.path = path
+        self.mode = mode
+        self.images_path = images_path
+        self._reader = None
+        self._images = None
+        self._pid = None
+        reader = self._get_reader()
+        self.fields = list(reader.fields) + ['pen_lift']
+        self.lengths, labels = reader.lengths_and_labels()
+        if classes is None:
+            classes = reader.classes
+        if classes is None:
+            # Exports written before the class table existed: ids are only valid within this split
+            classes = sorted(set(labels))
+        self.classes = list(classes)
+        class_ids = {c: i for i, c in enumerate(self.classes)}
+        missing = sorted(set(labels) - set(class_ids))
+        if missing:
+            raise ValueError(f'{path}: labels {missing[:10]} are not in the class table; '
+                             f're-export, or pass classes covering every label')
+        self.targets = np.array([class_ids[l] for l in labels], dtype=np.int64)
+
+    def _get_reader(self):
+        if self._reader is None or self._pid != os.getpid():
+            self._reader = _open_reader(self.path)
+            self._images = None
+            self._pid = os.getpid()
+        return self._reader
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_reader'] = None
+        state['_images'] = None
+        return state
+
+    def __len__(self):
+        return len(self.targets)
+
+    def _sequence(self, i):
+        reader = self._get_reader()
+        if isinstance(reader, H5SampleReader):
+            _, strokes = reader[i]
+            offsets = np.cumsum([0] + [len(s) for s in strokes])
+            values = np.concatenate(strokes) if strokes else np.empty((0, len(self.fields) - 1), np.float32)
+        else:
+            shard, j = reader.locate(i)
+            so = shard['sample_offsets']
+            offsets = np.asarray(shard['stroke_offsets'][so[j]:so[j + 1] + 1])
+            values = shard['values'][offsets[0]:offsets[-1]] if len(offsets) else shard['values'][:0]
+            offsets = offsets - (offsets[0] if len(offsets) else 0)
+        out = np.zeros((len(values), values.shape[1] + 1), dtype=np.float32)
+        out[:, :-1] = values
+        ends = offsets[1:] - 1
+        out[ends[ends >= 0], -1] = 1.0
+        return out
+
+    def _raster(self, i):
+        reader = self._get_reader()
+        if isinstance(reader, H5SampleReader):
+            return reader.image(i)
+        if self._images is None:
+            if self.images_path is None:
+                raise ValueError('Raster mode on shards needs images_path')
+            self._images = np.load(self.images_path, mmap_mode='r')
+        return np.asarray(self._images[i])
+
+    def __getitem__(self, i):
+        item = {'label': int(self.targets[i])}
+        if self.mode in ('sequence', 'both'):
+            item['points'] = self._sequence(i)
+        if self.mode in ('raster', 'both'):
+            item['raster'] = self._raster(i)
+        return item
+
+
+class LengthBucketSampler(Sampler):
+    """
+    Yields batches of indices with similar sequence lengths to keep padding small.
+    Indices are shuffled, cut into pools of batch_size * bucket_factor, sorted by length
+    inside each pool, batched, and the batches shuffled again. Call set_epoch() per epoch.
+    """
+
+    def __init__(self, lengths, batch_size, bucket_factor=50, shuffle=True, drop_last=False, seed=0):
+        self.lengths = np.asarray(lengths)
+        self.batch_size = batch_size
+        self.bucket_factor = bucket_factor
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.seed = seed
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def _batches(self):
+        rng = np.random.default_rng(self.seed + self.epoch)
+        idx = rng.permutation(len(self.lengths)) if self.shuffle else np.arange(len(self.lengths))
+        pool = self.batch_size * self.bucket_factor
+        batches = []
+        for start in range(0, len(idx), pool):
+            chunk = idx[start:start + pool]
+            chunk = chunk[np.argsort(self.lengths[chunk], kind='stable')]
+            for b in range(0, len(chunk), self.batch_size):
+                batch = chunk[b:b + self.batch_size]
+                if len(batch) == self.batch_size or not self.drop_last:
+                    batches.append(batch)
+        if self.shuffle:
+            batches = [batches[k] for k in rng.permutation(len(batches))]
+        return batches
+
+    def __iter__(self):
+        for batch in self._batches():
+            yield batch.tolist()
+
+    def __len__(self):
+        n = len(self.lengths) // self.batch_size
+        return n if self.drop_last or len(self.lengths) % self.batch_size == 0 else n + 1
+
+
+def collate_strokes(batch):
+    """
+    Pad a list of dataset items into tensors:
+        points (B, L, C) float32, mask (B, L) bool, lengths (B,) int64, labels (B,) int64,
+        rasters (B, H, W) uint8 when present.
+    """
+    out = {'labels': torch.as_tensor(np.array([b['label'] for b in batch], dtype=np.int64))}
+    if 'points' in batch[0]:
+        seqs = [b['points'] for b in batch]
+        lengths = np.array([len(s) for s in seqs], dtype=np.int64)
+        max_len = int(lengths.max()) if len(lengths) else 0
+        padded = np.zeros((len(seqs), max_len, seqs[0].shape[1]), dtype=np.float32)
+        for k, s in enumerate(seqs):
+            padded[k, :len(s)] = s
+        out['points'] = torch.from_numpy(padded)
+        out['mask'] = torch.from_numpy(np.arange(max_len)[None, :] < lengths[:, None])
+        out['lengths'] = torch.from_numpy(lengths)
+    if 'raster' in batch[0]:
+        out['rasters'] = torch.from_numpy(np.stack([b['raster'] for b in batch]))
+    return out
+
+
+class RasterCollate:
+    """
+    collate_strokes plus 'rasters' (B, size, size) uint8 drawn from each item's points in one
+    rasterize_batch call, with random augmentation per batch when augment is set (a dict of
+    numpy_rasterizer.DEFAULT_AUGMENT overrides; {} for the defaults).
+    The RNG is seeded lazily from torch.initial_seed(), so every DataLoader worker draws
+    different augmentations and runs are reproducible under a fixed torch seed.
+    """
+
+    def __init__(self, fields, size=64, augment=None, width=1.5):
+        self.x, self.y = fields.index('x'), fields.index('y')
+        self.p = fields.index('p') if 'p' in fields else None
+        self.size = size
+        self.augment = augment
+        self.width = width
+        self._rng = None
+
+    def __call__(self, batch):
+        out = collate_strokes(batch)
+        if self._rng is None:
+            self._rng = np.random.default_rng(torch.initial_seed())
+        samples = []
+        for b in batch:
+            pts = b['points']
+            # The trailing pen-lift flag marks each stroke's last point
+            ends = np.nonzero(pts[:, -1] > 0)[0] + 1
+            samples.append(np.split(pts, ends[:-1]) if len(ends) else [pts])
+        rasters = rasterize_batch(samples, size=self.size, width=self.width, augment_params=self.augment,
+                                  rng=self._rng, x=self.x, y=self.y, p=self.p)
+        out['rasters'] = torch.from_numpy(rasters)
+        return out
+
+
+def make_loader(path, batch_size=64, num_workers=0, mode='sequence', images_path=None, classes=None,
+                shuffle=True, bucket_factor=50, seed=0, pin_memory=False, raster_size=None, augment=None):
+    """
+    Build a DataLoader with length bucketing and padded collation for an exported split.
+    raster_size (sequence mode) adds on-the-fly rasters via RasterCollate, augmented when augment is set.
+    """
+    dataset = StrokeDataset(path, mode=mode, images_path=images_path, classes=classes)
+    sampler = LengthBucketSampler(dataset.lengths, batch_size, bucket_factor=bucket_factor,
+                                  shuffle=shuffle, seed=seed)
+    collate = collate_strokes
+    if raster_size:
+        assert mode == 'sequence', 'raster_size draws rasters from sequences; use mode="sequence"'
+        collate = RasterCollate(dataset.fields, size=raster_size, augment=augment)
+    return DataLoader(dataset, batch_sampler=sampler, collate_fn=collate, num_workers=num_workers,
+                      pin_memory=pin_memory, persistent_workers=num_workers > 0)
+
+
+def benchmark_loader(loader, epochs=1):
+    """
+    Iterate the loader and report throughput.
+    Returns:
+        Dict with samples, seconds, samples_per_sec and padding_ratio (padded / real points).
+    """
+    samples, real, padded = 0, 0, 0
+    start = time.perf_counter()
+    for epoch in range(epochs):
+        if hasattr(loader.batch_sampler, 'set_epoch'):
+            loader.batch_sampler.set_epoch(epoch)
+        for batch in loader:
+            samples += len(batch['labels'])
+            if 'points' in batch:
+                real += int(batch['lengths'].sum())
+                padded += batch['points'].shape[0] * batch['points'].shape[1]
+    elapsed = time.perf_counter() - start
+    return {
+        'samples': samples,
+        'seconds': elapsed,
+        'samples_per_sec': samples / elapsed if elapsed > 0 else 0.0,
+        'padding_ratio': padded / real if real else 0.0,
+    }
+
+# CLI: throughput benchmark
+if __name__ == '__main__':
+    import sys
+    if len(sys.argv) < 2:
+        print('Usage: python replicator_training.py <split_dir|data.h5> [--batch-size N] [--workers N] [--epochs N]'
+              ' [--raster SIZE [--augment]]')
+    else:
+        batch_size = int(sys.argv[sys.argv.index('--batch-size') + 1]) if '--batch-size' in sys.argv else 64
+        workers = int(sys.argv[sys.argv.index('--workers') + 1]) if '--workers' in sys.argv else 0
+        epochs = int(sys.argv[sys.argv.index('--epochs') + 1]) if '--epochs' in sys.argv else 3
+        raster_size = int(sys.argv[sys.argv.index('--raster') + 1]) if '--raster' in sys.argv else None
+        loader = make_loader(sys.argv[1], batch_size=batch_size, num_workers=workers, raster_size=raster_size,
+                             augment={} if '--augment' in sys.argv else None)
+        stats = benchmark_loader(loader, epochs=epochs)
+        print(f"{stats['samples']} samples in {stats['seconds']:.2f}s: {stats['samples_per_sec']:.0f} samples/s, "
+              f"padding ratio {stats['padding_ratio']:.2f}")
@@ -0,0 +1,251 @@
+# shard_store.py
+# MODULE 14: Binary Shard Store
+# Appends stroke samples to per-label shard files in a compact struct-of-arrays layout.
+#
+# Layout (per label folder):
+#   shard_00000.bin   -> concatenated sample blocks
+#   shard_00000.idx   -> one JSON line per sample (offset, sizes, label, timestamp, ...)
+#
+# Each sample block is:
+#   float32[len(COLUMNS), n_points]   column-major point data (x, y, t, p, ...)
+#   int32[n_strokes + 1]              stroke start offsets into the point columns
+# Missing values (null in the JSON) are stored as NaN. Times are stored relative
+# to the first point of the sample (t0 is kept in the index as a float64).
+#
+# A block is written before its index line, so a crash leaves at most an unindexed
+# tail in the .bin (never read) or a torn last .idx line (skipped by readers; the
+# next append starts on a fresh line).
+
+import os
+import json
+from glob import glob
+from threading import Lock
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+COLUMNS = ('x', 'y', 't', 'p', 'tiltX', 'tiltY', 'azimuth', 'altitude', 'pen_down')
+COL = {name: i for i, name in enumerate(COLUMNS)}
+MAX_SHARD_BYTES = 64 * 1024 * 1024
+
+_WRITE_LOCK = Lock()
+
+
+def _shard_name(n):
+    return f'shard_{n:05d}'
+
+
+def sample_to_columns(sample):
+    """
+    Pack a JSON sample into (columns, stroke_offsets, t0).
+    Args:
+        sample: Dict with a 'strokes' list as sent by the tablet UI
+    Returns:
+        float32 array (len(COLUMNS), n_points), int32 offsets (n_strokes + 1,), t0
+    """
+    strokes = sample.get('strokes', [])
+    lengths = [len(s.get('points', [])) for s in strokes]
+    offsets = np.zeros(len(strokes) + 1, dtype=np.int32)
+    np.cumsum(lengths, out=offsets[1:])
+    points = [pt for s in strokes for pt in s.get('points', [])]
+    rows = [[pt.get(name) for name in COLUMNS] for pt in points]
+    cols = np.array(rows, dtype=np.float64).reshape(len(points), len(COLUMNS)).T
+    t0 = float(cols[COL['t'], 0]) if len(points) and not np.isnan(cols[COL['t'], 0]) else 0.0
+    cols[COL['t']] -= t0
+    return np.ascontiguousarray(cols, dtype=np.float32), offsets, t0
+
+
+def columns_to_sample(record):
+    """
+    Rebuild a JSON-style sample dict from a record returned by ShardReader.
+    """
+    cols = np.asarray(record['columns'], dtype=np.float64).copy()
+    cols[COL['t']] += record['t0']
+    offsets = record['stroke_offsets']
+    strokes = []
+    for i in range(len(offsets) - 1):
+        points = []
+        for j in range(offsets[i], offsets[i + 1]):
+            pt = {}
+            for name, v in zip(COLUMNS, cols[:, j]):
+                v = None if np.isnan(v) else float(v)
+                pt[name] = bool(v) if name == 'pen_down' and v is not None else v
+            if record.get('pointerType') is not None:
+                pt['pointerType'] = record['pointerType']
+            points.append(pt)
+        strokes.append({'stroke_id': i + 1, 'points': points})
+    sample = {'label': record['label'], 'timestamp': record['timestamp'], 'strokes': strokes}
+    if record.get('device') is not None:
+        sample['device'] = record['device']
+    return sample
+
+
+class ShardWriter:
+    """
+    Append-only writer. One instance can serve every label under `root`.
+    """
+
+    def __init__(self, root, max_shard_bytes=MAX_SHARD_BYTES):
+        self.root = root
+        self.max_shard_bytes = max_shard_bytes
+        os.makedirs(root, exist_ok=True)
+
+    def _current_shard(self, folder):
+        shards = sorted(glob(os.path.join(folder, 'shard_*.bin')))
+        if not shards:
+            return 0
+        n = int(os.path.basename(shards[-1])[6:11])
+        if os.path.getsize(shards[-1]) >= self.max_shard_bytes:
+            n += 1
+        return n
+
+    def append(self, sample, sample_id=None):
+        """
+        Append one sample to its label's current shard.
+        Args:
+            sample: Dict with label, timestamp, strokes (same schema as the JSON files)
+            sample_id: Optional id stored in the index (e.g. the JSON file stem)
+        Returns:
+            Index entry dict for the written sample.
+        """
+        label = sample.get('label', 'unknown')
+        folder = os.path.join(self.root, label)
+        os.makedirs(folder, exist_ok=True)
+        cols, offsets, t0 = sample_to_columns(sample)
+        pointer_type = None
+        for s in sample.get('strokes', []):
+            if s.get('points'):
+                pointer_type = s['points'][0].get('pointerType')
+                break
+        with _WRITE_LOCK:
+            lock_path = os.path.join(folder, '.lock')
+            with open(lock_path, 'a') as lock_f:
+                if fcntl is not None:
+                    fcntl.flock(lock_f, fcntl.LOCK_EX)
+                try:
+                    name = _shard_name(self._current_shard(folder))
+                    bin_path = os.path.join(folder, name + '.bin')
+                    with open(bin_path, 'ab') as f:
+                        offset = f.tell()
+                        f.write(cols.tobytes())
+                        f.write(offsets.tobytes())
+                    entry = {
+                        'shard': name,
+                        'offset': offset,
+                        'n_points': int(cols.shape[1]),
+                        'n_strokes': int(len(offsets) - 1),
+                        't0': t0,
+                        'label': label,
+                        'timestamp': sample.get('timestamp'),
+                        'device': sample.get('device'),
+                        'pointerType': pointer_type,
+                        'sample_id': sample_id,
+                    }
+                    line = json.dumps(entry, ensure_ascii=False) + '\n'
+                    with open(os.path.join(folder, name + '.idx'), 'a+b') as f:
+                        if f.tell():
+                            f.seek(-1, os.SEEK_END)
+                            if f.read(1) != b'\n':
+                                line = '\n' + line  # terminate a torn line left by a crash
+                        f.write(line.encode('utf-8'))
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_f, fcntl.LOCK_UN)
+        return entry
+
+
+class ShardReader:
+    """
+    Memory-mapped reader. Records expose point columns as zero-copy NumPy views.
+    Call refresh() to pick up samples appended after construction.
+    """
+
+    def __init__(self, root, labels=None):
+        self.root = root
+        self.labels = labels
+        self._maps = {}
+        self.refresh()
+
+    def refresh(self):
+        self.entries = []
+        labels = self.labels or sorted(
+            d for d in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, d)))
+        for label in labels:
+            for idx_path in sorted(glob(os.path.join(self.root, label, 'shard_*.idx'))):
+                with open(idx_path, 'r', encoding='utf-8', errors='replace') as f:
+                    for line in f:
+                        if not line.strip():
+                            continue
+                        try:
+                            self.entries.append(json.loads(line))
+                        except ValueError:
+                            continue  # torn line from an interrupted append
+        self._maps = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _map(self, label, shard, end):
+        key = (label, shard)
+        mm = self._maps.get(key)
+        if mm is None or len(mm) < end:
+            path = os.path.join(self.root, label, shard + '.bin')
+            mm = np.memmap(path, dtype=np.uint8, mode='r')
+            self._maps[key] = mm
+        return mm
+
+    def __getitem__(self, i):
+        e = self.entries[i]
+        n, k = e['n_points'], len(COLUMNS)
+        col_bytes = 4 * k * n
+        end = e['offset'] + col_bytes + 4 * (e['n_strokes'] + 1)
+        mm = self._map(e['label'], e['shard'], end)
+        block = mm[e['offset']:end]
+        record = dict(e)
+        record['columns'] = block[:col_bytes].view(np.float32).reshape(k, n)
+        record['stroke_offsets'] = block[col_bytes:].view(np.int32)
+        return record
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def strokes(self, i):
+        """
+        Return the sample's strokes as a list of (len(COLUMNS), n) views.
+        """
+        rec = self[i]
+        off = rec['stroke_offsets']
+        return [rec['columns'][:, off[j]:off[j + 1]] for j in range(len(off) - 1)]
+
+
+def convert_json_tree(data_root, shard_root, max_shard_bytes=MAX_SHARD_BYTES):
+    """
+    Convert an existing handwriting_data/<label>/*.json tree into shards.
+    Returns:
+        Number of samples converted.
+    """
+    writer = ShardWriter(shard_root, max_shard_bytes=max_shard_bytes)
+    count = 0
+    for jf in sorted(glob(os.path.join(data_root, '*', '*.json'))):
+        with open(jf, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if 'strokes' not in data:
+            continue
+        data.setdefault('label', os.path.basename(os.path.dirname(jf)))
+        writer.append(data, sample_id=os.path.splitext(os.path.basename(jf))[0])
+        count += 1
+    return count
+
+# CLI stub
+if __name__ == '__main__':
+    import sys
+    if len(sys.argv) < 3:
+        print('Usage: python shard_store.py <data_dir> <shard_dir>')
+    else:
+        n = convert_json_tree(sys.argv[1], sys.argv[2])
+        print(f'Converted {n} samples into {sys.argv[2]}')
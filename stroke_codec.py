@@ -0,0 +1,278 @@
+# stroke_codec.py
+# MODULE 17: Compact Stroke Payload Codec
+# Binary upload format for stroke samples (mirrors encodeSampleBinary in stroke_recorder.js)
+# plus gzip/deflate body decoding for the backend.
+#
+# Layout (little-endian):
+#   'HWS1' | u8 version | u8 reserved | u16 n_strokes | u32 meta_len | meta (UTF-8 JSON)
+#   per stroke:
+#     u32 n_points | u8 type_len | pointerType (UTF-8) | one column block per COLUMNS entry
+#   column block: u8 encoding, then
+#     ENC_F32     f32[n]                                   raw values (NaN = null)
+#     ENC_DELTA16 f32 scale | f64 first | i16[n-1]         v = first + cumsum(deltas) * scale
+#     ENC_NULL    (nothing)                                every value null
+#     ENC_CONST   f32 value                                every value equal
+#
+# t is in milliseconds (stroke_processing.TIME_UNIT); decode_sample converts payloads that
+# declare or look like seconds (older recorders) so fingerprints and stored JSON agree.
+# Deltas are rounded half up, as Math.round does, so encode_sample and encodeSampleBinary
+# produce the same bytes.
+# Derived point fields are not sent; to_json_sample recomputes dx, dy, velocity and
+# curvature from the decoded x, y, t (stroke_processing.derive_motion).
+
+import json
+import zlib
+import struct
+import numpy as np
+
+from shard_store import COLUMNS
+from stroke_processing import TIME_UNIT, time_scale, derive_motion
+
+MAGIC = b'HWS1'
+VERSION = 1
+CONTENT_TYPE = 'application/vnd.handwriting.strokes'
+MAX_BODY_BYTES = 32 * 1024 * 1024
+# Points per decoded sample; about what a MAX_BODY_BYTES JSON upload can carry
+MAX_POINTS = 200_000
+
+ENC_F32, ENC_DELTA16, ENC_NULL, ENC_CONST = 0, 1, 2, 3
+# Quantization step per column for ENC_DELTA16 (same table as stroke_recorder.js)
+SCALES = {
+    'x': 1 / 64, 'y': 1 / 64, 't': 1e-2, 'p': 1 / 4096,
+    'tiltX': 1 / 16, 'tiltY': 1 / 16, 'azimuth': 1e-4, 'altitude': 1e-4, 'pen_down': 1,
+}
+
+
+class PayloadError(ValueError):
+    """Malformed or oversized upload body."""
+
+
+# ---------- Content-Encoding ----------
+
+def decode_body(body, content_encoding=None, max_bytes=MAX_BODY_BYTES):
+    """Undo gzip / deflate Content-Encoding, refusing bodies that inflate beyond max_bytes."""
+    enc = (content_encoding or '').strip().lower()
+    if enc in ('', 'identity'):
+        return body
+    if enc not in ('gzip', 'x-gzip', 'deflate'):
+        raise PayloadError(f'Unsupported Content-Encoding: {content_encoding}')
+    # gzip header (wbits 31); deflate is usually zlib-wrapped (15) but some clients send raw (-15)
+    candidates = [31] if enc != 'deflate' else [15, -15]
+    for wbits in candidates:
+        d = zlib.decompressobj(wbits)
+        try:
+            out = d.decompress(body, max_bytes + 1)
+        except zlib.error:
+            continue
+        if len(out) > max_bytes or d.unconsumed_tail:
+            raise PayloadError('Decompressed body too large')
+        return out
+    raise PayloadError(f'Invalid {enc} body')
+
+
+class LineDecoder:
+    """
+    Incremental NDJSON splitter for streamed bodies: feed() raw (optionally gzip / deflate)
+    chunks as they arrive and get back the complete lines, without buffering the whole body.
+    """
+
+    def __init__(self, content_encoding=None, max_line=MAX_BODY_BYTES):
+        enc = (content_encoding or '').strip().lower()
+        if enc in ('', 'identity'):
+            self._inflate = None
+        elif enc in ('gzip', 'x-gzip'):
+            self._inflate = zlib.decompressobj(31)
+        elif enc == 'deflate':
+            self._inflate = zlib.decompressobj(15)
+        else:
+            raise PayloadError(f'Unsupported Content-Encoding: {content_encoding}')
+        self.max_line = max_line
+        self._buf = b''
+
+    def _split(self, data):
+        self._buf += data
+        *lines, self._buf = self._buf.split(b'\n')
+        if len(self._buf) > self.max_line:
+            raise PayloadError('NDJSON line too long')
+        return [l for l in lines if l.strip()]
+
+    def feed(self, chunk):
+        if self._inflate is None:
+            return self._split(chunk)
+        try:
+            # Inflate in bounded steps so a small compressed chunk cannot expand unchecked
+            lines = self._split(self._inflate.decompress(chunk, self.max_line))
+            while self._inflate.unconsumed_tail:
+                lines += self._split(self._inflate.decompress(self._inflate.unconsumed_tail, self.max_line))
+        except zlib.error as e:
+            raise PayloadError(f'Invalid compressed body: {e}')
+        return lines
+
+    def close(self):
+        """Flush the final line (bodies need not end with a newline)."""
+        lines = self._split(self._inflate.flush()) if self._inflate is not None else []
+        line, self._buf = self._buf, b''
+        return lines + ([line] if line.strip() else [])
+
+
+# ---------- Binary Encoding ----------
+
+def _encode_column(values, scale):
+    n = len(values)
+    nan = np.isnan(values)
+    if nan.all():
+        return struct.pack('<B', ENC_NULL)
+    if not nan.any():
+        if (values == values[0]).all() and np.float32(values[0]) == values[0]:
+            return struct.pack('<Bf', ENC_CONST, values[0])
+        if n > 1:
+            scale = float(np.float32(scale))  # quantize with the step the decoder will read back
+            # floor(v + 0.5), not np.rint: JS Math.round rounds halves up, rint rounds them to even
+            q = np.floor((values - values[0]) / scale + 0.5).astype(np.int64)
+            d = np.diff(q)
+            exact = np.abs(q * scale + values[0] - values).max() <= scale / 2 + 1e-12
+            if exact and np.abs(d).max() <= 32767:
+                return struct.pack('<Bfd', ENC_DELTA16, scale, values[0]) + d.astype('<i2').tobytes()
+    return struct.pack('<B', ENC_F32) + values.astype('<f4').tobytes()
+
+
+def encode_sample(sample):
+    """Encode a JSON-style sample dict (label, strokes with point dicts) to HWS1 bytes."""
+    meta = {k: v for k, v in sample.items() if k != 'strokes'}
+    meta_bytes = json.dumps(meta, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    strokes = sample.get('strokes', [])
+    out = [MAGIC, struct.pack('<BBHI', VERSION, 0, len(strokes), len(meta_bytes)), meta_bytes]
+    for s in strokes:
+        points = s.get('points', [])
+        ptype = next((p.get('pointerType') for p in points if p.get('pointerType')), '') or ''
+        ptype = ptype.encode('utf-8')
+        out.append(struct.pack('<IB', len(points), len(ptype)) + ptype)
+        cols = np.array([[p.get(c) for c in COLUMNS] for p in points], dtype=np.float64).reshape(len(points), len(COLUMNS))
+        for k, name in enumerate(COLUMNS):
+            out.append(_encode_column(cols[:, k], SCALES[name]))
+    return b''.join(out)
+
+
+# ---------- Binary Decoding ----------
+
+def _column_size(enc, n):
+    if enc == ENC_F32:
+        return 4 * n
+    if enc == ENC_DELTA16:
+        return 12 + 2 * max(n - 1, 0)
+    if enc == ENC_NULL:
+        return 0
+    if enc == ENC_CONST:
+        return 4
+    raise PayloadError(f'Unknown column encoding {enc}')
+
+
+def decode_sample(buf, max_points=MAX_POINTS):
+    """
+    Decode HWS1 bytes straight into NumPy columns, with t converted to milliseconds.
+    Point counts are checked against max_points and against the bytes their column blocks
+    need before any column is allocated.
+    Returns:
+        Dict with the sample's meta fields (time_unit set to 'ms') and 'strokes': list of
+        {'stroke_id', 'pointerType', 'columns': float64 (len(COLUMNS), n)}.
+    """
+    buf = memoryview(buf)
+    try:
+        if bytes(buf[:4]) != MAGIC:
+            raise PayloadError('Not an HWS1 payload')
+        version, _, n_strokes, meta_len = struct.unpack_from('<BBHI', buf, 4)
+        if version != VERSION:
+            raise PayloadError(f'Unsupported HWS version {version}')
+        pos = 12
+        sample = json.loads(bytes(buf[pos:pos + meta_len]).decode('utf-8'))
+        pos += meta_len
+        strokes, total = [], 0
+        for i in range(n_strokes):
+            n, type_len = struct.unpack_from('<IB', buf, pos)
+            pos += 5
+            ptype = bytes(buf[pos:pos + type_len]).decode('utf-8') or None
+            pos += type_len
+            total += n
+            if total > max_points:
+                raise PayloadError(f'Too many points (limit {max_points})')
+            # Walk the column headers first: n must fit the bytes actually sent
+            end = pos
+            for k in range(len(COLUMNS)):
+                (enc,) = struct.unpack_from('<B', buf, end)
+                end += 1 + _column_size(enc, n)
+                if end > len(buf):
+                    raise PayloadError('Truncated HWS1 payload')
+            cols = np.empty((len(COLUMNS), n), dtype=np.float64)
+            for k in range(len(COLUMNS)):
+                (enc,) = struct.unpack_from('<B', buf, pos)
+                pos += 1
+                if enc == ENC_F32:
+                    cols[k] = np.frombuffer(buf, dtype='<f4', count=n, offset=pos)
+                    pos += 4 * n
+                elif enc == ENC_DELTA16:
+                    scale, first = struct.unpack_from('<fd', buf, pos)
+                    pos += 12
+                    d = np.frombuffer(buf, dtype='<i2', count=max(n - 1, 0), offset=pos)
+                    pos += 2 * max(n - 1, 0)
+                    if n:
+                        cols[k, 0] = 0
+                        np.cumsum(d, dtype=np.float64, out=cols[k, 1:])
+                        cols[k] = first + cols[k] * scale
+                elif enc == ENC_NULL:
+                    cols[k] = np.nan
+                else:
+                    (cols[k],) = struct.unpack_from('<f', buf, pos)
+                    pos += 4
+            strokes.append({'stroke_id': i + 1, 'pointerType': ptype, 'columns': cols})
+    except (struct.error, ValueError, UnicodeDecodeError) as e:
+        if isinstance(e, PayloadError):
+            raise
+        raise PayloadError(f'Malformed HWS1 payload: {e}')
+    if pos != len(buf):
+        raise PayloadError('Trailing bytes after HWS1 payload')
+    t_row = COLUMNS.index('t')
+    try:
+        scale = time_scale((s['columns'][t_row] for s in strokes), sample.get('time_unit'))
+    except ValueError as e:
+        raise PayloadError(str(e))
+    if scale != 1.0:
+        for s in strokes:
+            s['columns'][t_row] *= scale
+    sample['time_unit'] = TIME_UNIT
+    sample['strokes'] = strokes
+    return sample
+
+
+# Point key order of stroke_recorder.js getSample()
+POINT_KEYS = ('x', 'y', 't', 'p', 'tiltX', 'tiltY', 'azimuth', 'altitude', 'pointerType',
+              'dx', 'dy', 'velocity', 'curvature', 'pen_down')
+
+
+def to_json_sample(decoded):
+    """
+    Convert a decode_sample() result into the JSON-style dict stored on disk, with dx, dy,
+    velocity and curvature recomputed from x, y, t as the recorder computes them.
+    """
+    sample = {k: v for k, v in decoded.items() if k != 'strokes'}
+    strokes = []
+    for s in decoded['strokes']:
+        cols = dict(zip(COLUMNS, s['columns']))
+        cols['dx'], cols['dy'], cols['velocity'], cols['curvature'] = derive_motion(cols['x'], cols['y'], cols['t'])
+        keys = [k for k in POINT_KEYS if k != 'pointerType']
+        table = np.stack([cols[k] for k in keys])
+        obj = table.astype(object)
+        obj[np.isnan(table)] = None
+        points = []
+        for row in obj.T.tolist():
+            pt = dict(zip(keys, row))
+            if pt['pen_down'] is not None:
+                pt['pen_down'] = bool(pt['pen_down'])
+            pt['pointerType'] = s['pointerType']
+            points.append({k: pt[k] for k in POINT_KEYS})
+        strokes.append({'stroke_id': s['stroke_id'], 'points': points})
+    sample['strokes'] = strokes
+    return sample
+
+
+def count_points(decoded):
+    return sum(s['columns'].shape[1] for s in decoded['strokes'])
@@ -0,0 +1,197 @@
+# stroke_processing.py
+# MODULE 18: Stroke Processing
+# Arc-length resampling and Ramer-Douglas-Peucker simplification of stroke arrays.
+# A stroke is an (N, k) float array with x, y in the first two columns (see cairo_renderer
+# STROKE_FIELDS and data_exporter POINT_FIELDS); every other column is carried along.
+#
+# Error bounds (in the stroke's own units):
+#   resample_arc_length(spacing): new points lie on the original polyline, so the new
+#       polyline is within spacing / 2 of the original (it only cuts corners)
+#   simplify(tolerance): every dropped point is within tolerance of the kept polyline
+#   process_stroke(spacing, tolerance): within spacing / 2 + tolerance
+#
+# Time: point t is stored in milliseconds (TIME_UNIT). Samples may declare 'time_unit'
+# ('ms' or 's'); older clients sent performance.now() seconds without it, which
+# normalize_time detects from the sampling interval and converts.
+
+import numpy as np
+
+
+def arc_length(arr):
+    """Cumulative distance along the stroke at each point; shape (N,)."""
+    if len(arr) == 0:
+        return np.zeros(0)
+    seg = np.hypot(np.diff(arr[:, 0]), np.diff(arr[:, 1]))
+    return np.concatenate([[0.0], np.cumsum(seg)])
+
+
+def interp_column(targets, s, values):
+    """np.interp that skips NaN (null) values; an all-NaN column stays NaN."""
+    valid = ~np.isnan(values)
+    if valid.all():
+        return np.interp(targets, s, values)
+    if not valid.any():
+        return np.full(len(targets), np.nan)
+    return np.interp(targets, s[valid], values[valid])
+
+
+def resample_arc_length(arr, spacing):
+    """
+    Resample a stroke to evenly spaced points along its arc length.
+    Every column is linearly interpolated at the new positions (nulls are interpolated
+    over the points that have values; all-null columns stay NaN). The first and last
+    points are kept, and the actual spacing is at most `spacing`.
+    Args:
+        arr: (N, k) stroke array, x and y in columns 0 and 1
+        spacing: Target distance between points (> 0)
+    Returns:
+        (M, k) float64 array.
+    """
+    arr = np.asarray(arr, dtype=np.float64)
+    if len(arr) < 2:
+        return arr.copy()
+    # Repeated positions add no length and would make the arc-length axis non-increasing
+    seg = np.hypot(np.diff(arr[:, 0]), np.diff(arr[:, 1]))
+    arr = arr[np.concatenate([[True], seg > 0])]
+    s = arc_length(arr)
+    total = s[-1]
+    if total == 0:
+        return arr[:1].copy()
+    n = int(np.ceil(total / spacing)) + 1
+    targets = np.linspace(0.0, total, n)
+    return np.stack([interp_column(targets, s, arr[:, c]) for c in range(arr.shape[1])], axis=1)
+
+
+def _segment_distance(pts, a, b):
+    """Distance from each row of pts to the segment a-b."""
+    ab = b - a
+    denom = ab @ ab
+    if denom == 0:
+        return np.hypot(*(pts - a).T)
+    u = np.clip((pts - a) @ ab / denom, 0.0, 1.0)
+    proj = a + u[:, None] * ab
+    return np.hypot(*(pts - proj).T)
+
+
+def rdp_mask(xy, tolerance):
+    """
+    Ramer-Douglas-Peucker simplification of an (N, 2) polyline (iterative, no recursion limit).
+    Returns:
+        Boolean mask of points to keep; endpoints are always kept.
+    """
+    n = len(xy)
+    keep = np.zeros(n, dtype=bool)
+    if n == 0:
+        return keep
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        a, b = stack.pop()
+        if b - a < 2:
+            continue
+        d = _segment_distance(xy[a + 1:b], xy[a], xy[b])
+        i = int(np.argmax(d))
+        if d[i] > tolerance:
+            k = a + 1 + i
+            keep[k] = True
+            stack.append((a, k))
+            stack.append((k, b))
+    return keep
+
+
+def simplify(arr, tolerance):
+    """Drop points not needed to stay within tolerance of the stroke; kept rows are unchanged."""
+    arr = np.asarray(arr, dtype=np.float64)
+    if len(arr) < 3:
+        return arr.copy()
+    return arr[rdp_mask(arr[:, :2], tolerance)]
+
+
+def process_stroke(arr, spacing=None, tolerance=None):
+    """
+    Resample (if spacing) then simplify (if tolerance) one stroke array.
+    With both unset the stroke is returned unchanged.
+    """
+    if spacing:
+        arr = resample_arc_length(arr, spacing)
+    if tolerance:
+        arr = simplify(arr, tolerance)
+    return arr
+
+
+# ---------- Time Units and Motion ----------
+
+TIME_UNIT = 'ms'
+TIME_SCALES = {'ms': 1.0, 's': 1000.0}
+# Median point interval below this (in the recorded unit) can only be seconds: 0.5 ms would be 2 kHz sampling
+SECONDS_MAX_INTERVAL = 0.5
+
+
+def time_scale(stroke_times, unit=None):
+    """
+    Factor converting point times to milliseconds.
+    Args:
+        stroke_times: Iterable of per-stroke time sequences (None / NaN allowed)
+        unit: The sample's declared 'time_unit'; when None the unit is guessed from the median interval
+    """
+    if unit is not None:
+        if unit not in TIME_SCALES:
+            raise ValueError(f'Unknown time_unit {unit!r}')
+        return TIME_SCALES[unit]
+    gaps = []
+    for t in stroke_times:
+        t = np.asarray(t, dtype=np.float64)
+        gaps.append(np.diff(t[~np.isnan(t)]))
+    return interval_time_scale(np.concatenate(gaps) if gaps else [])
+
+
+def interval_time_scale(intervals):
+    """Factor converting to milliseconds, guessed from point intervals in the recorded unit."""
+    intervals = np.asarray(intervals, dtype=np.float64)
+    intervals = intervals[intervals > 0]
+    if len(intervals) and np.median(intervals) < SECONDS_MAX_INTERVAL:
+        return TIME_SCALES['s']
+    return TIME_SCALES['ms']
+
+
+def normalize_time(sample):
+    """Convert a JSON-style sample's point times to milliseconds in place; sets time_unit. Returns the sample."""
+    strokes = sample.get('strokes', [])
+    if sample.get('time_unit') != TIME_UNIT:
+        scale = time_scale(([np.nan if p.get('t') is None else p['t'] for p in s.get('points', [])] for s in strokes),
+                           sample.get('time_unit'))
+        if scale != 1.0:
+            for s in strokes:
+                for p in s.get('points', []):
+                    if p.get('t') is not None:
+                        p['t'] = p['t'] * scale
+    sample['time_unit'] = TIME_UNIT
+    return sample
+
+
+def derive_motion(x, y, t):
+    """
+    Per-point dx, dy, velocity (px/s, t in ms) and 3-point curvature of one stroke, computed
+    like stroke_recorder.js derivePoint. The first point has no dx / dy / velocity and the
+    first two no curvature (NaN).
+    Returns:
+        (dx, dy, velocity, curvature) float64 arrays of len(x).
+    """
+    x, y, t = (np.asarray(v, dtype=np.float64) for v in (x, y, t))
+    n = len(x)
+    dx, dy, velocity, curvature = (np.full(n, np.nan) for _ in range(4))
+    if n > 1:
+        dx[1:], dy[1:] = np.diff(x), np.diff(y)
+        dt = np.diff(t)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            velocity[1:] = np.where(dt > 0, np.sqrt(dx[1:] * dx[1:] + dy[1:] * dy[1:]) / dt * 1000, 0.0)
+    if n > 2:
+        a = np.hypot(x[1:-1] - x[:-2], y[1:-1] - y[:-2])
+        b = np.hypot(x[2:] - x[1:-1], y[2:] - y[1:-1])
+        c = np.hypot(x[2:] - x[:-2], y[2:] - y[:-2])
+        s = (a + b + c) / 2
+        area = np.sqrt(np.maximum(s * (s - a) * (s - b) * (s - c), 0))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            k = 4 * area / (a * b * c)
+        curvature[2:] = np.where((a == 0) | (b == 0) | (c == 0) | (area == 0), 0.0, k)
+    return dx, dy, velocity, curvature
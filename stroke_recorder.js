@@ -1,6 +1,138 @@
 // stroke_recorder.js
 // MODULE 2: Pointer Event Stroke Recorder
-// Captures stylus metadata per point, supports multiple strokes, and outputs JSON.
+// Captures stylus metadata per point, supports multiple strokes, and outputs JSON
+// or the compact HWS1 binary format decoded by stroke_codec.py (Module 17).
+// Point times t are performance.now() milliseconds (the unit of the stored corpus);
+// samples carry time_unit: 'ms' and velocity is in px/s.
+
+// HWS1 column order and quantization steps; must match stroke_codec.py
+export const HWS_COLUMNS = ['x', 'y', 't', 'p', 'tiltX', 'tiltY', 'azimuth', 'altitude', 'pen_down'];
+export const HWS_SCALES = {
+  x: 1 / 64, y: 1 / 64, t: 1e-2, p: 1 / 4096,
+  tiltX: 1 / 16, tiltY: 1 / 16, azimuth: 1e-4, altitude: 1e-4, pen_down: 1
+};
+export const HWS_CONTENT_TYPE = 'application/vnd.handwriting.strokes';
+const ENC_F32 = 0, ENC_DELTA16 = 1, ENC_NULL = 2, ENC_CONST = 3;
+
+function utf8(str) {
+  if (typeof TextEncoder !== 'undefined') return new TextEncoder().encode(str);
+  const bin = unescape(encodeURIComponent(str));
+  return Uint8Array.from(bin, c => c.charCodeAt(0));
+}
+
+// Pick the smallest exact encoding for one column (see stroke_codec._encode_column)
+function encodeColumn(values, scale) {
+  const n = values.length;
+  const nulls = values.filter(v => v === null || v === undefined || Number.isNaN(v)).length;
+  if (nulls === n) return { enc: ENC_NULL, bytes: 1 };
+  if (nulls === 0) {
+    if (values.every(v => v === values[0]) && Math.fround(values[0]) === values[0]) return { enc: ENC_CONST, bytes: 5, value: values[0] };
+    if (n > 1) {
+      const step = Math.fround(scale);
+      const q = values.map(v => Math.round((v - values[0]) / step));
+      let ok = true;
+      for (let i = 0; i < n && ok; ++i) {
+        if (Math.abs(q[i] * step + values[0] - values[i]) > step / 2 + 1e-12) ok = false;
+        if (i > 0 && Math.abs(q[i] - q[i - 1]) > 32767) ok = false;
+      }
+      if (ok) return { enc: ENC_DELTA16, bytes: 13 + 2 * (n - 1), step, first: values[0], q };
+    }
+  }
+  return { enc: ENC_F32, bytes: 1 + 4 * n, values };
+}
+
+/**
+ * Encode a getSample() object as HWS1 bytes:
+ * delta-encoded int16 / float32 columns per stroke behind a small header.
+ * Derived fields (dx, dy, velocity, curvature) are dropped; stroke_codec.to_json_sample
+ * recomputes them from the decoded x, y, t with derivePoint's formulas.
+ */
+export function encodeSampleBinary(sample) {
+  const { strokes = [], ...meta } = sample;
+  const metaBytes = utf8(JSON.stringify(meta));
+  const blocks = strokes.map(s => {
+    const pts = s.points || [];
+    const first = pts.find(pt => pt.pointerType);
+    const typeBytes = utf8(first ? first.pointerType : '');
+    const cols = HWS_COLUMNS.map(c => encodeColumn(
+      pts.map(pt => (typeof pt[c] === 'boolean' ? Number(pt[c]) : pt[c])), HWS_SCALES[c]));
+    return { n: pts.length, typeBytes, cols };
+  });
+  let size = 12 + metaBytes.length;
+  for (const b of blocks) size += 5 + b.typeBytes.length + b.cols.reduce((a, c) => a + c.bytes, 0);
+
+  const out = new Uint8Array(size);
+  const view = new DataView(out.buffer);
+  out.set([0x48, 0x57, 0x53, 0x31], 0); // 'HWS1'
+  view.setUint8(4, 1);
+  view.setUint8(5, 0);
+  view.setUint16(6, strokes.length, true);
+  view.setUint32(8, metaBytes.length, true);
+  out.set(metaBytes, 12);
+  let pos = 12 + metaBytes.length;
+  for (const b of blocks) {
+    view.setUint32(pos, b.n, true);
+    view.setUint8(pos + 4, b.typeBytes.length);
+    out.set(b.typeBytes, pos + 5);
+    pos += 5 + b.typeBytes.length;
+    for (const c of b.cols) {
+      view.setUint8(pos++, c.enc);
+      if (c.enc === ENC_CONST) {
+        view.setFloat32(pos, c.value, true);
+        pos += 4;
+      } else if (c.enc === ENC_DELTA16) {
+        view.setFloat32(pos, c.step, true);
+        view.setFloat64(pos + 4, c.first, true);
+        pos += 12;
+        for (let i = 1; i < c.q.length; ++i, pos += 2) view.setInt16(pos, c.q[i] - c.q[i - 1], true);
+      } else if (c.enc === ENC_F32) {
+        for (const v of c.values) {
+          view.setFloat32(pos, v === null || v === undefined ? NaN : v, true);
+          pos += 4;
+        }
+      }
+    }
+  }
+  return out;
+}
+
+/**
+ * Gzip bytes for upload with 'Content-Encoding: gzip' where CompressionStream exists.
+ * Resolves to { body, encoding } with encoding null when compression is unavailable.
+ */
+export async function compressPayload(bytes) {
+  if (typeof CompressionStream === 'undefined') return { body: bytes, encoding: null };
+  const stream = new Blob([bytes]).stream().pipeThrough(new CompressionStream('gzip'));
+  return { body: new Uint8Array(await new Response(stream).arrayBuffer()), encoding: 'gzip' };
+}
+
+// 3-point curvature estimation (circle fitting)
+function estimateCurvature(p1, p2, p3) {
+  const a = Math.hypot(p2.x - p1.x, p2.y - p1.y);
+  const b = Math.hypot(p3.x - p2.x, p3.y - p2.y);
+  const c = Math.hypot(p3.x - p1.x, p3.y - p1.y);
+  if (a === 0 || b === 0 || c === 0) return 0;
+  const s = (a + b + c) / 2;
+  const area = Math.sqrt(Math.max(s * (s - a) * (s - b) * (s - c), 0));
+  return area === 0 ? 0 : (4 * area) / (a * b * c);
+}
+
+/**
+ * Derived fields of point pt given the stroke's last point and the one before it (null when absent):
+ * dx, dy, velocity (px/s from t in ms) and curvature. Mirrored by stroke_processing.derive_motion.
+ */
+export function derivePoint(prev, last, pt) {
+  if (!last) return { dx: null, dy: null, velocity: null, curvature: null };
+  const dx = pt.x - last.x;
+  const dy = pt.y - last.y;
+  const dt = pt.t - last.t;
+  return {
+    dx,
+    dy,
+    velocity: dt > 0 ? Math.sqrt(dx*dx + dy*dy) / dt * 1000 : 0,
+    curvature: prev ? estimateCurvature(prev, last, pt) : null
+  };
+}
 
 export class StrokeRecorder {
   constructor(canvas, deviceName = 'Unknown Device') {
@@ -83,25 +215,17 @@ export class StrokeRecorder {
     const rect = this.canvas.getBoundingClientRect();
     const x = e.clientX - rect.left;
     const y = e.clientY - rect.top;
-    const t = performance.now() / 1000; // seconds
+    const t = performance.now(); // milliseconds
     const p = e.pressure ?? null;
     const tiltX = e.tiltX ?? null;
     const tiltY = e.tiltY ?? null;
     const azimuth = e.azimuthAngle ?? null;
     const altitude = e.altitudeAngle ?? null;
     const pointerType = e.pointerType ?? null;
-    let dx = null, dy = null, velocity = null, curvature = null;
-    if (this._lastPoint) {
-      dx = x - this._lastPoint.x;
-      dy = y - this._lastPoint.y;
-      const dt = t - this._lastTime;
-      velocity = dt > 0 ? Math.sqrt(dx*dx + dy*dy) / dt : 0;
-      // Curvature estimation (3-point):
-      if (this.currentStroke.points.length > 1) {
-        const prev = this.currentStroke.points[this.currentStroke.points.length - 2];
-        curvature = this._estimateCurvature(prev, this._lastPoint, {x, y});
-      }
-    }
+    const pts = this.currentStroke.points;
+    const last = this._lastPoint ? { x: this._lastPoint.x, y: this._lastPoint.y, t: this._lastTime } : null;
+    const prev = last && pts.length > 1 ? pts[pts.length - 2] : null;
+    const { dx, dy, velocity, curvature } = derivePoint(prev, last, { x, y, t });
     const point = {
       x, y, t, p, tiltX, tiltY, azimuth, altitude, pointerType, dx, dy, velocity, curvature, pen_down: penDown || e.buttons === 1
     };
@@ -111,18 +235,8 @@ export class StrokeRecorder {
     this._samplingTimes.push(t);
   }
 
-  _estimateCurvature(p1, p2, p3) {
-    // 3-point curvature estimation (circle fitting)
-    const a = Math.hypot(p2.x - p1.x, p2.y - p1.y);
-    const b = Math.hypot(p3.x - p2.x, p3.y - p2.y);
-    const c = Math.hypot(p3.x - p1.x, p3.y - p1.y);
-    if (a === 0 || b === 0 || c === 0) return 0;
-    const s = (a + b + c) / 2;
-    const area = Math.sqrt(Math.max(s * (s - a) * (s - b) * (s - c), 0));
-    return area === 0 ? 0 : (4 * area) / (a * b * c);
-  }
-
-  getSample(label = '', timestamp = null) {
+  // format: 'json' (default) returns the sample object, 'binary' returns HWS1 bytes (Uint8Array)
+  getSample(label = '', timestamp = null, format = 'json') {
     // Auto-detect sampling rate
     let sampling_rate = null;
     if (this._samplingTimes.length > 1) {
@@ -131,13 +245,14 @@ export class StrokeRecorder {
         intervals.push(this._samplingTimes[i] - this._samplingTimes[i-1]);
       }
       const mean = intervals.reduce((a, b) => a + b, 0) / intervals.length;
-      sampling_rate = mean > 0 ? (1 / mean).toFixed(2) : null;
+      sampling_rate = mean > 0 ? (1000 / mean).toFixed(2) : null; // Hz
     }
-    return {
+    const sample = {
       label,
       device: this.deviceName,
       timestamp: timestamp || new Date().toISOString(),
       sampling_rate,
+      time_unit: 'ms',
       strokes: this.strokes.map(s => ({
         stroke_id: s.stroke_id,
         points: s.points.map(pt => ({
@@ -147,5 +262,6 @@ export class StrokeRecorder {
         }))
       }))
     };
+    return format === 'binary' ? encodeSampleBinary(sample) : sample;
   }
 } 
\ No newline at end of file
@@ -1,4 +1,4 @@
-import { StrokeRecorder } from './stroke_recorder.js';
+import { StrokeRecorder, HWS_COLUMNS, derivePoint } from './stroke_recorder.js';
 
 document.body.innerHTML = '<canvas id="test-canvas" width="400" height="400"></canvas>';
 const canvas = document.getElementById('test-canvas');
@@ -36,6 +36,7 @@ describe('StrokeRecorder', () => {
     const sample = recorder.getSample('A');
     expect(sample.label).toBe('A');
     expect(sample.device).toBe('Test Device');
+    expect(sample.time_unit).toBe('ms');
     expect(sample.strokes.length).toBe(1);
     expect(sample.strokes[0].points.length).toBeGreaterThanOrEqual(2);
     const pt = sample.strokes[0].points[0];
@@ -87,4 +88,37 @@ describe('StrokeRecorder', () => {
     expect(pt.azimuth).toBeNull();
     expect(pt.altitude).toBeNull();
   });
-}); 
\ No newline at end of file
+
+  test('derivePoint matches the recorded derived fields', () => {
+    firePointer('pointerdown', { clientX: 100, clientY: 100 });
+    firePointer('pointermove', { clientX: 110, clientY: 100 });
+    firePointer('pointermove', { clientX: 110, clientY: 110 });
+    firePointer('pointerup', { clientX: 110, clientY: 110 });
+    const pts = recorder.getSample('F').strokes[0].points;
+    expect(derivePoint(null, null, pts[0])).toEqual({ dx: null, dy: null, velocity: null, curvature: null });
+    for (let i = 1; i < pts.length; ++i) {
+      const d = derivePoint(i > 1 ? pts[i - 2] : null, pts[i - 1], pts[i]);
+      expect(d).toEqual({ dx: pts[i].dx, dy: pts[i].dy, velocity: pts[i].velocity, curvature: pts[i].curvature });
+    }
+    expect(pts[1].dx).toBe(10);
+  });
+
+  test('binary format encodes an HWS1 payload', () => {
+    firePointer('pointerdown', { clientX: 100, clientY: 100 });
+    firePointer('pointermove', { clientX: 110, clientY: 110 });
+    firePointer('pointerup', { clientX: 120, clientY: 120 });
+    const json = recorder.getSample('E', '2025-01-01T00:00:00Z');
+    const bytes = recorder.getSample('E', '2025-01-01T00:00:00Z', 'binary');
+    expect(bytes).toBeInstanceOf(Uint8Array);
+    expect(String.fromCharCode(...bytes.slice(0, 4))).toBe('HWS1');
+    const view = new DataView(bytes.buffer);
+    expect(view.getUint16(6, true)).toBe(json.strokes.length);
+    const metaLen = view.getUint32(8, true);
+    const meta = JSON.parse(String.fromCharCode(...bytes.slice(12, 12 + metaLen)));
+    expect(meta.label).toBe('E');
+    expect(meta).not.toHaveProperty('strokes');
+    expect(view.getUint32(12 + metaLen, true)).toBe(json.strokes[0].points.length);
+    expect(HWS_COLUMNS).toContain('pen_down');
+    expect(bytes.length).toBeLessThan(JSON.stringify(json).length);
+  });
+});
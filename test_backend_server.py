@@ -0,0 +1,220 @@
+# test_backend_server.py
+# Upload, bulk upload and read API of the backend server (Module 5), against a temporary data root.
+# Run: python -m pytest -q
+
+import io
+import os
+import json
+import zlib
+import tarfile
+import pytest
+from fastapi import Request
+from fastapi.testclient import TestClient
+
+import backend_server
+from ingest_pipeline import IngestPipeline
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+CORPUS = os.path.join(ROOT, 'handwriting_data')
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    data_root = str(tmp_path / 'data')
+    meta = os.path.join(data_root, 'metadata.sqlite')
+    os.makedirs(data_root)
+    monkeypatch.setattr(backend_server, 'DATA_ROOT', data_root)
+    monkeypatch.setattr(backend_server, 'META_FILE', meta)
+    monkeypatch.setattr(backend_server, 'FINGERPRINT_DB', os.path.join(data_root, 'fingerprints.sqlite'))
+    monkeypatch.setattr(backend_server, 'PIPELINE', IngestPipeline(meta, workers=1))
+    monkeypatch.setattr(backend_server, 'RECENT_KEYS', type(backend_server.RECENT_KEYS)())
+    monkeypatch.setenv('FINGERPRINT_BACKFILL', '0')
+    return backend_server
+
+
+def _sample(name='20250712_155124', label='+', **fields):
+    with open(os.path.join(CORPUS, label, name + '.json'), 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    data.pop('device', None)
+    data.update(fields)
+    return data
+
+
+def test_device_less_uploads_do_not_collide(server):
+    a = _sample(timestamp='2025-07-04T22:20:04.000Z')
+    b = _sample(timestamp='2025-07-04T22:20:04.000Z')
+    b['strokes'] = b['strokes'][:1]
+    with TestClient(server.app) as client:
+        ra = client.post('/save_stroke_data', json=a)
+        rb = client.post('/save_stroke_data', json=b)
+        assert ra.status_code == rb.status_code == 202
+        assert ra.json()['json_path'] != rb.json()['json_path']
+        batch = '\n'.join(json.dumps(dict(s, strokes=s['strokes'][:k])) for k, s in ((2, a), (3, a)))
+        r = client.post('/save_stroke_batch', content=batch)
+        assert r.json()['queued'] == 2
+    # Written once the pipeline drains at shutdown
+    assert all(os.path.exists(p) for p in (ra.json()['json_path'], rb.json()['json_path']))
+    assert len(server.get_store(server.META_FILE).query(label='+')) == 4
+
+
+def test_device_id_keeps_json_and_png_together(server):
+    ts = '2025-07-04T22:20:04.000Z'
+    assert server.sample_ulid('A', ts, 'tablet-1') == server.sample_ulid('A', ts, 'tablet-1')
+    assert server.sample_ulid('A', ts, 'tablet-1') != server.sample_ulid('A', ts, 'tablet-2')
+    assert server.sample_ulid('A', ts) != server.sample_ulid('A', ts)
+    # Device-less ids still sort by the client time
+    assert server.sample_ulid('A', ts)[:10] == server.sample_ulid('A', ts, 'tablet-1')[:10]
+
+
+# ---------- NDJSON Bulk Upload ----------
+
+SESSION = ['20250710_093008', '20250710_093011', '20250710_093014', '20250710_093015']
+
+
+def _session(device='tablet-1'):
+    return [_sample(name, 'B', device=device, timestamp=f'2025-07-10T09:30:{k:02d}.000Z')
+            for k, name in enumerate(SESSION)]
+
+
+def _ndjson(samples):
+    return '\n'.join(json.dumps(s) for s in samples).encode('utf-8')
+
+
+def test_batch_reupload_is_deduped(server):
+    body = _ndjson(_session())
+    with TestClient(server.app) as client:
+        first = client.post('/save_stroke_batch', content=body).json()
+        assert (first['queued'], first['duplicate'], first['error']) == (4, 0, 0)
+        # Rows not written yet: caught by the recently queued keys
+        again = client.post('/save_stroke_batch', content=body).json()
+        assert (again['queued'], again['duplicate']) == (0, 4)
+    # After a restart the stored metadata rows catch it
+    server.RECENT_KEYS.clear()
+    with TestClient(server.app) as client:
+        again = client.post('/save_stroke_batch', content=body).json()
+        assert (again['queued'], again['duplicate']) == (0, 4)
+        # Another device with the same timestamps is not a key match; its identical strokes are
+        # caught by the content fingerprint instead
+        other = client.post('/save_stroke_batch', content=_ndjson(_session('tablet-2'))).json()
+        assert other['duplicate'] == 4 and all('duplicate_of' in res for res in other['results'])
+    assert len(server.get_store(server.META_FILE).query(label='B')) == 4
+
+
+def test_batch_reports_bad_lines_and_keeps_the_rest(server):
+    session = _session()
+    lines = [json.dumps(session[0]), '{not json', '[1, 2]', json.dumps(session[1])]
+    with TestClient(server.app) as client:
+        r = client.post('/save_stroke_batch', content='\n'.join(lines).encode('utf-8'))
+        assert r.status_code == 200
+        out = r.json()
+    assert (out['queued'], out['duplicate'], out['error']) == (2, 0, 2)
+    assert [res['status'] for res in out['results']] == ['queued', 'error', 'error', 'queued']
+    assert [res['line'] for res in out['results']] == [0, 1, 2, 3]
+    assert all(os.path.exists(res['json_path']) for res in out['results'] if res['status'] == 'queued')
+
+
+def _post_chunks(client, server, chunks, headers=()):
+    # TestClient sends a body as one chunk; drive the endpoint with separate ones on the app's loop
+    messages = [{'type': 'http.request', 'body': c, 'more_body': True} for c in chunks]
+    messages.append({'type': 'http.request', 'body': b'', 'more_body': False})
+
+    async def receive():
+        return messages.pop(0)
+
+    async def call():
+        scope = {'type': 'http', 'method': 'POST', 'path': '/save_stroke_batch',
+                 'headers': [(k.lower().encode(), v.encode()) for k, v in headers]}
+        return await server.save_stroke_batch(Request(scope, receive))
+    return client.portal.call(call)
+
+
+def test_corrupt_stream_keeps_earlier_chunks(server):
+    session = _session()
+    z = zlib.compressobj(wbits=31)
+    head = z.compress(_ndjson(session[:2]) + b'\n') + z.flush(zlib.Z_SYNC_FLUSH)
+    with TestClient(server.app) as client:
+        r = _post_chunks(client, server, [head, b'\xff' * 64], [('Content-Encoding', 'gzip')])
+        assert r.status_code == 400
+        assert [res['status'] for res in json.loads(r.body)['results']] == ['queued', 'queued']
+        # The client re-sends the whole session: the two that made it are duplicates
+        z = zlib.compressobj(wbits=31)
+        full = z.compress(_ndjson(session)) + z.flush()
+        out = client.post('/save_stroke_batch', content=full, headers={'Content-Encoding': 'gzip'}).json()
+        assert (out['queued'], out['duplicate']) == (2, 2)
+    assert len(server.get_store(server.META_FILE).query(label='B')) == 4
+
+# ---------- Read API ----------
+
+def _stored_session(server):
+    # Upload a session and let the pipeline write it (it drains when the client shuts down)
+    with TestClient(server.app) as client:
+        for data in _session():
+            assert client.post('/save_stroke_data', json=data).status_code == 202
+        png = os.path.join(CORPUS, 'B', SESSION[0] + '.png')
+        with open(png, 'rb') as f:
+            r = client.post('/upload_png', files={'file': ('s.png', f, 'image/png')},
+                            data={'label': 'B', 'timestamp': '2025-07-10T09:30:00.000Z', 'device': 'tablet-1'})
+        assert r.status_code == 202
+    return sorted(e['sample_id'] for e in server.get_store(server.META_FILE).query(label='B'))
+
+
+def test_samples_paginate_with_a_cursor(server):
+    ids = _stored_session(server)
+    assert len(ids) == 4
+    with TestClient(server.app) as client:
+        seen, cursor, pages = [], None, 0
+        while True:
+            params = {'label': 'B', 'limit': 3}
+            if cursor is not None:
+                params['cursor'] = cursor
+            page = client.get('/samples', params=params).json()
+            seen += [e['sample_id'] for e in page['items']]
+            pages += 1
+            cursor = page['next_cursor']
+            if cursor is None:
+                break
+        assert pages == 2 and sorted(seen) == ids and len(set(seen)) == len(seen)
+        assert client.get('/samples', params={'label': 'A'}).json() == {'items': [], 'next_cursor': None}
+        few = client.get('/samples', params={'label': 'B', 'max_points': 47}).json()['items']
+        assert few and all(e['total_points'] <= 47 for e in few) and len(few) < 4
+
+
+def test_sample_reads_use_etags(server):
+    ids = _stored_session(server)
+    label, sample = ids[0].split('/')
+    with TestClient(server.app) as client:
+        r = client.get(f'/samples/{label}/{sample}')
+        assert r.status_code == 200 and json.loads(r.content)['label'] == 'B'
+        etag = r.headers['etag']
+        assert client.get(f'/samples/{label}/{sample}', headers={'If-None-Match': etag}).status_code == 304
+        # A rewritten file gets a new tag
+        entry = server.get_store(server.META_FILE).get(ids[0])
+        st = os.stat(entry['json_path'])
+        os.utime(entry['json_path'], ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+        r = client.get(f'/samples/{label}/{sample}', headers={'If-None-Match': etag})
+        assert r.status_code == 200 and r.headers['etag'] != etag
+        assert client.get(f'/samples/{label}/missing').status_code == 404
+        # The tablet PNG shares the JSON's id (same label / device / timestamp)
+        with_png = [e for e in server.get_store(server.META_FILE).query(label='B') if e.get('png_path')]
+        assert len(with_png) == 1
+        png = client.get(f"/samples/{with_png[0]['sample_id']}/png")
+        assert png.status_code == 200 and png.content[:4] == b'\x89PNG'
+        assert client.get(f"/samples/{with_png[0]['sample_id']}/png",
+                          headers={'If-None-Match': png.headers['etag']}).status_code == 304
+        assert client.get(f"/samples/{with_png[0]['sample_id']}/png", params={'kind': 'bogus'}).status_code == 400
+
+
+def test_label_archives_stream_every_sample(server):
+    ids = _stored_session(server)
+    with TestClient(server.app) as client:
+        r = client.get('/labels/B/archive')
+        assert r.status_code == 200
+        lines = [json.loads(l) for l in r.content.splitlines()]
+        assert sorted(l['sample_id'] for l in lines) == ids
+        assert all(l['strokes'] for l in lines)
+        r = client.get('/labels/B/archive', params={'fmt': 'tar'})
+        with tarfile.open(fileobj=io.BytesIO(r.content)) as tar:
+            names = tar.getnames()
+        assert sorted(n for n in names if n.endswith('.json')) == sorted(f'{i}.json' for i in ids)
+        assert sum(n.endswith('.png') for n in names) == 1
+        assert client.get('/labels/B/archive', params={'fmt': 'zip'}).status_code == 400
@@ -0,0 +1,177 @@
+# test_data_exporter.py
+# Shard, HDF5 and incremental-manifest export tests for Module 10.
+# Run: python -m pytest -q
+
+import os
+import json
+import shutil
+import numpy as np
+import pytest
+
+from data_exporter import (export_data, export_shards, export_tfrecord, export_h5, ExportShardReader, H5SampleReader,
+                           load_manifest, sample_to_arrays, example_to_sample, hash_split, sample_key, POINT_FIELDS)
+from tfrecord_io import iter_examples
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+CORPUS = os.path.join(ROOT, 'handwriting_data')
+
+
+def _copy_corpus(dst):
+    for label in sorted(os.listdir(CORPUS)):
+        src = os.path.join(CORPUS, label)
+        if os.path.isdir(src):
+            shutil.copytree(src, os.path.join(dst, label))
+    return sorted(os.path.join(dst, label, f) for label in os.listdir(dst)
+                  for f in os.listdir(os.path.join(dst, label)) if f.endswith('.json'))
+
+
+def _exported(out_dir):
+    """{(label, n_points)} multiset of every live sample across the three splits."""
+    rows = []
+    for split in ('train', 'val', 'test'):
+        split_dir = os.path.join(out_dir, split)
+        if os.path.exists(os.path.join(split_dir, 'index.json')):
+            lengths, labels = ExportShardReader(split_dir).lengths_and_labels()
+            rows += list(zip(labels, lengths.tolist()))
+    return sorted(rows)
+
+
+def _expected(files):
+    rows = []
+    for jf in files:
+        with open(jf, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        # Exported under the label folder, not the JSON label
+        rows.append((os.path.basename(os.path.dirname(jf)), sum(len(s['points']) for s in data['strokes'])))
+    return sorted(rows)
+
+
+def test_shards_round_trip(tmp_path):
+    files = _copy_corpus(tmp_path / 'data')
+    n = export_shards(files, str(tmp_path / 'out'), shard_size=4)
+    reader = ExportShardReader(str(tmp_path / 'out'))
+    assert n == len(reader) == len(files)
+    assert reader.fields == POINT_FIELDS
+    for i in (0, len(files) // 2, len(files) - 1):
+        with open(files[i], 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        values, lengths = sample_to_arrays(data)
+        label, strokes = reader[i]
+        assert label == data['label']
+        assert [len(s) for s in strokes] == lengths.tolist()
+        np.testing.assert_array_equal(np.concatenate(strokes), values)
+
+
+def test_incremental_manifest(tmp_path):
+    data_dir, out_dir = tmp_path / 'data', str(tmp_path / 'out')
+    files = _copy_corpus(data_dir)
+
+    stats = export_data(str(data_dir), out_dir, fmt='shards', incremental=True, shard_size=4)
+    assert stats == {'added': len(files), 'updated': 0, 'removed': 0, 'unchanged': 0}
+    assert _exported(out_dir) == _expected(files)
+    manifest = load_manifest(out_dir)
+    assert len(manifest['samples']) == len(files)
+
+    # Nothing changed: no new shards
+    shards_before = sorted(os.listdir(os.path.join(out_dir, 'train')))
+    stats = export_data(str(data_dir), out_dir, fmt='shards', incremental=True, shard_size=4)
+    assert stats['unchanged'] == len(files) and stats['added'] == stats['updated'] == 0
+    assert sorted(os.listdir(os.path.join(out_dir, 'train'))) == shards_before
+
+    # Touched but identical content: caught by the hash, mtime is refreshed
+    os.utime(files[0], (0, 0))
+    assert export_data(str(data_dir), out_dir, fmt='shards', incremental=True)['unchanged'] == len(files)
+
+    # Changed, deleted and new samples
+    with open(files[1], 'r', encoding='utf-8') as f:
+        changed = json.load(f)
+    changed['strokes'] = changed['strokes'][:1]
+    changed['strokes'][0]['points'] = changed['strokes'][0]['points'][:2]
+    with open(files[1], 'w', encoding='utf-8') as f:
+        json.dump(changed, f)
+    os.remove(files[2])
+    new = os.path.join(os.path.dirname(files[0]), 'new_sample.json')
+    shutil.copy(files[3], new)
+    stats = export_data(str(data_dir), out_dir, fmt='shards', incremental=True, shard_size=4)
+    assert stats == {'added': 1, 'updated': 1, 'removed': 1, 'unchanged': len(files) - 2}
+    current = sorted(files[:2] + files[3:] + [new])
+    assert _exported(out_dir) == _expected(current)
+    assert set(load_manifest(out_dir)['samples']) == {
+        f'{os.path.basename(os.path.dirname(p))}/{os.path.splitext(os.path.basename(p))[0]}' for p in current}
+
+
+def test_npz_split_is_stable(tmp_path):
+    # npz uses the same hash split as the other formats: adding samples never moves existing ones
+    files = _copy_corpus(tmp_path / 'data')
+
+    def membership(out):
+        export_data(str(tmp_path / 'data'), str(out), fmt='npz')
+        rows = {}
+        for split in ('train', 'val', 'test'):
+            with np.load(os.path.join(out, split, 'data.npz'), allow_pickle=True) as npz:
+                for y, x in zip(npz['y'].tolist(), npz['X']):
+                    rows.setdefault(split, []).append((y, sum(len(s['points']) for s in x)))
+        return {k: sorted(v) for k, v in rows.items()}
+
+    before = membership(tmp_path / 'out1')
+    for split, expected in before.items():
+        assert expected == _expected([f for f in files if hash_split(sample_key(f)) == split])
+    shutil.copy(files[0], os.path.join(os.path.dirname(files[0]), 'zz_new.json'))
+    after = membership(tmp_path / 'out2')
+    new_split = hash_split(sample_key(os.path.join(os.path.dirname(files[0]), 'zz_new.json')))
+    added = _expected([files[0]])[0]
+    for split in before:
+        grown = sorted(before[split] + ([added] if split == new_split else []))
+        assert after.get(split, []) == grown
+
+
+def test_tfrecord_sample_id_includes_label(tmp_path):
+    files = _copy_corpus(tmp_path / 'data')
+    # Same stem under two labels must not collide
+    clash = os.path.join(tmp_path, 'data', 'B', os.path.basename(files[0]))
+    shutil.copy(files[0], clash)
+    os.makedirs(tmp_path / 'out')
+    export_tfrecord([files[0], clash], str(tmp_path / 'out'), num_shards=1)
+    examples = list(iter_examples(str(tmp_path / 'out' / 'data-00000-of-00001.tfrecord')))
+    stem = os.path.splitext(os.path.basename(files[0]))[0]
+    label = os.path.basename(os.path.dirname(files[0]))
+    assert [ex['sample_id'][0].decode('utf-8') for ex in examples] == [f'{label}/{stem}', f'B/{stem}']
+    assert example_to_sample(examples[0])[0] == label
+
+
+def test_labels_come_from_the_class_table_source(tmp_path):
+    # A sample whose JSON has no (or another) label is exported under its folder, like the class table
+    files = _copy_corpus(tmp_path / 'data')
+    for jf, label in ((files[0], None), (files[1], 'zz_other')):
+        with open(jf, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        data.pop('label', None)
+        if label:
+            data['label'] = label
+        with open(jf, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+    for fmt in ('shards', 'incremental'):
+        out = tmp_path / fmt
+        export_data(str(tmp_path / 'data'), str(out), fmt='shards', incremental=fmt == 'incremental')
+        for split in ('train', 'val', 'test'):
+            reader = ExportShardReader(str(out / split))
+            assert set(reader.lengths_and_labels()[1]) <= set(reader.classes)
+            assert 'unknown' not in reader.classes and 'zz_other' not in reader.classes
+
+
+def test_h5_label_ids_index_the_export_classes(tmp_path):
+    h5py = pytest.importorskip('h5py')
+    files = _copy_corpus(tmp_path / 'data')
+    export_data(str(tmp_path / 'data'), str(tmp_path / 'out'), fmt='h5')
+    classes = sorted({os.path.basename(os.path.dirname(jf)) for jf in files})
+    for split in ('train', 'val', 'test'):
+        path = str(tmp_path / 'out' / split / 'data.h5')
+        split_files = [jf for jf in files if hash_split(sample_key(jf)) == split]
+        with h5py.File(path, 'r') as h5:
+            assert json.loads(h5.attrs['classes']) == classes
+            assert 'label_names' not in h5
+            ids = h5['label_ids'][()].tolist()
+        assert [classes[i] for i in ids] == [os.path.basename(os.path.dirname(jf)) for jf in split_files]
+        assert H5SampleReader(path).lengths_and_labels()[1] == [classes[i] for i in ids]
+    with pytest.raises(ValueError, match='not in the class table'):
+        export_h5(files, str(tmp_path / 'bad.h5'), classes=classes[1:])
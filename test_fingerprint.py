@@ -0,0 +1,113 @@
+# test_fingerprint.py
+# Index backfill, LSH near-duplicate lookup and cached batch dedupe for Module 19. Run: python -m pytest -q
+
+import os
+import json
+import shutil
+import numpy as np
+
+import fingerprint
+from fingerprint import FingerprintIndex, backfill, dedupe_report, fingerprint_file, fingerprint_sample
+from data_exporter import export_data, load_fingerprint_cache
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+CORPUS = os.path.join(ROOT, 'handwriting_data')
+
+
+def _copy_corpus(dst):
+    for label in sorted(os.listdir(CORPUS)):
+        if os.path.isdir(os.path.join(CORPUS, label)):
+            shutil.copytree(os.path.join(CORPUS, label), os.path.join(dst, label))
+    return sorted(os.path.join(dst, label, f) for label in os.listdir(dst)
+                  for f in os.listdir(os.path.join(dst, label)) if f.endswith('.json'))
+
+
+def test_backfill_indexes_existing_corpus(tmp_path):
+    files = _copy_corpus(tmp_path / 'data')
+    index = FingerprintIndex(str(tmp_path / 'fp.sqlite'))
+    assert backfill(index, str(tmp_path / 'data')) == len(files)
+    assert len(index.sample_ids()) == len(files)
+    # An upload identical to a stored sample is now an exact duplicate of it
+    match = index.lookup(fingerprint_file(files[0]))
+    label, stem = os.path.basename(os.path.dirname(files[0])), os.path.splitext(os.path.basename(files[0]))[0]
+    assert match[:2] == ('exact', f'{label}/{stem}')
+    # Known samples are skipped
+    assert backfill(index, str(tmp_path / 'data')) == 0
+
+
+def test_dedupe_cache_skips_unchanged_files(tmp_path, monkeypatch):
+    files = _copy_corpus(tmp_path / 'data')
+    shutil.copy(files[0], os.path.join(os.path.dirname(files[0]), 'copy.json'))
+    out = str(tmp_path / 'out')
+    export_data(str(tmp_path / 'data'), out, fmt='shards', dedupe='exact')
+    with open(os.path.join(out, 'dedupe_report.json'), 'r', encoding='utf-8') as f:
+        first = json.load(f)
+    assert len(load_fingerprint_cache(out)) == len(files) + 1
+
+    read = []
+    real = fingerprint.fingerprint_file
+    monkeypatch.setattr(fingerprint, 'fingerprint_file', lambda p: read.append(p) or real(p))
+    export_data(str(tmp_path / 'data'), out, fmt='shards', dedupe='exact')
+    assert read == []
+    with open(os.path.join(out, 'dedupe_report.json'), 'r', encoding='utf-8') as f:
+        assert json.load(f) == first
+
+    # Changed and deleted files: only the changed one is read, the deleted one leaves the cache
+    with open(files[1], 'r', encoding='utf-8') as f:
+        changed = json.load(f)
+    changed['strokes'] = changed['strokes'][:1]
+    with open(files[1], 'w', encoding='utf-8') as f:
+        json.dump(changed, f)
+    os.remove(files[2])
+    export_data(str(tmp_path / 'data'), out, fmt='shards', dedupe='exact')
+    assert read == [files[1]]
+    assert os.path.abspath(files[2]) not in load_fingerprint_cache(out)
+
+
+def test_cached_report_matches_uncached(tmp_path):
+    files = _copy_corpus(tmp_path / 'data')
+    cache = {}
+    expected = dedupe_report(files, near=True)
+    assert dedupe_report(files, near=True, cache=cache) == expected
+    assert dedupe_report(files, near=True, cache=cache) == expected
+
+
+def _jittered(path, sd, seed=0):
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    rng = np.random.default_rng(seed)
+    for s in data['strokes']:
+        for p in s['points']:
+            p['x'] += float(rng.normal(0, sd))
+            p['y'] += float(rng.normal(0, sd))
+    return fingerprint_sample(data)
+
+
+def test_near_lookup_checks_few_candidates(tmp_path):
+    files = _copy_corpus(tmp_path / 'data')
+    index = FingerprintIndex(':memory:')
+    backfill(index, str(tmp_path / 'data'))
+    fp = _jittered(files[0], 0.05)
+    match = index.lookup(fp)
+    assert match[0] == 'near' and match[1].endswith(os.path.splitext(os.path.basename(files[0]))[0])
+    # Distinct corpus samples rarely share a band bucket
+    conn = index._conn()
+    largest = conn.execute('SELECT MAX(n) FROM (SELECT COUNT(*) AS n FROM fp_bands GROUP BY band_key)').fetchone()[0]
+    assert largest <= 4
+    capped = FingerprintIndex(':memory:', max_candidates=0)
+    backfill(capped, str(tmp_path / 'data'))
+    assert capped.lookup(fp) is None
+
+
+def test_band_keys_rebuilt_for_new_scheme(tmp_path):
+    files = _copy_corpus(tmp_path / 'data')
+    db = str(tmp_path / 'fp.sqlite')
+    index = FingerprintIndex(db)
+    backfill(index, str(tmp_path / 'data'))
+    conn = index._conn()
+    # An index written with other band parameters
+    conn.execute('UPDATE fp_bands SET band_key = band_key + 1')
+    conn.execute("UPDATE fp_meta SET value = 'old' WHERE key = 'band_scheme'")
+    reopened = FingerprintIndex(db)
+    assert reopened.lookup(_jittered(files[3], 0.05))[0] == 'near'
+    assert reopened._conn().execute('SELECT COUNT(*) FROM fp_bands').fetchone()[0] == len(files) * fingerprint.LSH_BANDS
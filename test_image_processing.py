@@ -0,0 +1,63 @@
+# test_image_processing.py
+# Batched standardization (Module 6) against the single-image path.
+# Run: python -m pytest -q
+
+import os
+import hashlib
+import numpy as np
+import pytest
+from PIL import Image
+
+from image_processing import process_image, process_batch, collect_pngs
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+CORPUS = os.path.join(ROOT, 'handwriting_data')
+
+
+def _digest(paths):
+    h = hashlib.sha1()
+    for p in paths:
+        with open(p, 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def _single(paths, tmp_path, **kwargs):
+    out = []
+    for i, p in enumerate(paths):
+        saved = process_image(p, save_path=str(tmp_path / f'{i}.png'), **kwargs)
+        out.append(np.asarray(Image.open(saved)))
+    return np.stack(out)
+
+
+@pytest.mark.parametrize('workers', [0, 2])
+@pytest.mark.parametrize('invert', [False, True])
+def test_batch_matches_process_image(tmp_path, workers, invert):
+    paths = collect_pngs(CORPUS)
+    before = _digest(paths)
+    images, order = process_batch(CORPUS, workers=workers, invert=invert)
+    assert order == paths
+    assert images.shape == (len(paths), 256, 256) and images.dtype == np.uint8
+    np.testing.assert_array_equal(images, _single(paths, tmp_path, invert=invert))
+    # Inputs are never rewritten
+    assert _digest(paths) == before
+
+
+def test_batch_writes_a_memmapped_npy(tmp_path):
+    paths = collect_pngs(os.path.join(CORPUS, 'A'))
+    out = str(tmp_path / 'sub' / 'images.npy')
+    images, _ = process_batch(paths, out_path=out, workers=0)
+    assert isinstance(images, np.memmap)
+    np.testing.assert_array_equal(np.load(out), process_batch(paths, workers=0)[0])
+
+
+def test_flatten_alpha_matches_process_image(tmp_path):
+    # Ink on a transparent background: convert('L') alone turns the background black
+    rgba = np.zeros((120, 200, 4), dtype=np.uint8)
+    rgba[40:80, 30:170] = (20, 20, 20, 255)
+    src = str(tmp_path / 'alpha.png')
+    Image.fromarray(rgba, 'RGBA').save(src)
+    flat = process_batch([src], workers=0, flatten_alpha=True)[0]
+    np.testing.assert_array_equal(flat, _single([src], tmp_path, flatten_alpha=True))
+    assert flat[0, 0, 0] == 255
+    np.testing.assert_array_equal(process_batch([src], workers=0)[0], _single([src], tmp_path))
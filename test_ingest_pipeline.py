@@ -0,0 +1,62 @@
+# test_ingest_pipeline.py
+# Per-job failure handling of the ingest pipeline (Module 16).
+# Run: python -m pytest -q
+
+import os
+import json
+import asyncio
+
+import ingest_pipeline
+from ingest_pipeline import IngestPipeline
+from metadata_tracker import get_store
+
+
+def _job(root, name, data=None):
+    path = os.path.join(root, 'data', 'A', name + '.json')
+    data = data if data is not None else {'label': 'A', 'strokes': []}
+    return {'kind': 'json', 'path': path, 'data': data, 'meta': {'sample_id': f'A/{name}', 'label': 'A'}}
+
+
+async def _run(pipeline, jobs):
+    await pipeline.start()
+    for job in jobs:
+        pipeline.submit(job)
+    await pipeline.drain()
+
+
+def test_bad_job_does_not_fail_batch(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest_pipeline, 'RETRY_DELAY', 0)
+    meta = str(tmp_path / 'meta.sqlite')
+    pipeline = IngestPipeline(meta, workers=1, dead_letter_root=str(tmp_path / 'failed'))
+    # A set is not JSON-serializable: this job fails on every attempt
+    jobs = [_job(tmp_path, 'ok1'), _job(tmp_path, 'bad', {'label': 'A', 'strokes': {1}}), _job(tmp_path, 'ok2')]
+    asyncio.run(_run(pipeline, jobs))
+    assert pipeline.stats['written'] == 2 and pipeline.stats['failed'] == 1
+    assert pipeline.stats['retried'] == pipeline.retries
+    assert os.path.exists(jobs[0]['path']) and os.path.exists(jobs[2]['path'])
+    assert not os.path.exists(jobs[1]['path'])
+    assert sorted(e['sample_id'] for e in get_store(meta).query()) == ['A/ok1', 'A/ok2']
+    with open(tmp_path / 'failed' / 'A' / 'bad.json.error.json', 'r', encoding='utf-8') as f:
+        record = json.load(f)
+    assert record['meta']['sample_id'] == 'A/bad' and 'TypeError' in record['error']
+
+
+def test_retry_resumes_failed_step(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest_pipeline, 'RETRY_DELAY', 0)
+    calls = []
+
+    class FlakyShards:
+        def append(self, data, sample_id=None):
+            calls.append(sample_id)
+            if len(calls) == 1:
+                raise OSError('disk busy')
+
+    meta = str(tmp_path / 'meta.sqlite')
+    pipeline = IngestPipeline(meta, shard_writer=FlakyShards(), workers=1)
+    job = _job(tmp_path, 'flaky')
+    asyncio.run(_run(pipeline, [job]))
+    assert pipeline.stats == {'queued': 1, 'written': 1, 'retried': 1, 'failed': 0, 'rejected': 0}
+    # File and metadata were not redone by the retry; only the shard append was
+    assert job['done'] == {'serialize', 'write', 'metadata', 'shard'}
+    assert calls == ['flaky', 'flaky']
+    assert get_store(meta).count() == 1
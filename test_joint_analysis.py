@@ -0,0 +1,63 @@
+# test_joint_analysis.py
+# Time units and turn angles of the join features (Module 11). Run: python -m pytest -q
+
+import os
+import json
+from glob import glob
+import numpy as np
+
+from joint_analysis import analyze_dataset, analyze_joins, label_stats, join_table, HIST_BINS
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+CORPUS = os.path.join(ROOT, 'handwriting_data')
+
+
+def test_corpus_time_gaps_use_the_histogram():
+    table = analyze_dataset(CORPUS, workers=0)
+    hist = label_stats(table)['time_gap_hist'].sum(axis=0)
+    assert hist.sum() == len(table['time_gap']) > 0
+    # Millisecond gaps spread over the bins instead of all clipping into the last one
+    assert hist[-1] < hist.sum() / 2
+    assert table['time_gap'].max() < HIST_BINS['time_gap'][-1]
+
+
+def test_seconds_sample_matches_milliseconds():
+    with open(os.path.join(CORPUS, '+', '20250712_155124.json'), 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    seconds = json.loads(json.dumps(data))
+    for s in seconds['strokes']:
+        for p in s['points']:
+            p['t'] /= 1000
+    expected = join_table(data)
+    assert len(expected['time_gap'])
+    for sample in (seconds, dict(seconds, time_unit='s')):
+        np.testing.assert_allclose(join_table(sample)['time_gap'], expected['time_gap'], rtol=1e-5)
+
+
+def _original_dir_diffs(data):
+    # The per-join loop analyze_joins replaced: raw |dir2 - dir1|, not wrapped
+    def angle(p0, p1):
+        return np.arctan2(p1['y'] - p0['y'], p1['x'] - p0['x'])
+    out = []
+    for s1, s2 in zip(data['strokes'], data['strokes'][1:]):
+        s1, s2 = s1['points'], s2['points']
+        if s1 and s2:
+            dir1 = angle(s1[-2], s1[-1]) if len(s1) > 1 else 0
+            dir2 = angle(s2[0], s2[1]) if len(s2) > 1 else 0
+            out.append(np.abs(dir2 - dir1))
+    return out
+
+
+def test_dir_diff_keeps_original_values():
+    wrapped = 0
+    for path in sorted(glob(os.path.join(CORPUS, '*', '*.json'))):
+        with open(path, 'r', encoding='utf-8') as f:
+            expected = _original_dir_diffs(json.load(f))
+        joins = analyze_joins(path)
+        np.testing.assert_allclose([j['dir_diff'] for j in joins], expected, rtol=1e-6, atol=1e-6)
+        turns = np.array([j['dir_turn'] for j in joins])
+        np.testing.assert_allclose(turns, np.minimum(expected, 2 * np.pi - np.array(expected)), atol=1e-6)
+        assert ((0 <= turns) & (turns <= np.pi + 1e-6)).all()
+        wrapped += int((np.array(expected) > np.pi).sum())
+    # The corpus has joins where the two differ
+    assert wrapped > 0
@@ -0,0 +1,83 @@
+# test_metadata_tracker.py
+# SQLite metadata store tests for Module 7. Run: python -m pytest -q
+
+import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from metadata_tracker import MetadataStore, get_store
+
+PER_WRITER = 100
+
+
+def _entry(i, label='A', **extra):
+    return {'sample_id': f'{label}/{i:05d}', 'label': label, 'timestamp': f'2025-07-04T15:{i // 60:02d}:{i % 60:02d}Z',
+            'device': 'tab-1', 'json_path': f'data/{label}/{i:05d}.json', 'stroke_count': i % 3 + 1,
+            'total_points': 10 * i, **extra}
+
+
+def _write_many(args):
+    db_path, writer = args
+    store = MetadataStore(db_path)
+    for i in range(PER_WRITER):
+        store.append(_entry(writer * PER_WRITER + i, label=f'w{writer}'))
+    return writer
+
+
+def test_insert_merges_json_and_png(tmp_path):
+    store = MetadataStore(str(tmp_path / 'meta.sqlite'))
+    store.append(_entry(1, near_duplicate_of='A/00000'))
+    # The PNG upload of the same sample fills in png_path without clearing the rest
+    store.append({'sample_id': 'A/00001', 'label': 'A', 'png_path': 'data/A/00001.png'})
+    assert store.count() == 1
+    entry = store.get('A/00001')
+    assert entry['png_path'] == 'data/A/00001.png' and entry['json_path'] == 'data/A/00001.json'
+    assert entry['total_points'] == 10 and entry['near_duplicate_of'] == 'A/00000'
+    assert store.get('A/missing') is None
+
+
+def test_query_filters_and_pages(tmp_path):
+    store = MetadataStore(str(tmp_path / 'meta.sqlite'))
+    for i in range(30):
+        store.append(_entry(i, label='A' if i % 2 else 'B'))
+    assert store.count(label='A') == 15
+    assert [e['sample_id'] for e in store.query(label='B', max_points=40)] == ['B/00000', 'B/00002', 'B/00004']
+    assert len(store.query(min_strokes=3)) == 10
+    assert len(store.query(since='2025-07-04T15:00:10Z', until='2025-07-04T15:00:20Z')) == 10
+    pages, after = [], None
+    while True:
+        page = store.query(limit=7, after_id=after)
+        if not page:
+            break
+        pages.append(page)
+        after = page[-1]['id']
+    assert [len(p) for p in pages] == [7, 7, 7, 7, 2]
+    assert [e['sample_id'] for p in pages for e in p] == [e['sample_id'] for e in store.query()]
+    assert store.existing_keys([('tab-1', '2025-07-04T15:00:05Z'), ('tab-2', '2025-07-04T15:00:05Z')]) == \
+        {('tab-1', '2025-07-04T15:00:05Z')}
+
+
+def test_import_legacy_metadata_json(tmp_path):
+    legacy = [_entry(i) for i in range(5)] + [{'sample_id': 'A/00002', 'png_path': 'data/A/00002.png'}]
+    with open(tmp_path / 'metadata.json', 'w', encoding='utf-8') as f:
+        json.dump(legacy, f)
+    store = MetadataStore(str(tmp_path / 'meta.sqlite'))
+    assert store.import_json(str(tmp_path / 'metadata.json')) == 6
+    assert store.count() == 5
+    assert store.get('A/00002')['png_path'] == 'data/A/00002.png'
+    assert store.get('A/00002')['stroke_count'] == 3
+
+
+def test_concurrent_writers(tmp_path):
+    db = str(tmp_path / 'meta.sqlite')
+    MetadataStore(db)
+    # Separate processes, as with several server workers
+    with ProcessPoolExecutor(max_workers=4, mp_context=multiprocessing.get_context('spawn')) as pool:
+        assert sorted(pool.map(_write_many, [(db, w) for w in range(4)])) == [0, 1, 2, 3]
+    # Threads sharing one store (per-thread connections)
+    store = get_store(db)
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        list(pool.map(lambda w: [store.append(_entry(w * PER_WRITER + i, label=f't{w}')) for i in range(PER_WRITER)],
+                      range(4)))
+    assert store.count() == 8 * PER_WRITER
+    assert all(store.count(label=f'{kind}{w}') == PER_WRITER for kind in 'wt' for w in range(4))
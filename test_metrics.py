@@ -0,0 +1,64 @@
+# test_metrics.py
+# Registry, Prometheus output and pool metric merging for Module 21. Run: python -m pytest -q
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import pytest
+
+import metrics
+from metrics import Registry, REGISTRY, STAGE_METRIC, pool_map, stage_timer, record_stage
+
+
+def _timed_job(i):
+    with stage_timer('test.job'):
+        return i * i
+
+
+@pytest.fixture
+def registry():
+    REGISTRY.reset()
+    yield REGISTRY
+    REGISTRY.reset()
+
+
+def test_prometheus_text():
+    reg = Registry()
+    reg.describe('requests_total', 'counter', 'Requests')
+    reg.inc('requests_total', route='/a')
+    reg.inc('requests_total', 2, route='/a')
+    reg.observe('latency', 0.003, route='/a')
+    text = reg.prometheus()
+    assert '# TYPE requests_total counter' in text
+    assert 'requests_total{route="/a"} 3' in text
+    assert 'latency_bucket{route="/a",le="0.0025"} 0' in text
+    assert 'latency_bucket{route="/a",le="0.005"} 1' in text
+    assert 'latency_count{route="/a"} 1' in text
+
+
+def test_merge_adds_counters_and_histograms():
+    a, b = Registry(), Registry()
+    for reg in (a, b):
+        reg.inc('n', 2)
+        reg.observe('h', 0.5)
+    a.merge(b.snapshot())
+    assert a.get('n') == 4
+    assert a.get('h')[2] == 2 and a.get('h')[1] == 1.0
+
+
+@pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(), reason='no fork start method')
+def test_fork_pool_does_not_duplicate_parent_metrics(registry):
+    for _ in range(10):
+        record_stage('test.parent', 0.001)
+    ctx = multiprocessing.get_context('fork')
+    with ProcessPoolExecutor(max_workers=4, mp_context=ctx) as pool:
+        assert list(pool_map(pool, _timed_job, range(8))) == [i * i for i in range(8)]
+    assert registry.get(STAGE_METRIC, stage='test.parent')[2] == 10
+    assert registry.get(STAGE_METRIC, stage='test.job')[2] == 8
+
+
+def test_spawn_pool_collects_worker_metrics(registry):
+    ctx = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=2, mp_context=ctx) as pool:
+        list(pool_map(pool, _timed_job, range(4)))
+    assert registry.get(STAGE_METRIC, stage='test.job')[2] == 4
+    assert metrics.stage_summary()['test.job']['count'] == 4
@@ -0,0 +1,82 @@
+# test_numpy_rasterizer.py
+# Batched NumPy rasterizer (Module 20): determinism, batch independence and bounds.
+# Run: python -m pytest -q
+
+import os
+import json
+from glob import glob
+import numpy as np
+import pytest
+
+from numpy_rasterizer import rasterize_batch, strokes_from_sample
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+CORPUS = os.path.join(ROOT, 'handwriting_data')
+
+
+def _corpus():
+    samples = []
+    for path in sorted(glob(os.path.join(CORPUS, '*', '*.json'))):
+        with open(path, 'r', encoding='utf-8') as f:
+            samples.append(strokes_from_sample(json.load(f)))
+    return samples
+
+
+SAMPLES = _corpus()
+
+
+@pytest.mark.parametrize('size', [28, 64])
+def test_plain_batch_is_deterministic_and_per_sample(size):
+    out = rasterize_batch(SAMPLES, size=size)
+    assert out.shape == (len(SAMPLES), size, size) and out.dtype == np.uint8
+    np.testing.assert_array_equal(out, rasterize_batch(SAMPLES, size=size))
+    # A sample renders the same alone as inside a batch
+    for i in (0, len(SAMPLES) // 2, len(SAMPLES) - 1):
+        np.testing.assert_array_equal(out[i], rasterize_batch([SAMPLES[i]], size=size)[0])
+    np.testing.assert_array_equal(rasterize_batch(SAMPLES, size=size, invert=True), 255 - out)
+
+
+@pytest.mark.parametrize('width', [1.5, 4.0])
+def test_plain_ink_stays_in_the_padded_box(width):
+    size, padding = 64, 0.1
+    out = rasterize_batch(SAMPLES, size=size, width=width, padding=padding)
+    ink = out < 255
+    assert ink.any(axis=(1, 2)).all()
+    # Points are fitted into [padding, 1 - padding] of the canvas; discs reach r + 1 px past them
+    margin = int(np.floor(padding * size - width / 2 - 1))
+    assert margin > 0
+    assert not ink[:, :margin].any() and not ink[:, -margin:].any()
+    assert not ink[:, :, :margin].any() and not ink[:, :, -margin:].any()
+    # The longer side of each sample spans the padded box
+    rows, cols = ink.any(axis=2), ink.any(axis=1)
+    span = np.maximum(rows.sum(axis=1), cols.sum(axis=1))
+    assert (span >= size * (1 - 2 * padding) - 1).all()
+
+
+def test_line_geometry():
+    size, width = 64, 4.0
+    line = [np.array([[0.0, 0.0, np.nan], [10.0, 0.0, np.nan]])]
+    dot = [np.array([[5.0, 5.0, 0.5]])]
+    img, dot_img, empty = rasterize_batch([line, dot, []], size=size, width=width)
+    # Horizontal line through the middle row, as thick as the line width
+    solid = img < 128
+    assert solid.any(axis=1).sum() == width
+    assert solid[size // 2 - 1:size // 2 + 1].all(axis=0)[int(0.1 * size) + 1:-int(0.1 * size) - 1].all()
+    # A single point is a dot; a sample without strokes is blank
+    assert 0 < (dot_img < 255).sum() < width ** 2 * 4
+    assert (empty == 255).all()
+
+
+def test_augmentation_is_seeded():
+    batch = [SAMPLES[0]] * 4
+    a = rasterize_batch(batch, augment_params={}, rng=np.random.default_rng(1))
+    b = rasterize_batch(batch, augment_params={}, rng=np.random.default_rng(1))
+    c = rasterize_batch(batch, augment_params={}, rng=np.random.default_rng(2))
+    np.testing.assert_array_equal(a, b)
+    assert not np.array_equal(a, c)
+    # Copies of one sample get different transforms
+    assert len({x.tobytes() for x in a}) == 4
+    # All-zero parameters leave the plain render unchanged
+    zero = {k: 0.0 for k in ('rotate', 'scale', 'slant', 'translate', 'jitter', 'pressure')}
+    np.testing.assert_array_equal(rasterize_batch(batch, augment_params=zero, rng=np.random.default_rng(1)),
+                                  rasterize_batch(batch))
@@ -0,0 +1,79 @@
+# test_replicator_training.py
+# Class-id consistency across exported splits for Module 12.
+# Skipped when torch is not installed. Run: python -m pytest -q
+
+import os
+import json
+import shutil
+import pytest
+
+pytest.importorskip('torch')
+
+from data_exporter import export_data, ExportShardReader
+from replicator_training import StrokeDataset, make_loader
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+CORPUS = os.path.join(ROOT, 'handwriting_data')
+SPLITS = ('train', 'val', 'test')
+
+
+def _copy_corpus(dst):
+    for label in sorted(os.listdir(CORPUS)):
+        if os.path.isdir(os.path.join(CORPUS, label)):
+            shutil.copytree(os.path.join(CORPUS, label), os.path.join(dst, label))
+
+
+def _check_same_mapping(datasets, names):
+    labels = sorted(d for d in os.listdir(CORPUS) if os.path.isdir(os.path.join(CORPUS, d)))
+    for ds, split_names in zip(datasets, names):
+        assert ds.classes == labels
+        assert [ds.classes[t] for t in ds.targets] == split_names
+
+
+def test_shard_splits_share_class_ids(tmp_path):
+    _copy_corpus(tmp_path / 'data')
+    out = tmp_path / 'out'
+    export_data(str(tmp_path / 'data'), str(out), fmt='shards', shard_size=4)
+    datasets = [StrokeDataset(str(out / split)) for split in SPLITS]
+    names = [ExportShardReader(str(out / split)).lengths_and_labels()[1] for split in SPLITS]
+    # The corpus is small enough that some splits miss labels; ids must still agree
+    assert len({tuple(sorted(set(n))) for n in names}) > 1
+    _check_same_mapping(datasets, names)
+    assert make_loader(str(out / 'test')).dataset.classes == datasets[0].classes
+
+
+def test_h5_splits_share_class_ids(tmp_path):
+    pytest.importorskip('h5py')
+    _copy_corpus(tmp_path / 'data')
+    out = tmp_path / 'out'
+    export_data(str(tmp_path / 'data'), str(out), fmt='h5')
+    datasets = [StrokeDataset(str(out / split / 'data.h5')) for split in SPLITS]
+    readers = [ds._get_reader() for ds in datasets]
+    _check_same_mapping(datasets, [[r[i][0] for i in range(len(r))] for r in readers])
+
+
+def test_incremental_export_updates_every_split(tmp_path):
+    _copy_corpus(tmp_path / 'data')
+    out = tmp_path / 'out'
+    export_data(str(tmp_path / 'data'), str(out), fmt='shards', incremental=True)
+    # A new label lands in one split only; every split's table must pick it up
+    os.makedirs(tmp_path / 'data' / 'zz_new')
+    src = os.path.join(tmp_path, 'data', 'A', sorted(os.listdir(tmp_path / 'data' / 'A'))[0])
+    with open(src, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    data['label'] = 'zz_new'
+    with open(tmp_path / 'data' / 'zz_new' / 'sample.json', 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    export_data(str(tmp_path / 'data'), str(out), fmt='shards', incremental=True)
+    tables = {tuple(ExportShardReader(str(out / split)).classes) for split in SPLITS}
+    assert len(tables) == 1 and tables.pop()[-1] == 'zz_new'
+
+
+def test_labels_outside_the_class_table_fail_at_construction(tmp_path):
+    _copy_corpus(tmp_path / 'data')
+    out = tmp_path / 'out'
+    export_data(str(tmp_path / 'data'), str(out), fmt='shards')
+    split = next(s for s in SPLITS if len(set(ExportShardReader(str(out / s)).lengths_and_labels()[1])) > 1)
+    labels = sorted(set(ExportShardReader(str(out / split)).lengths_and_labels()[1]))
+    with pytest.raises(ValueError, match='not in the class table'):
+        StrokeDataset(str(out / split), classes=labels[:1])
@@ -0,0 +1,126 @@
+# test_stroke_codec.py
+# HWS1 codec tests for Module 17 against a fixture written by stroke_recorder.js
+# (regenerate with: node fixtures/make_hws1_fixture.mjs). Run: python -m pytest -q
+
+import os
+import json
+import struct
+import numpy as np
+import pytest
+
+from shard_store import COLUMNS
+from stroke_codec import (encode_sample, decode_sample, to_json_sample, count_points, _encode_column,
+                          PayloadError, SCALES, ENC_F32, ENC_DELTA16, ENC_NULL, POINT_KEYS)
+from stroke_processing import derive_motion, normalize_time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+FIXTURE = os.path.join(ROOT, 'fixtures', 'hws1_A_20250704_222004')
+
+
+def _load_fixture():
+    with open(FIXTURE + '.json', 'r', encoding='utf-8') as f:
+        sample = json.load(f)
+    with open(FIXTURE + '.hws', 'rb') as f:
+        return sample, f.read()
+
+
+def _column(points, key):
+    return np.array([np.nan if p[key] is None else p[key] for p in points], dtype=np.float64)
+
+
+def test_encoder_matches_js_bytes():
+    sample, payload = _load_fixture()
+    assert encode_sample(sample) == payload
+
+
+def test_decode_js_payload():
+    sample, payload = _load_fixture()
+    decoded = decode_sample(payload)
+    assert decoded['label'] == sample['label'] and decoded['time_unit'] == 'ms'
+    assert count_points(decoded) == sum(len(s['points']) for s in sample['strokes'])
+    for s, d in zip(sample['strokes'], decoded['strokes']):
+        assert d['pointerType'] == s['points'][0]['pointerType']
+        for k, name in enumerate(COLUMNS):
+            expected = _column(s['points'], name)
+            np.testing.assert_array_equal(np.isnan(d['columns'][k]), np.isnan(expected))
+            # Quantized to half a step (float32 columns are within float32 precision)
+            tol = max(SCALES[name] / 2, 1e-6 * np.nanmax(np.abs(expected), initial=0)) + 1e-9
+            assert np.nanmax(np.abs(d['columns'][k] - expected), initial=0) <= tol, name
+
+
+def test_derived_fields_match_recorder():
+    sample, payload = _load_fixture()
+    # Same inputs: derive_motion reproduces derivePoint
+    for s in sample['strokes']:
+        pts = s['points']
+        for got, key in zip(derive_motion(_column(pts, 'x'), _column(pts, 'y'), _column(pts, 't')),
+                            ('dx', 'dy', 'velocity', 'curvature')):
+            np.testing.assert_allclose(got, _column(pts, key), rtol=1e-12, atol=1e-12, err_msg=key)
+    # Decoded upload: recomputed from the quantized x, y, t in the recorder's point layout
+    stored = to_json_sample(decode_sample(payload))
+    assert stored['time_unit'] == 'ms'
+    for s, d in zip(sample['strokes'], stored['strokes']):
+        assert [list(p) for p in d['points']] == [list(POINT_KEYS)] * len(d['points'])
+        assert [p['pen_down'] for p in d['points']] == [p['pen_down'] for p in s['points']]
+        for key in ('dx', 'dy', 'velocity', 'curvature'):
+            got, expected = _column(d['points'], key), _column(s['points'], key)
+            np.testing.assert_array_equal(np.isnan(got), np.isnan(expected))
+        np.testing.assert_allclose(_column(d['points'], 'dx'), _column(s['points'], 'dx'), atol=SCALES['x'])
+
+
+def test_rounds_halves_up_like_js():
+    # Math.round(0.5) == 1 and Math.round(2.5) == 3; np.rint would give 0 and 2
+    enc = _encode_column(np.array([0.0, 0.5, 1.5, 2.5]), 1)
+    assert enc[0] == ENC_DELTA16
+    assert np.frombuffer(enc[13:], dtype='<i2').tolist() == [1, 1, 1]
+
+
+def test_seconds_payload_is_converted(monkeypatch):
+    sample, _ = _load_fixture()
+    # Encoded like recorders before time_unit: performance.now() seconds, 1e-5 s steps
+    monkeypatch.setitem(SCALES, 't', 1e-5)
+    old = json.loads(json.dumps(sample))
+    del old['time_unit']
+    for s in old['strokes']:
+        for p in s['points']:
+            p['t'] /= 1000
+    decoded = decode_sample(encode_sample(old))
+    t = COLUMNS.index('t')
+    for s, d in zip(sample['strokes'], decoded['strokes']):
+        np.testing.assert_allclose(d['columns'][t], _column(s['points'], 't'), atol=1e-3)
+    assert normalize_time(old)['strokes'][0]['points'][0]['t'] == pytest.approx(sample['strokes'][0]['points'][0]['t'])
+    # The stored corpus is already in ms
+    ms = json.loads(json.dumps(sample))
+    del ms['time_unit']
+    assert normalize_time(ms)['strokes'] == sample['strokes']
+
+
+def test_malformed_payloads():
+    _, payload = _load_fixture()
+    with pytest.raises(PayloadError):
+        decode_sample(b'XXXX' + payload[4:])
+    with pytest.raises(PayloadError):
+        decode_sample(payload[:-3])
+    with pytest.raises(PayloadError):
+        decode_sample(payload + b'\x00')
+    meta = json.dumps({'label': 'A', 'time_unit': 'minutes'}).encode('utf-8')
+    with pytest.raises(PayloadError):
+        decode_sample(b'HWS1' + struct.pack('<BBHI', 1, 0, 0, len(meta)) + meta)
+
+
+def _stroke_payload(n, encs, body=b''):
+    meta = b'{}'
+    return (b'HWS1' + struct.pack('<BBHI', 1, 0, 1, len(meta)) + meta
+            + struct.pack('<IB', n, 0) + bytes(encs) + body)
+
+
+def test_point_count_is_bounded_before_allocating():
+    # Null columns take no bytes, so only the point limit stops this one
+    with pytest.raises(PayloadError, match='Too many points'):
+        decode_sample(_stroke_payload(50_000_000, [ENC_NULL] * len(COLUMNS)))
+    assert count_points(decode_sample(_stroke_payload(1000, [ENC_NULL] * len(COLUMNS)))) == 1000
+    with pytest.raises(PayloadError, match='Too many points'):
+        decode_sample(_stroke_payload(1000, [ENC_NULL] * len(COLUMNS)), max_points=999)
+    # A point count the column bytes cannot hold
+    with pytest.raises(PayloadError, match='Truncated'):
+        decode_sample(_stroke_payload(100_000, [ENC_F32] + [ENC_NULL] * (len(COLUMNS) - 1), b'\x00' * 16))
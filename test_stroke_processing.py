@@ -0,0 +1,102 @@
+# test_stroke_processing.py
+# Arc-length resampling and RDP simplification error bounds (Module 18), on the corpus strokes.
+# Run: python -m pytest -q
+
+import os
+import json
+from glob import glob
+import numpy as np
+import pytest
+
+from stroke_processing import resample_arc_length, simplify, rdp_mask, process_stroke
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+CORPUS = os.path.join(ROOT, 'handwriting_data')
+
+
+def _strokes():
+    """Every corpus stroke with at least two points, as (N, 4) x, y, t, p arrays."""
+    out = []
+    for path in sorted(glob(os.path.join(CORPUS, '*', '*.json'))):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        for s in data['strokes']:
+            pts = s['points']
+            if len(pts) >= 2:
+                out.append(np.array([[p['x'], p['y'], p.get('t') or 0.0, p.get('p', np.nan)] for p in pts],
+                                    dtype=np.float64))
+    return out
+
+
+STROKES = _strokes()
+
+
+def _distance_to_polyline(pts, poly):
+    """Distance from each point to the nearest segment of poly (brute force)."""
+    a, b = poly[:-1, None, :2], poly[1:, None, :2]
+    ab = b - a
+    denom = np.maximum((ab ** 2).sum(-1), 1e-12)
+    u = np.clip(((pts[None, :, :2] - a) * ab).sum(-1) / denom, 0, 1)
+    d = np.hypot(*(pts[None, :, :2] - (a + u[..., None] * ab)).transpose(2, 0, 1))
+    return d.min(axis=0)
+
+
+@pytest.mark.parametrize('spacing', [2.0, 5.0, 20.0])
+def test_resample_spacing_and_bound(spacing):
+    for arr in STROKES:
+        out = resample_arc_length(arr, spacing)
+        steps = np.hypot(*np.diff(out[:, :2], axis=0).T)
+        if not len(steps):
+            continue
+        np.testing.assert_allclose(out[[0, -1], :2], arr[[0, -1], :2], atol=1e-9)
+        assert steps.max() <= spacing + 1e-9
+        # New points lie on the original polyline, which stays within spacing / 2 of the new one
+        assert _distance_to_polyline(out, arr).max() < 1e-6
+        assert _distance_to_polyline(arr, out).max() <= spacing / 2 + 1e-9
+        # Other columns are interpolated: time never runs backwards
+        assert (np.diff(out[:, 2]) >= -1e-9).all()
+
+
+def test_resample_null_columns():
+    arr = np.array([[0, 0, 0, np.nan], [10, 0, 10, 0.5], [20, 0, 20, np.nan]], dtype=np.float64)
+    arr = np.column_stack([arr, np.full(3, np.nan)])
+    out = resample_arc_length(arr, 5.0)
+    assert len(out) == 5
+    np.testing.assert_allclose(out[:, 2], [0, 5, 10, 15, 20])
+    np.testing.assert_allclose(out[:, 3], 0.5)
+    assert np.isnan(out[:, 4]).all()
+    # Repeated and single points
+    assert len(resample_arc_length(arr[[0, 0]], 5.0)) == 1
+    assert len(resample_arc_length(arr[:1], 5.0)) == 1
+
+
+@pytest.mark.parametrize('tolerance', [0.5, 2.0, 8.0])
+def test_rdp_respects_tolerance(tolerance):
+    for arr in STROKES:
+        mask = rdp_mask(arr[:, :2], tolerance)
+        out = simplify(arr, tolerance)
+        assert mask[0] and mask[-1]
+        np.testing.assert_array_equal(out, arr[mask] if len(arr) >= 3 else arr)
+        # Every dropped point is within tolerance of the kept polyline
+        assert _distance_to_polyline(arr, out).max() <= tolerance + 1e-9
+
+
+def test_rdp_keeps_fewer_points_as_tolerance_grows():
+    total = [sum(len(simplify(a, t)) for a in STROKES) for t in (0.0, 0.5, 2.0, 8.0)]
+    assert total == sorted(total, reverse=True) and total[-1] < total[0]
+    line = np.column_stack([np.linspace(0, 100, 50), np.linspace(0, 50, 50)])
+    assert len(simplify(line, 1e-6)) == 2
+
+
+def test_rdp_keeps_corners_above_tolerance():
+    n = 2001
+    zigzag = np.column_stack([np.arange(n, dtype=np.float64), np.tile([0.0, 1.0], n // 2 + 1)[:n]])
+    assert rdp_mask(zigzag, 0.5).all()
+
+
+def test_process_stroke_combined_bound():
+    assert all(process_stroke(a) is a for a in STROKES)
+    spacing, tolerance = 5.0, 2.0
+    for arr in STROKES:
+        out = process_stroke(arr, spacing, tolerance)
+        assert _distance_to_polyline(arr, out).max() <= spacing / 2 + tolerance + 1e-9
@@ -0,0 +1,101 @@
+# test_tfrecord_io.py
+# Framing, CRC32C and tf.train.Example round-trip tests for Module 15.
+# Run: python -m pytest -q
+
+import struct
+import numpy as np
+import pytest
+
+import tfrecord_io
+from tfrecord_io import (TFRecordWriter, ShardedTFRecordWriter, crc32c, masked_crc, encode_example,
+                         decode_example, read_records, iter_examples)
+
+
+def test_crc32c_check_value(monkeypatch):
+    # Standard CRC-32C check value; also exercise the pure-Python table when crc32c is installed
+    assert crc32c(b'123456789') == 0xE3069283
+    monkeypatch.setattr(tfrecord_io, '_crc32c_native', None)
+    assert crc32c(b'123456789') == 0xE3069283
+    assert crc32c(b'') == 0
+
+
+def test_crc32c_rfc3720_vectors():
+    assert crc32c(bytes(32)) == 0x8A9136AA
+    assert crc32c(b'\xff' * 32) == 0x62A8AB43
+    assert crc32c(bytes(range(32))) == 0x46DD794E
+
+
+def test_example_round_trip():
+    values = np.arange(12, dtype=np.float32).reshape(4, 3) / 7
+    ex = decode_example(encode_example({
+        'label': 'A',
+        'sample_id': b'A/20250704_222004',
+        'values': values,
+        'num_fields': 3,
+        'stroke_lengths': np.array([1, 3], dtype=np.int64),
+        'negative': [-1, -(2 ** 40)],
+        'score': 0.5,
+    }))
+    assert ex['label'] == [b'A']
+    assert ex['sample_id'] == [b'A/20250704_222004']
+    np.testing.assert_array_equal(ex['values'], values.ravel())
+    assert ex['num_fields'].tolist() == [3]
+    assert ex['stroke_lengths'].tolist() == [1, 3]
+    assert ex['negative'].tolist() == [-1, -(2 ** 40)]
+    np.testing.assert_array_equal(ex['score'], [0.5])
+
+
+def _write(path, records):
+    with TFRecordWriter(str(path)) as w:
+        for r in records:
+            w.write(r)
+
+
+def test_records_round_trip(tmp_path):
+    records = [b'', b'x', bytes(range(256)) * 40]
+    _write(tmp_path / 'r.tfrecord', records)
+    assert list(read_records(str(tmp_path / 'r.tfrecord'))) == records
+    # uint64 length | uint32 crc | data | uint32 crc
+    assert (tmp_path / 'r.tfrecord').stat().st_size == sum(16 + len(r) for r in records)
+
+
+def test_bad_data_crc(tmp_path):
+    path = tmp_path / 'r.tfrecord'
+    _write(path, [b'first record', b'second record'])
+    raw = bytearray(path.read_bytes())
+    raw[12] ^= 0x01  # first byte of the first record's data
+    path.write_bytes(bytes(raw))
+    with pytest.raises(IOError, match='CRC mismatch'):
+        list(read_records(str(path)))
+    assert list(read_records(str(path), verify=False))[1] == b'second record'
+
+
+def test_bad_length_crc(tmp_path):
+    path = tmp_path / 'r.tfrecord'
+    _write(path, [b'record'])
+    raw = bytearray(path.read_bytes())
+    raw[0:8] = struct.pack('<Q', 1 << 40)  # corrupt length must not be trusted
+    path.write_bytes(bytes(raw))
+    with pytest.raises(IOError, match='record length'):
+        list(read_records(str(path)))
+
+
+@pytest.mark.parametrize('cut', [3, 10, 14, 20])
+def test_truncated_file(tmp_path, cut):
+    path = tmp_path / 'r.tfrecord'
+    _write(path, [b'complete', b'cut short by a crash'])
+    raw = path.read_bytes()
+    path.write_bytes(raw[:24 + cut])  # first record is 8 + 4 + 8 + 4 bytes
+    records = read_records(str(path))
+    assert next(records) == b'complete'
+    with pytest.raises(IOError, match='Truncated'):
+        next(records)
+
+
+def test_sharded_writer(tmp_path):
+    with ShardedTFRecordWriter(str(tmp_path / 'data'), num_shards=3) as w:
+        for i in range(7):
+            w.write(encode_example({'i': i}))
+    assert w.count == 7
+    assert [len(list(read_records(p))) for p in w.paths] == [3, 2, 2]
+    assert sorted(int(ex['i'][0]) for ex in iter_examples(w.paths)) == list(range(7))
@@ -0,0 +1,250 @@
+# tfrecord_io.py
+# MODULE 15: TFRecord Writer / Reader (no TensorFlow dependency)
+# Writes length-prefixed, CRC32C-checked records holding tf.train.Example protos.
+#
+# Record framing (same as TensorFlow):
+#   uint64 length | uint32 masked_crc32c(length) | data | uint32 masked_crc32c(data)
+# Example proto (subset used here):
+#   Example{1: Features{1: map<string, Feature>}}
+#   Feature{1: BytesList{1: bytes*}, 2: FloatList{1: packed float}, 3: Int64List{1: packed int64}}
+
+import struct
+import numpy as np
+
+try:
+    from crc32c import crc32c as _crc32c_native  # optional C implementation
+except ImportError:
+    _crc32c_native = None
+
+# ---------- CRC32C ----------
+
+def _make_table():
+    poly = 0x82F63B78
+    table = []
+    for i in range(256):
+        crc = i
+        for _ in range(8):
+            crc = (crc >> 1) ^ poly if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+_CRC_TABLE = _make_table()
+
+
+def crc32c(data):
+    if _crc32c_native is not None:
+        return _crc32c_native(data)
+    crc = 0xFFFFFFFF
+    table = _CRC_TABLE
+    for b in data:
+        crc = table[(crc ^ b) & 0xFF] ^ (crc >> 8)
+    return crc ^ 0xFFFFFFFF
+
+
+def masked_crc(data):
+    crc = crc32c(data)
+    return (((crc >> 15) | (crc << 17)) + 0xA282EAD8) & 0xFFFFFFFF
+
+# ---------- Protobuf Encoding ----------
+
+def _varint(n):
+    n &= 0xFFFFFFFFFFFFFFFF  # negative int64 -> two's complement, 10 bytes
+    out = bytearray()
+    while n > 0x7F:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+    return bytes(out)
+
+
+def _field(num, payload):
+    """Length-delimited field (wire type 2)."""
+    return _varint((num << 3) | 2) + _varint(len(payload)) + payload
+
+
+def _feature(value):
+    if isinstance(value, (bytes, str)):
+        value = [value]
+    if isinstance(value, np.ndarray) and value.dtype.kind == 'f':
+        packed = np.ascontiguousarray(value, dtype='<f4').tobytes()
+        return _field(2, _field(1, packed))
+    if isinstance(value, np.ndarray) and value.dtype.kind in 'iub':
+        value = value.tolist()
+    if isinstance(value, (int, np.integer)):
+        value = [int(value)]
+    if isinstance(value, float):
+        return _field(2, _field(1, struct.pack('<f', value)))
+    if value and isinstance(value[0], (bytes, str)):
+        items = b''.join(_field(1, v.encode('utf-8') if isinstance(v, str) else v) for v in value)
+        return _field(1, items)
+    if value and isinstance(value[0], float):
+        return _field(2, _field(1, struct.pack(f'<{len(value)}f', *value)))
+    return _field(3, _field(1, b''.join(_varint(int(v)) for v in value)))
+
+
+def encode_example(features):
+    """
+    Serialize a dict of features into tf.train.Example bytes.
+    Values: str/bytes (or lists of them), ints, floats, or NumPy arrays
+    (floating -> FloatList, integer -> Int64List). Arrays are flattened.
+    """
+    entries = []
+    for name, value in features.items():
+        if isinstance(value, np.ndarray):
+            value = value.ravel()
+        entry = _field(1, name.encode('utf-8')) + _field(2, _feature(value))
+        entries.append(_field(1, entry))
+    return _field(1, b''.join(entries))
+
+# ---------- Protobuf Decoding ----------
+
+def _read_varint(buf, pos):
+    result, shift = 0, 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        result |= (b & 0x7F) << shift
+        if not b & 0x80:
+            return result, pos
+        shift += 7
+
+
+def _iter_fields(buf):
+    pos, end = 0, len(buf)
+    while pos < end:
+        key, pos = _read_varint(buf, pos)
+        num, wire = key >> 3, key & 7
+        if wire == 2:
+            n, pos = _read_varint(buf, pos)
+            yield num, wire, buf[pos:pos + n]
+            pos += n
+        elif wire == 0:
+            v, pos = _read_varint(buf, pos)
+            yield num, wire, v
+        elif wire == 5:
+            yield num, wire, buf[pos:pos + 4]
+            pos += 4
+        elif wire == 1:
+            yield num, wire, buf[pos:pos + 8]
+            pos += 8
+        else:
+            raise ValueError(f'Unsupported wire type {wire}')
+
+
+def _decode_feature(buf):
+    for kind, _, payload in _iter_fields(buf):
+        if kind == 1:
+            return [bytes(v) for _, _, v in _iter_fields(payload)]
+        if kind == 2:
+            chunks = [bytes(v) for _, _, v in _iter_fields(payload)]
+            return np.frombuffer(b''.join(chunks), dtype='<f4')
+        if kind == 3:
+            values = []
+            for _, wire, v in _iter_fields(payload):
+                if wire == 0:
+                    values.append(v)
+                    continue
+                pos = 0
+                while pos < len(v):
+                    n, pos = _read_varint(v, pos)
+                    values.append(n)
+            arr = np.array(values, dtype=np.uint64)
+            return arr.view(np.int64)
+    return []
+
+
+def decode_example(data):
+    """Parse tf.train.Example bytes into {name: list of bytes | float32 array | int64 array}."""
+    data = memoryview(data)
+    features = {}
+    for _, _, feats in _iter_fields(data):
+        for _, _, entry in _iter_fields(feats):
+            name, value = None, b''
+            for num, _, payload in _iter_fields(entry):
+                if num == 1:
+                    name = bytes(payload).decode('utf-8')
+                elif num == 2:
+                    value = payload
+            features[name] = _decode_feature(value)
+    return features
+
+# ---------- Record Files ----------
+
+class TFRecordWriter:
+    def __init__(self, path):
+        self._f = open(path, 'wb')
+
+    def write(self, record):
+        header = struct.pack('<Q', len(record))
+        self._f.write(header)
+        self._f.write(struct.pack('<I', masked_crc(header)))
+        self._f.write(record)
+        self._f.write(struct.pack('<I', masked_crc(record)))
+
+    def close(self):
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ShardedTFRecordWriter:
+    """
+    Round-robin records over num_shards files named <prefix>-00000-of-0000N.tfrecord.
+    """
+
+    def __init__(self, prefix, num_shards=1):
+        self.paths = [f'{prefix}-{i:05d}-of-{num_shards:05d}.tfrecord' for i in range(num_shards)]
+        self._writers = [TFRecordWriter(p) for p in self.paths]
+        self._next = 0
+        self.count = 0
+
+    def write(self, record):
+        self._writers[self._next].write(record)
+        self._next = (self._next + 1) % len(self._writers)
+        self.count += 1
+
+    def close(self):
+        for w in self._writers:
+            w.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_records(path, verify=True):
+    """Stream raw record bytes from a TFRecord file, checking CRCs when verify is set."""
+    with open(path, 'rb') as f:
+        while True:
+            header = f.read(8)
+            if not header:
+                return
+            len_crc = f.read(4)
+            if len(header) < 8 or len(len_crc) < 4:
+                raise IOError(f'Truncated record header in {path}')
+            # Check the length before trusting it, so a corrupt header never triggers a huge read
+            if verify and masked_crc(header) != struct.unpack('<I', len_crc)[0]:
+                raise IOError(f'CRC mismatch in record length in {path}')
+            (length,) = struct.unpack('<Q', header)
+            data = f.read(length)
+            data_crc = f.read(4)
+            if len(data) < length or len(data_crc) < 4:
+                raise IOError(f'Truncated record in {path}')
+            if verify and masked_crc(data) != struct.unpack('<I', data_crc)[0]:
+                raise IOError(f'CRC mismatch in {path}')
+            yield data
+
+
+def iter_examples(paths, verify=True):
+    """Stream decoded examples from one or more TFRecord files."""
+    if isinstance(paths, str):
+        paths = [paths]
+    for path in paths:
+        for record in read_records(path, verify=verify):
+            yield decode_example(record)